@@ -1,7 +1,8 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import chat, auth, documents
+from app.api.v1.endpoints import chat, auth, documents, admin
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 api_router.include_router(chat.router, prefix="/chat", tags=["Chat"])
-api_router.include_router(documents.router, prefix="/documents", tags=["Documents"])
\ No newline at end of file
+api_router.include_router(documents.router, prefix="/documents", tags=["Documents"])
+api_router.include_router(admin.router, prefix="/admin", tags=["Admin"])
\ No newline at end of file
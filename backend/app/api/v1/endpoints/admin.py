@@ -0,0 +1,37 @@
+# app/api/v1/endpoints/admin.py
+import logging
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from app.core.config import settings
+from app.services.rag_service import rag_service
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+def verify_admin_token(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Admin API is disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+@router.post("/reload-index", dependencies=[Depends(verify_admin_token)])
+async def reload_index():
+    """
+    Nạp lại kho chunk, Vector Store và BM25 Index sau khi build lại corpus, không cần restart server.
+    Các request đang chạy vẫn dùng index cũ cho đến khi hoàn tất.
+    """
+    try:
+        return await rag_service.areload_indexes()
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception:
+        logger.exception("Index reload failed")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Index reload failed")
+
+@router.get("/stats", dependencies=[Depends(verify_admin_token)])
+async def rag_stats():
+    """Thống kê cache, micro-batching và tỉ lệ trúng của retrieval chạy trước."""
+    return rag_service.stats()
@@ -7,15 +7,57 @@ from app.schemas import chat as schemas_chat # Import trực tiếp file chat.py
 from app.crud import crud_chat, crud_user # Import các module crud cần thiết
 # --- KẾT THÚC SỬA IMPORT ---
 from app.api import deps
+from app.core import metrics
+from app.services.conversation_memory import conversation_memory
 from app.services.rag_service import rag_service
 
+from app.db.session import AsyncSessionLocal
+
 from fastapi import HTTPException
-from typing import List
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Optional
+import asyncio
 import datetime
+import json
+import logging
 
 from langchain_core.messages import HumanMessage, AIMessage
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+def _to_langchain_history(chat_history: List[schemas_chat.HistoryItem]) -> list:
+    """Chuyển lịch sử chat từ payload sang danh sách message của LangChain (chỉ giữ cửa sổ các lượt cuối)."""
+    window_turns = conversation_memory.window_turns
+    langchain_chat_history = []
+    for item in chat_history[-window_turns:] if window_turns > 0 else []:
+        langchain_chat_history.append(HumanMessage(content=item.human))
+        langchain_chat_history.append(AIMessage(content=item.ai))
+    return langchain_chat_history
+
+async def _load_history(
+    request: schemas_chat.ChatRequest, db: AsyncSession, session_id: int, user_id: int, is_new_session: bool
+) -> list:
+    """Lịch sử cho bước viết lại câu hỏi: từ payload nếu client gửi, nếu không thì đọc từ DB theo session."""
+    if request.chat_history is not None:
+        return _to_langchain_history(request.chat_history)
+    if is_new_session:
+        return []
+    return await conversation_memory.load(db, session_id=session_id, user_id=user_id)
+
+def _finish_timings(mode: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Bổ sung thời gian lưu tin nhắn (chạy sau khi RAG service đã đóng bảng thời gian của request)
+    vào `timings_ms` trả về và log bảng thời gian đầy đủ của request.
+    """
+    timings = metrics.request_timings() or {}
+    if metadata is not None and "db_write" in timings:
+        metadata.setdefault("timings_ms", {})["db_write"] = timings["db_write"]
+    logger.info("Chat %s request stages (ms): %s", mode, timings)
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Đóng gói một sự kiện theo định dạng Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # --- SỬA CÁCH SỬ DỤNG ---
 @router.post("/message", response_model=schemas_chat.ChatResponse)
@@ -31,13 +73,12 @@ async def handle_chat_message(
         # (Thêm logic kiểm tra session_id ở đây)
         session_id = request.session_id
 
-    langchain_chat_history = []
-    for item in request.chat_history:
-        langchain_chat_history.append(HumanMessage(content=item.human))
-        langchain_chat_history.append(AIMessage(content=item.ai))
+    langchain_chat_history = await _load_history(
+        request, db, session_id, current_user.id, is_new_session=not request.session_id
+    )
         
-    # Gọi RAG service với câu hỏi VÀ lịch sử chat
-    result = rag_service.ask(
+    # Gọi RAG service (bản async) với câu hỏi VÀ lịch sử chat, không chặn event loop
+    result = await rag_service.ask_async(
         question=request.question,
         chat_history=langchain_chat_history
     )
@@ -47,14 +88,82 @@ async def handle_chat_message(
         answer=result["answer"],
         sources=result["sources"]
     )
-    await crud_chat.create_message(db=db, obj_in=message_to_db, session_id=session_id)
+    with metrics.stage("db_write"):
+        await crud_chat.create_message(db=db, obj_in=message_to_db, session_id=session_id)
+    metadata = result.get("metadata", {})
+    _finish_timings("message", metadata)
+    # Tóm tắt các lượt vừa ra khỏi cửa sổ được cập nhật ở nền, không làm chậm response
+    conversation_memory.schedule_refresh(session_id, current_user.id)
     
     return schemas_chat.ChatResponse( # Dùng schemas_chat
         answer=result["answer"],
         sources=result["sources"],
-        session_id=session_id
+        session_id=session_id,
+        metadata=metadata
     )
     
+@router.post("/message/stream")
+async def handle_chat_message_stream(
+    request: schemas_chat.ChatRequest,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: models_user.User = Depends(deps.get_current_user),
+):
+    """
+    Phiên bản streaming (SSE) của /message: gửi `sources` ngay khi rerank xong,
+    sau đó stream từng token câu trả lời, cuối cùng lưu tin nhắn và gửi `done`.
+    """
+    if not request.session_id:
+        chat_session = await crud_chat.create_session(db=db, user_id=current_user.id)
+        session_id = chat_session.id
+    else:
+        session_id = request.session_id
+
+    langchain_chat_history = await _load_history(
+        request, db, session_id, current_user.id, is_new_session=not request.session_id
+    )
+    user_id = current_user.id
+
+    async def save_message(answer: str, sources: List[Dict[str, Any]]):
+        # Dùng session DB riêng vì session của dependency có thể đã đóng khi response đang stream
+        async with AsyncSessionLocal() as stream_db:
+            message_to_db = schemas_chat.ChatMessageCreate(
+                question=request.question, answer=answer, sources=sources
+            )
+            with metrics.stage("db_write"):
+                await crud_chat.create_message(db=stream_db, obj_in=message_to_db, session_id=session_id)
+        _finish_timings("stream")
+        conversation_memory.schedule_refresh(session_id, user_id)
+
+    async def event_stream():
+        answer_parts: List[str] = []
+        sources: List[Dict[str, Any]] = []
+        saved = False
+        try:
+            async for event, data in rag_service.ask_stream(
+                question=request.question, chat_history=langchain_chat_history
+            ):
+                if event == "sources":
+                    sources = data["sources"]
+                    data = {**data, "session_id": session_id}
+                elif event == "token":
+                    answer_parts.append(data["text"])
+                yield _format_sse(event, data)
+
+            if answer_parts:
+                await save_message("".join(answer_parts), sources)
+            saved = True
+            yield _format_sse("done", {"answer": "".join(answer_parts), "session_id": session_id})
+        finally:
+            # Client ngắt kết nối giữa chừng: vẫn lưu phần câu trả lời đã sinh ra
+            if not saved and answer_parts:
+                await asyncio.shield(save_message("".join(answer_parts), sources))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/sessions", response_model=List[schemas_chat.ChatSession])
 async def get_user_sessions(
     db: AsyncSession = Depends(deps.get_db),
@@ -89,6 +198,7 @@ async def delete_session(
     if not session_to_delete:
         raise HTTPException(status_code=404, detail="Session not found")
     await crud_chat.remove_session(db=db, session_id=session_id, user_id=current_user.id)
+    conversation_memory.forget(session_id)
     return None
 
 @router.patch("/sessions/{session_id}", response_model=schemas_chat.ChatSession)
@@ -2,42 +2,39 @@
 from fastapi import APIRouter, HTTPException, Path as FastApiPath
 from fastapi.responses import FileResponse
 from app.core.config import settings
+import logging
 import os
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.get("/view/{filename}")
 async def view_document(
     filename: str = FastApiPath(..., description="Tên file PDF cần xem")
 ):
-    print("\n--- DEBUGGING /documents/view ---")
-    print(f"1. Received filename from URL: '{filename}'")
+    logger.debug("Received filename from URL: '%s'", filename)
     
     # Lấy đường dẫn thư mục PDF từ settings (đã là tuyệt đối)
     pdf_dir = settings.PDF_DIRECTORY
-    print(f"2. PDF directory from settings: '{pdf_dir}'")
 
     # Xây dựng đường dẫn đầy đủ đến file
     file_path = os.path.join(pdf_dir, filename)
-    print(f"3. Constructed full file path: '{file_path}'")
+    logger.debug("Constructed full file path: '%s'", file_path)
 
     # Kiểm tra xem file có tồn tại vật lý hay không
     file_exists = os.path.isfile(file_path)
-    print(f"4. Does file exist at path? -> {file_exists}")
 
     if not file_exists:
-        # Nếu không tồn tại, hãy liệt kê tất cả các file có trong thư mục để so sánh
-        try:
-            available_files = os.listdir(pdf_dir)
-            print(f"5. ERROR: File not found. Available files in directory '{pdf_dir}':")
-            for f in available_files:
-                print(f"   - {f}")
-        except Exception as list_err:
-            print(f"   - Could not list files in directory: {list_err}")
+        # Nếu không tồn tại, hãy liệt kê tất cả các file có trong thư mục để so sánh (chỉ khi bật DEBUG)
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                logger.debug("File not found. Available files in directory '%s': %s", pdf_dir, os.listdir(pdf_dir))
+            except Exception as list_err:
+                logger.debug("Could not list files in directory: %s", list_err)
+        logger.warning("Requested document '%s' not found in '%s'.", filename, pdf_dir)
         
         raise HTTPException(status_code=404, detail=f"File '{filename}' not found on server.")
     
     # (Phần kiểm tra path traversal giữ nguyên)
 
-    print("6. File found. Returning FileResponse...")
-    return FileResponse(path=file_path, media_type='application/pdf')
\ No newline at end of file
+    return FileResponse(path=file_path, media_type='application/pdf')
@@ -0,0 +1,21 @@
+# app/api/v1/endpoints/health.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.rag_service import rag_service
+
+router = APIRouter()
+
+@router.get("/live")
+async def live():
+    """Process còn sống và event loop còn phản hồi (không phụ thuộc trạng thái tải model)."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def ready():
+    """
+    Chỉ trả về 200 khi RAG service đã tải xong mọi thành phần và chạy xong truy vấn làm nóng;
+    ngược lại trả về 503 kèm trạng thái và thời gian tải của từng thành phần.
+    """
+    health = rag_service.health()
+    return JSONResponse(status_code=200 if health["status"] == "ready" else 503, content=health)
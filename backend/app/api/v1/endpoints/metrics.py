@@ -0,0 +1,17 @@
+# app/api/v1/endpoints/metrics.py
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+
+from app.core.metrics import RAGStatsCollector
+from app.services.rag_service import rag_service
+
+router = APIRouter()
+
+def register_collectors() -> None:
+    """Đăng ký collector đọc thống kê cache/hàng đợi từ rag_service tại thời điểm scrape (chỉ khi bật metrics)."""
+    REGISTRY.register(RAGStatsCollector(rag_service.stats))
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Metrics định dạng Prometheus: thời gian từng bước, số ứng viên, hit rate cache, độ sâu hàng đợi."""
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -23,16 +23,129 @@ class Settings(BaseSettings):
     ALGORITHM: str
     
     # RAG
-    GOOGLE_API_KEY: str
+    # Chỉ bắt buộc khi LLM_PROVIDER = "gemini"
+    GOOGLE_API_KEY: str | None = None
     
     # Các biến không đọc từ .env
     API_V1_STR: str = "/api/v1"
     PDF_DIRECTORY: str = "data/pdfs"
     VECTOR_STORE_DIRECTORY: str = "data/vector_store/Chroma"
+    CHUNK_STORE_DIRECTORY: str = "data/vector_store/chunks"
+    # File pickle cũ, chỉ dùng để tương thích khi chưa build kho chunk
     ALL_CHUNKS_PATH: str = "data/vector_store/all_chunks.pkl"
-    ALL_CHUNKS_JSON_PATH: str = "data/vector_store/all_chunks.json"
+    BM25_INDEX_DIRECTORY: str = "data/vector_store/bm25"
+    # Từ điển mở rộng câu hỏi (TSV: cách nói phổ thông <TAB> thuật ngữ pháp lý); None = từ điển đi kèm mã nguồn
+    QUERY_EXPANSION_PATH: str | None = None
+    # Index trích dẫn (loại văn bản, số hiệu, số Điều) -> chunk id cho đường tắt câu hỏi trích dẫn
+    CITATION_INDEX_PATH: str = "data/vector_store/citation_index.json"
+    CITATION_FAST_PATH_ENABLED: bool = True
+    # Manifest hash nội dung PDF + chunk id của từng file (dùng cho build tăng dần)
+    INGEST_MANIFEST_PATH: str = "data/vector_store/manifest.json"
     MODELS_DIRECTORY: str = "models"
 
+    # LLM cho các chain viết lại câu hỏi và trả lời: "gemini" hoặc "offline" (giả lập tất định, không cần mạng,
+    # dùng cho load test/benchmark; độ trễ trước token đầu theo phân phối fixed/uniform/normal/lognormal)
+    LLM_PROVIDER: str = "gemini"
+    LLM_MODEL: str = "models/gemini-1.5-flash-latest"
+    LLM_TEMPERATURE: float = 0.1
+    OFFLINE_LLM_LATENCY_MS: float = 800.0
+    OFFLINE_LLM_JITTER_MS: float = 200.0
+    OFFLINE_LLM_LATENCY_DISTRIBUTION: str = "lognormal"
+    OFFLINE_LLM_TOKEN_DELAY_MS: float = 10.0
+    OFFLINE_LLM_SEED: int = 0
+
+    # Ingestion (data_loader): số process xử lý PDF song song (0 = số CPU) và số trang mỗi tác vụ
+    INGEST_WORKERS: int = 0
+    INGEST_PAGES_PER_TASK: int = 20
+    # Số chunks embedding mỗi batch khi build Vector Store (tiến độ được checkpoint sau mỗi batch)
+    EMBED_BATCH_SIZE: int = 256
+
+    # Inference: số worker của executor chạy các bước nặng CPU (embedding, Chroma, BM25, rerank)
+    # Khi bật micro-batching, worker chủ yếu chờ kết quả batch nên executor dùng ít nhất
+    # INFERENCE_MAX_BATCH_SIZE worker (xem rag_service.inference_workers)
+    RAG_INFERENCE_WORKERS: int = 2
+    # Backend inference cho embedding + reranker: "torch" (fp32), "int8" (lượng tử hóa động, chỉ CPU)
+    # hoặc "onnx" (ONNX Runtime); ONNX_FILE_NAME chọn file trong thư mục model, ví dụ
+    # "onnx/model_qint8_avx512_vnni.onnx" (None = "onnx/model.onnx"). Tạo file bằng app.services.model_export
+    INFERENCE_BACKEND: str = "torch"
+    ONNX_FILE_NAME: str | None = None
+    # Số thread nội bộ của torch cho mỗi phép tính (None = để torch tự chọn)
+    TORCH_NUM_THREADS: int | None = None
+
+    # Lịch sử hội thoại phía server (khi client không gửi chat_history): số lượt gần nhất giữ nguyên văn,
+    # số ký tự tối đa mỗi câu hỏi/câu trả lời đưa vào prompt, và tóm tắt cuốn chiếu các lượt cũ hơn
+    # (cache theo session, làm mới ở nền; mỗi lần tóm tắt tối đa CHAT_MEMORY_SUMMARY_MAX_TURNS lượt)
+    CHAT_MEMORY_WINDOW_TURNS: int = 4
+    CHAT_MEMORY_TURN_MAX_CHARS: int = 600
+    CHAT_MEMORY_SUMMARY_ENABLED: bool = True
+    CHAT_MEMORY_SUMMARY_CACHE_SIZE: int = 10_000
+    CHAT_MEMORY_SUMMARY_MAX_TURNS: int = 20
+
+    # Logging (thay cho print) và metrics Prometheus tại /metrics (thời gian từng bước, hit rate cache, hàng đợi)
+    LOG_LEVEL: str = "INFO"
+    METRICS_ENABLED: bool = True
+
+    # Truy vấn làm nóng toàn bộ đường retrieval trước khi báo ready ("" = bỏ qua bước làm nóng)
+    WARMUP_QUERY: str = "Mức phạt khi vượt đèn đỏ đối với xe máy là bao nhiêu?"
+
+    # Micro-batching cho reranker và embedding câu truy vấn giữa các request đồng thời
+    INFERENCE_BATCHING_ENABLED: bool = True
+    INFERENCE_MAX_BATCH_SIZE: int = 64
+    INFERENCE_MAX_WAIT_MS: float = 5.0
+
+    # Chạy retrieval trên câu hỏi gốc trong lúc LLM viết lại câu hỏi; dùng lại kết quả nếu câu hỏi độc lập
+    # trùng câu gốc, hoặc cùng bộ lọc metadata và tỉ lệ từ chung (Jaccard) >= SPECULATIVE_MIN_OVERLAP
+    SPECULATIVE_RETRIEVAL_ENABLED: bool = True
+    SPECULATIVE_MIN_OVERLAP: float = 0.8
+
+    # Dựng ngữ cảnh cho prompt trả lời: gộp các chunk cùng Điều, bỏ header lặp, chỉ giữ các khoản liên quan
+    # nhất khi vượt CONTEXT_TOKEN_BUDGET token (0 = không giới hạn; token ước lượng theo số ký tự)
+    CONTEXT_ASSEMBLY_ENABLED: bool = True
+    CONTEXT_TOKEN_BUDGET: int = 2000
+    CONTEXT_CHARS_PER_TOKEN: float = 3.0
+
+    # Cache câu hỏi đã được viết lại (condense question), key = hash(lịch sử, câu hỏi)
+    QUESTION_REWRITE_CACHE_SIZE: int = 1024
+
+    # Cache vector của câu truy vấn trong SentenceTransformerEmbeddings ("float32" hoặc "float16" để tiết kiệm RAM)
+    EMBEDDING_CACHE_SIZE: int = 4096
+    EMBEDDING_CACHE_DTYPE: str = "float32"
+
+    # Số ứng viên lấy từ vector search / BM25 và số chunk cuối cùng đưa vào ngữ cảnh;
+    # RERANK_ENABLED = False để xếp hạng chỉ bằng fusion. Chọn giá trị bằng benchmarks.retrieval_sweep
+    RETRIEVAL_TOP_N_VECTOR: int = 15
+    RETRIEVAL_TOP_N_KEYWORD: int = 15
+    RETRIEVAL_TOP_K_FINAL: int = 5
+    RERANK_ENABLED: bool = True
+
+    # Hợp nhất kết quả vector + BM25 trước rerank: "union" (rerank toàn bộ) hoặc "rrf" (reciprocal-rank fusion)
+    # Với "rrf": chỉ rerank RERANK_TOP_M ứng viên đầu (0 = tất cả) và bỏ qua rerank khi khoảng cách
+    # tương đối giữa ứng viên thứ k và k+1 >= RERANK_SKIP_MARGIN (None = luôn rerank)
+    RETRIEVAL_FUSION: str = "union"
+    RRF_K: int = 60
+    RERANK_TOP_M: int = 0
+    RERANK_SKIP_MARGIN: float | None = None
+
+    # Cache điểm rerank theo (query, chunk); RERANK_CACHE_PATH = None để không lưu ra đĩa
+    RERANK_CACHE_SIZE: int = 100_000
+    RERANK_CACHE_PATH: str | None = None
+
+    # Cache câu trả lời (tra cứu chính xác + gần đúng theo embedding), bị xóa khi corpus đổi phiên bản
+    CORPUS_VERSION_PATH: str = "data/vector_store/corpus_version.json"
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 2000
+    ANSWER_CACHE_TTL_SECONDS: int = 24 * 3600
+    ANSWER_CACHE_MAX_MB: int = 64
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.97
+
+    # Reload index nóng: khóa cho endpoint admin (None = tắt endpoint) và chu kỳ theo dõi
+    # file phiên bản corpus để tự reload (0 = không theo dõi)
+    ADMIN_API_KEY: str | None = None
+    INDEX_WATCH_INTERVAL_SECONDS: float = 0
+    # Thời gian chờ (giây) trước khi xóa thư mục Vector Store của phiên bản cũ sau khi reload,
+    # để các request đang chạy trên phiên bản cũ kịp hoàn tất
+    INDEX_RETIRE_GRACE_SECONDS: float = 30
+
     # Không cần class Config ở đây nữa vì chúng ta đã load thủ công
     # class Config:
     #     env_file = ".env"
@@ -1,17 +1,37 @@
+import asyncio
+import logging
+
+from app.core.config import settings
 from app.services.rag_service import rag_service
 
+logger = logging.getLogger(__name__)
+
+# Giữ tham chiếu tới tác vụ tải nền để không bị garbage collect
+_load_task = None
+
+async def _load_rag_service():
+    # rag_service.load() chặn (tải model, index) nên chạy trên một luồng riêng
+    await asyncio.to_thread(rag_service.load)
+    # Tự reload index khi data_loader đóng dấu phiên bản corpus mới (nếu được bật)
+    if rag_service.is_ready:
+        rag_service.start_index_watcher(settings.INDEX_WATCH_INTERVAL_SECONDS)
+
 async def startup_event():
     """
     Hàm được gọi khi ứng dụng FastAPI khởi động.
+    RAG service được tải ở nền để server phục vụ ngay các route health/auth;
+    /health/ready chỉ trả về 200 khi mọi thành phần đã tải xong và làm nóng.
     """
-    print("--- FastAPI App is starting up ---")
-    print("--- Loading RAG Service... ---")
+    global _load_task
+    logger.info("--- FastAPI App is starting up ---")
+    logger.info("--- Loading RAG Service in background... ---")
     # Ra lệnh cho RAG service tải các model và index
-    rag_service.load()
+    _load_task = asyncio.create_task(_load_rag_service())
 
 async def shutdown_event():
     """
     Hàm được gọi khi ứng dụng FastAPI tắt.
     """
-    print("--- FastAPI App is shutting down ---")
-    # Có thể thêm logic dọn dẹp tài nguyên ở đây nếu cần (ví dụ: giải phóng GPU)
\ No newline at end of file
+    logger.info("--- FastAPI App is shutting down ---")
+    rag_service.shutdown()
+    # Có thể thêm logic dọn dẹp tài nguyên ở đây nếu cần (ví dụ: giải phóng GPU)
@@ -0,0 +1,133 @@
+# app/core/metrics.py
+"""
+Đo thời gian từng bước của pipeline RAG và xuất metrics Prometheus (endpoint /metrics).
+
+- `stage(name)`: đo một bước, ghi vào histogram `rag_stage_duration_seconds{stage=...}` và vào
+  bảng thời gian của request hiện tại (nếu có).
+- `start_request()` / `request_timings()`: bảng thời gian theo từng request, lưu trong contextvar nên
+  được chia sẻ với các luồng của inference executor (khi chạy hàm qua `contextvars.copy_context().run`).
+- `RAGStatsCollector`: đọc `rag_service.stats()` lúc Prometheus scrape (hit rate cache, độ sâu hàng đợi)
+  thay vì cập nhật counter trên đường nóng.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Bucket (giây) từ vài trăm micro-giây (BM25, merge) tới vài chục giây (LLM chậm)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CANDIDATE_BUCKETS = (0, 1, 2, 5, 10, 15, 20, 30, 50, 100)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Thời gian từng bước của pipeline RAG", ["stage"], buckets=STAGE_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "rag_request_duration_seconds", "Thời gian xử lý một câu hỏi (toàn bộ pipeline)", ["mode", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+RETRIEVAL_CANDIDATES = Histogram(
+    "rag_retrieval_candidates", "Số ứng viên ở từng bước retrieval", ["source"], buckets=CANDIDATE_BUCKETS
+)
+REQUEST_PATHS = Counter(
+    "rag_request_path_total", "Số request theo đường xử lý (cache, citation fast path, speculation...)", ["path"]
+)
+
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "rag_request_timings", default=None
+)
+
+
+def start_request() -> Dict[str, float]:
+    """Bắt đầu bảng thời gian (ms) cho request hiện tại; các `stage` sau đó cộng dồn vào bảng này."""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def request_timings() -> Optional[Dict[str, float]]:
+    return _request_timings.get()
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage=name).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        # Một bước có thể chạy nhiều lần trong một request (ví dụ embed khi retrieval chạy trước bị bỏ)
+        timings[name] = round(timings.get(name, 0.0) + seconds * 1000.0, 3)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started_at)
+
+
+def observe_candidates(source: str, count: int) -> None:
+    RETRIEVAL_CANDIDATES.labels(source=source).observe(count)
+
+
+def observe_request(mode: str, outcome: str, seconds: float) -> None:
+    REQUEST_SECONDS.labels(mode=mode, outcome=outcome).observe(seconds)
+
+
+def bind_context(func: Callable, *args) -> Callable[[], Any]:
+    """Gói một lời gọi để chạy trên luồng khác mà vẫn thấy contextvar của request hiện tại."""
+    context = contextvars.copy_context()
+    return lambda: context.run(func, *args)
+
+
+class RAGStatsCollector:
+    """Collector Prometheus đọc thống kê cache/batcher/executor của RAG service tại thời điểm scrape."""
+    def __init__(self, stats_fn: Callable[[], Dict[str, Any]]):
+        self.stats_fn = stats_fn
+
+    def collect(self):
+        stats = self.stats_fn()
+        lookups = CounterMetricFamily("rag_cache_lookups", "Số lần tra cứu cache theo kết quả", labels=["cache", "result"])
+        entries = GaugeMetricFamily("rag_cache_entries", "Số mục hiện có trong cache", labels=["cache"])
+        for name in ("rerank_cache", "embedding_cache"):
+            cache = stats.get(name)
+            if cache:
+                lookups.add_metric([name, "hit"], cache["hits"])
+                lookups.add_metric([name, "miss"], cache["misses"])
+                entries.add_metric([name], cache["size"])
+        answer_cache = stats.get("answer_cache")
+        if answer_cache:
+            lookups.add_metric(["answer_cache", "exact"], answer_cache["exact_hits"])
+            lookups.add_metric(["answer_cache", "semantic"], answer_cache["semantic_hits"])
+            lookups.add_metric(["answer_cache", "miss"], answer_cache["misses"])
+            entries.add_metric(["answer_cache"], answer_cache["entries"])
+        rewriter = stats.get("question_rewriter")
+        if rewriter:
+            lookups.add_metric(["question_rewrite_cache", "hit"], rewriter["cache"]["hits"])
+            lookups.add_metric(["question_rewrite_cache", "miss"], rewriter["cache"]["misses"])
+            lookups.add_metric(["question_rewrite_cache", "bypassed"], rewriter["bypassed"])
+            entries.add_metric(["question_rewrite_cache"], rewriter["cache"]["size"])
+        speculation = stats.get("speculative_retrieval")
+        if speculation:
+            lookups.add_metric(["speculative_retrieval", "hit"], speculation["hits"])
+            lookups.add_metric(["speculative_retrieval", "miss"], speculation["misses"])
+        yield lookups
+        yield entries
+
+        queue_depth = GaugeMetricFamily("rag_queue_depth", "Số tác vụ đang chờ trong hàng đợi", labels=["queue"])
+        batches = CounterMetricFamily("rag_batcher_batches", "Số batch inference đã chạy", labels=["batcher"])
+        batch_items = CounterMetricFamily("rag_batcher_items", "Số phần tử đã xử lý qua micro-batcher", labels=["batcher"])
+        for name in ("rerank_batcher", "embedding_batcher"):
+            batcher = stats.get(name)
+            if batcher:
+                queue_depth.add_metric([name], batcher["queue_depth"])
+                batches.add_metric([name], batcher["batches"])
+                batch_items.add_metric([name], batcher["items"])
+        executor = stats.get("inference_executor")
+        if executor:
+            queue_depth.add_metric(["inference_executor"], executor["queue_depth"])
+        yield queue_depth
+        yield batches
+        yield batch_items
@@ -24,6 +24,23 @@ async def create_message(db: AsyncSession, *, obj_in: ChatMessageCreate, session
     await db.refresh(db_obj)
     return db_obj
 
+async def get_recent_messages(
+    db: AsyncSession, *, session_id: int, user_id: int, limit: int, after_id: int | None = None
+) -> List[ChatMessage]:
+    """
+    Lấy tối đa `limit` tin nhắn mới nhất của một session (chỉ khi session thuộc về user), theo thứ tự cũ -> mới.
+    `after_id`: chỉ lấy các tin nhắn có id lớn hơn giá trị này.
+    """
+    query = (
+        select(ChatMessage)
+        .join(ChatSession, ChatMessage.session_id == ChatSession.id)
+        .filter(ChatSession.id == session_id, ChatSession.user_id == user_id)
+    )
+    if after_id is not None:
+        query = query.filter(ChatMessage.id > after_id)
+    result = await db.execute(query.order_by(ChatMessage.id.desc()).limit(limit))
+    return list(reversed(result.scalars().all()))
+
 async def get_sessions_by_user(db: AsyncSession, *, user_id: int) -> List[ChatSession]:
     """Lấy tất cả các session của một user."""
     result = await db.execute(
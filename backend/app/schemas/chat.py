@@ -18,6 +18,8 @@ class ChatResponse(BaseModel):
     answer: str
     sources: List[Source]
     session_id: int # Backend sẽ luôn trả về một session_id
+    # Thông tin thêm về cách tạo câu trả lời (ví dụ: {"cache": "exact" | "semantic" | "miss"})
+    metadata: Dict[str, Any] = Field(default_factory=dict)
 
 class ChatMessageCreate(BaseModel):
     question: str
@@ -58,5 +60,6 @@ class HistoryItem(BaseModel):
 class ChatRequest(BaseModel):
     question: str
     session_id: int | None = None
-    # Thêm trường chat_history, mặc định là mảng rỗng
-    chat_history: List[HistoryItem] = Field(default_factory=list)
\ No newline at end of file
+    # Không bắt buộc: None = server tự đọc lịch sử của session_id (cửa sổ các lượt gần nhất + tóm tắt);
+    # nếu client vẫn gửi thì chỉ các lượt cuối (CHAT_MEMORY_WINDOW_TURNS) được dùng
+    chat_history: List[HistoryItem] | None = None
\ No newline at end of file
@@ -0,0 +1,151 @@
+import json
+import logging
+import re
+import sys
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.lru_cache import LRUCache
+from app.services.query_analysis import extract_entities
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Chuẩn hóa câu hỏi để làm key: NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu ở cuối."""
+    text = unicodedata.normalize("NFC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?.!")
+
+
+def _filter_key(where_filter: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(where_filter or {}, ensure_ascii=False, sort_keys=True)
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    filter_key: str
+    answer: str
+    sources: List[Dict[str, Any]]
+    # Số và loại phương tiện trong câu hỏi (xem extract_entities): trúng gần đúng chỉ khi khớp hoàn toàn
+    entities: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    vector: Optional[np.ndarray] = field(default=None, repr=False)
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời đặt trước pipeline RAG.
+    - Tra cứu chính xác theo (câu hỏi độc lập đã chuẩn hóa, where_filter).
+    - Nếu trượt, tra cứu gần đúng bằng độ tương đồng cosine của embedding câu hỏi
+      (chỉ giữa các câu có cùng where_filter và cùng các số / loại phương tiện, để "xe máy" và "ô tô"
+      với câu chữ giống nhau không nhận mức phạt của nhau).
+    - Embedding được tính trên đúng chuỗi câu hỏi mà retrieval dùng, nên dùng chung cache embedding
+      với bước vector search thay vì encode thêm một lần.
+    - Giới hạn số mục, dung lượng, TTL; xóa toàn bộ khi RAG service chuyển sang phiên bản corpus khác
+      (`set_corpus_version`, cùng lúc với việc thay retriever - không theo file phiên bản trên đĩa, vì file
+      đổi ngay khi build xong trong khi server vẫn trả lời bằng index cũ cho tới lần reload).
+    """
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        corpus_version: Optional[str] = None,
+        max_entries: int = 2000,
+        ttl_seconds: Optional[float] = 24 * 3600,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        similarity_threshold: float = 0.97,
+    ):
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.entries = LRUCache(max_entries, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+        self._corpus_version = corpus_version
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def set_corpus_version(self, version: Optional[str]) -> None:
+        """Gắn cache với phiên bản corpus đang phục vụ; đổi phiên bản thì xóa toàn bộ câu trả lời cũ."""
+        with self._lock:
+            if version != self._corpus_version:
+                logger.info("Corpus version changed (%s -> %s), clearing answer cache.", self._corpus_version, version)
+                self._corpus_version = version
+                self.entries.clear()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _estimate_size(entry: CachedAnswer) -> int:
+        size = sys.getsizeof(entry.answer) + sys.getsizeof(entry.question)
+        size += sum(sys.getsizeof(src.get("page_content", "")) + 256 for src in entry.sources)
+        if entry.vector is not None:
+            size += entry.vector.nbytes
+        return size
+
+    def lookup(self, question: str, where_filter: Optional[Dict[str, Any]]) -> Tuple[Optional[CachedAnswer], Dict[str, Any]]:
+        """Trả về (mục cache hoặc None, metadata mô tả kết quả tra cứu)."""
+        normalized = normalize_question(question)
+        filter_key = _filter_key(where_filter)
+
+        entry = self.entries.get((normalized, filter_key))
+        if entry is not None:
+            self.exact_hits += 1
+            return entry, {"cache": "exact"}
+
+        if self.similarity_threshold < 1.0:
+            entities = extract_entities(question)
+            candidates = [
+                e for e in self.entries.values()
+                if e.filter_key == filter_key and e.entities == entities and e.vector is not None
+            ]
+            if candidates:
+                query_vector = self._embed(question)
+                similarities = np.stack([e.vector for e in candidates]) @ query_vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    entry = candidates[best]
+                    self.entries.get((entry.question, entry.filter_key))  # Cập nhật thứ tự LRU
+                    self.semantic_hits += 1
+                    return entry, {"cache": "semantic", "similarity": round(float(similarities[best]), 4)}
+
+        self.misses += 1
+        return None, {"cache": "miss"}
+
+    def store(self, question: str, where_filter: Optional[Dict[str, Any]], answer: str, sources: List[Dict[str, Any]],
+              corpus_version: Optional[str] = None) -> None:
+        """Lưu câu trả lời; bỏ qua nếu nó được tạo trên phiên bản corpus khác bản cache đang gắn (request chạy qua lúc reload)."""
+        if not answer or (corpus_version is not None and corpus_version != self._corpus_version):
+            return
+        normalized = normalize_question(question)
+        vector = self._embed(question) if self.similarity_threshold < 1.0 else None
+        entry = CachedAnswer(
+            question=normalized,
+            filter_key=_filter_key(where_filter),
+            answer=answer,
+            sources=sources,
+            entities=extract_entities(question),
+            vector=vector,
+        )
+        self.entries.put((entry.question, entry.filter_key), entry, size=self._estimate_size(entry))
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "corpus_version": self._corpus_version,
+            "entries": len(self.entries),
+            "bytes": self.entries.stats()["bytes"],
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / total if total else 0.0,
+        }
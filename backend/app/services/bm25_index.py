@@ -0,0 +1,159 @@
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+BM25_META_FILE = "meta.json"
+BM25_VOCAB_FILE = "vocab.json"
+BM25_ARRAY_FILES = ("indptr", "postings_doc", "postings_tf", "idf", "length_norm")
+
+
+def bm25_tokenize(text: str) -> List[str]:
+    """Tách từ cho BM25 - giữ nguyên cách tách theo dấu cách như lúc xây index ban đầu."""
+    return text.split(" ")
+
+
+class SparseBM25Index:
+    """
+    Index BM25 (công thức Okapi, tương đương rank_bm25.BM25Okapi) lưu dạng CSR:
+    mỗi term có một posting list (doc id, tần suất) cùng IDF và chuẩn hóa độ dài tính sẵn.
+    Khi tìm kiếm chỉ duyệt posting list của các term trong câu truy vấn rồi lấy top-k
+    bằng argpartition, không chấm điểm toàn bộ corpus.
+    """
+    def __init__(
+        self,
+        vocab: Dict[str, int],
+        indptr: np.ndarray,
+        postings_doc: np.ndarray,
+        postings_tf: np.ndarray,
+        idf: np.ndarray,
+        length_norm: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.idf = idf
+        self.length_norm = length_norm
+        self.k1 = k1
+        self.b = b
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.length_norm)
+
+    @classmethod
+    def from_tokenized_corpus(
+        cls, tokenized_corpus: Sequence[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25
+    ) -> "SparseBM25Index":
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doc_lens = np.zeros(len(tokenized_corpus), dtype=np.float32)
+        for doc_id, tokens in enumerate(tokenized_corpus):
+            doc_lens[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        term_ids_arr = np.asarray(term_ids, dtype=np.int64)
+        # Sắp xếp ổn định theo term: doc id trong mỗi posting list vẫn tăng dần
+        order = np.argsort(term_ids_arr, kind="stable")
+        df = np.bincount(term_ids_arr, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        # IDF giống BM25Okapi: IDF âm được thay bằng epsilon * IDF trung bình
+        num_docs = len(tokenized_corpus)
+        idf = np.log(num_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            average_idf = idf.sum() / len(idf)
+            idf = np.where(idf < 0, epsilon * average_idf, idf)
+
+        avgdl = doc_lens.sum() / num_docs if num_docs else 0.0
+        length_norm = k1 * (1 - b + b * doc_lens / avgdl) if avgdl else np.full_like(doc_lens, k1)
+
+        return cls(
+            vocab=vocab,
+            indptr=indptr,
+            postings_doc=np.asarray(doc_ids, dtype=np.int32)[order],
+            postings_tf=np.asarray(tfs, dtype=np.float32)[order],
+            idf=idf.astype(np.float32),
+            length_norm=length_norm.astype(np.float32),
+            k1=k1,
+            b=b,
+        )
+
+    def _accumulate(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Cộng điểm trên posting list của các term trong câu truy vấn (term lặp lại được cộng nhiều lần)."""
+        doc_parts, score_parts = [], []
+        for term in tokens:
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = np.asarray(self.postings_doc[start:end])
+            tf = np.asarray(self.postings_tf[start:end])
+            doc_parts.append(docs)
+            score_parts.append(self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.length_norm[docs]))
+        if not doc_parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        docs = np.concatenate(doc_parts)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        return unique_docs, np.bincount(inverse, weights=np.concatenate(score_parts))
+
+    def search(self, tokens: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Trả về (doc ids, điểm) của top-k tài liệu có điểm > 0, điểm giảm dần."""
+        docs, scores = self._accumulate(tokens)
+        positive = scores > 0
+        docs, scores = docs[positive], scores[positive]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            docs, scores = docs[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return docs[order], scores[order]
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """Điểm BM25 dạng dày cho toàn bộ corpus (tương thích BM25Okapi.get_scores)."""
+        dense = np.zeros(self.num_docs, dtype=np.float64)
+        docs, scores = self._accumulate(tokens)
+        dense[docs] = scores
+        return dense
+
+    def save(self, directory: str) -> None:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in BM25_ARRAY_FILES:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        terms = [None] * len(self.vocab)
+        for term, term_id in self.vocab.items():
+            terms[term_id] = term
+        with open(path / BM25_VOCAB_FILE, "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        # Ghi meta sau cùng: sự tồn tại của meta.json đánh dấu index đã ghi xong
+        with open(path / BM25_META_FILE, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "num_docs": self.num_docs, "num_terms": len(terms)}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "SparseBM25Index":
+        """Tải index đã build sẵn; các mảng lớn được memory-map thay vì đọc hết vào RAM."""
+        path = Path(directory)
+        with open(path / BM25_META_FILE, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(path / BM25_VOCAB_FILE, "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None)
+            for name in BM25_ARRAY_FILES
+        }
+        return cls(vocab={term: i for i, term in enumerate(terms)}, k1=meta["k1"], b=meta["b"], **arrays)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return (Path(directory) / BM25_META_FILE).exists()
@@ -0,0 +1,152 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain.schema import Document
+
+CHUNK_STORE_MANIFEST = "manifest.json"
+CHUNK_STORE_TEXTS = "texts.bin"
+CHUNK_STORE_OFFSETS = "offsets.npy"
+CHUNK_STORE_IDS = "ids.npy"
+
+
+class ChunkStore:
+    """
+    Kho chunk dạng cột, thay cho file pickle chứa toàn bộ `Document` của LangChain:
+    - `texts.bin`: nội dung các chunk nối liền (UTF-8) + `offsets.npy` (vị trí bắt đầu/kết thúc)
+    - `ids.npy`: chunk id ổn định (số nguyên, tăng dần) - khóa dùng chung cho Chroma, BM25, các cache
+    - mỗi trường metadata là một cột mã hóa từ điển (`meta_<tên>.npy` + danh sách giá trị trong manifest)
+    Các mảng được memory-map nên mỗi worker chỉ tốn RAM cho phần dữ liệu thực sự đọc tới;
+    `Document` chỉ được tạo cho các kết quả cuối cùng.
+    """
+    def __init__(
+        self,
+        ids: np.ndarray,
+        offsets: np.ndarray,
+        blob: Any,
+        columns: Dict[str, np.ndarray],
+        dictionaries: Dict[str, List[Any]],
+    ):
+        self.ids = ids
+        self.offsets = offsets
+        self._blob = blob
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # --- Tạo kho ---
+
+    @classmethod
+    def from_documents(cls, documents: Sequence[Document], ids: Optional[Sequence[int]] = None) -> "ChunkStore":
+        """Tạo kho trong RAM từ danh sách Document (id mặc định lấy từ metadata 'chunk_id' hoặc số thứ tự)."""
+        if ids is None:
+            ids = [doc.metadata.get("chunk_id", i) for i, doc in enumerate(documents)]
+        encoded = [doc.page_content.encode("utf-8") for doc in documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+
+        column_names = sorted({key for doc in documents for key in doc.metadata if key != "chunk_id"})
+        columns, dictionaries = {}, {}
+        for name in column_names:
+            values: List[Any] = []
+            lookup: Dict[str, int] = {}
+            codes = np.full(len(documents), -1, dtype=np.int32)
+            for row, doc in enumerate(documents):
+                if name not in doc.metadata:
+                    continue
+                value = doc.metadata[name]
+                key = json.dumps(value, ensure_ascii=False)
+                if key not in lookup:
+                    lookup[key] = len(values)
+                    values.append(value)
+                codes[row] = lookup[key]
+            columns[name] = codes
+            dictionaries[name] = values
+
+        return cls(
+            ids=np.asarray(ids, dtype=np.int64),
+            offsets=offsets,
+            blob=b"".join(encoded),
+            columns=columns,
+            dictionaries=dictionaries,
+        )
+
+    def save(self, directory: str) -> None:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        with open(path / CHUNK_STORE_TEXTS, "wb") as f:
+            f.write(bytes(self._blob))
+        np.save(path / CHUNK_STORE_OFFSETS, self.offsets)
+        np.save(path / CHUNK_STORE_IDS, self.ids)
+        for name, codes in self.columns.items():
+            np.save(path / f"meta_{name}.npy", codes)
+        # Ghi manifest sau cùng: sự tồn tại của manifest đánh dấu kho đã ghi xong
+        manifest = {"num_chunks": len(self), "columns": list(self.columns), "dictionaries": self.dictionaries}
+        with open(path / CHUNK_STORE_MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> "ChunkStore":
+        path = Path(directory)
+        with open(path / CHUNK_STORE_MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        texts_path = path / CHUNK_STORE_TEXTS
+        if os.path.getsize(texts_path) > 0:
+            blob = np.memmap(texts_path, dtype=np.uint8, mode="r")
+        else:
+            blob = b""
+        return cls(
+            ids=np.load(path / CHUNK_STORE_IDS, mmap_mode="r"),
+            offsets=np.load(path / CHUNK_STORE_OFFSETS, mmap_mode="r"),
+            blob=blob,
+            columns={name: np.load(path / f"meta_{name}.npy", mmap_mode="r") for name in manifest["columns"]},
+            dictionaries=manifest["dictionaries"],
+        )
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return (Path(directory) / CHUNK_STORE_MANIFEST).exists()
+
+    # --- Đọc dữ liệu ---
+
+    def row_of(self, chunk_id: int) -> Optional[int]:
+        """Tìm vị trí của một chunk id (ids luôn được sắp xếp tăng dần)."""
+        row = int(np.searchsorted(self.ids, chunk_id))
+        if row < len(self.ids) and int(self.ids[row]) == int(chunk_id):
+            return row
+        return None
+
+    def chunk_id(self, row: int) -> int:
+        return int(self.ids[row])
+
+    def get_text(self, row: int) -> str:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def get_metadata(self, row: int) -> Dict[str, Any]:
+        metadata: Dict[str, Any] = {}
+        for name, codes in self.columns.items():
+            code = int(codes[row])
+            if code >= 0:
+                metadata[name] = self.dictionaries[name][code]
+        metadata["chunk_id"] = self.chunk_id(row)
+        return metadata
+
+    def get_document(self, row: int) -> Document:
+        return Document(page_content=self.get_text(row), metadata=self.get_metadata(row))
+
+    def get_documents_by_ids(self, chunk_ids: Sequence[int]) -> List[Document]:
+        rows = [self.row_of(chunk_id) for chunk_id in chunk_ids]
+        return [self.get_document(row) for row in rows if row is not None]
+
+    def iter_texts(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self.get_text(row)
+
+    def iter_documents(self) -> Iterator[Document]:
+        for row in range(len(self)):
+            yield self.get_document(row)
@@ -0,0 +1,98 @@
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.services.chunk_store import ChunkStore
+
+CitationKey = Tuple[str, str, str]  # (document_type, document_number, article_number)
+
+
+def _number_parts(document_number: str) -> List[str]:
+    return [part.strip().lower() for part in str(document_number).split("/") if part.strip()]
+
+
+class CitationIndex:
+    """
+    Index trích dẫn (loại văn bản, số hiệu, số Điều) -> danh sách chunk id, được tạo lúc ingest.
+    Dùng để trả lời trực tiếp các câu hỏi chỉ rõ "Điều N của Nghị định X" mà không cần vector search.
+    """
+    def __init__(self, entries: Dict[CitationKey, List[int]], num_chunks: int = 0):
+        self.entries = entries
+        self.num_chunks = num_chunks
+        # (số Điều, loại văn bản) -> các ứng viên (key, số hiệu đã tách phần); loại None = mọi loại văn bản.
+        # lookup chỉ so khớp số hiệu trong vài ứng viên của đúng Điều thay vì duyệt toàn bộ index.
+        self._candidates: Dict[Tuple[str, Optional[str]], List[Tuple[CitationKey, List[str]]]] = defaultdict(list)
+        for key in entries:
+            candidate = (key, _number_parts(key[1]))
+            self._candidates[(key[2], key[0])].append(candidate)
+            self._candidates[(key[2], None)].append(candidate)
+
+    @classmethod
+    def from_metadata(cls, items: Iterable[Tuple[int, Dict[str, Any]]]) -> "CitationIndex":
+        """Tạo index từ các cặp (chunk id, metadata); chunk thiếu số hiệu hoặc số Điều bị bỏ qua."""
+        entries: Dict[CitationKey, List[int]] = defaultdict(list)
+        num_chunks = 0
+        for chunk_id, metadata in items:
+            num_chunks += 1
+            article_number = metadata.get("article_number")
+            document_number = metadata.get("document_number")
+            if not article_number or not document_number or document_number == "Không xác định":
+                continue
+            key = (metadata.get("document_type", ""), document_number, str(article_number))
+            entries[key].append(int(chunk_id))
+        return cls(dict(entries), num_chunks=num_chunks)
+
+    @classmethod
+    def from_chunk_store(cls, store: ChunkStore) -> "CitationIndex":
+        return cls.from_metadata((store.chunk_id(row), store.get_metadata(row)) for row in range(len(store)))
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "num_chunks": self.num_chunks,
+            "entries": [
+                {"document_type": key[0], "document_number": key[1], "article_number": key[2], "chunk_ids": ids}
+                for key, ids in self.entries.items()
+            ],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CitationIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = {
+            (entry["document_type"], entry["document_number"], entry["article_number"]): entry["chunk_ids"]
+            for entry in data["entries"]
+        }
+        return cls(entries, num_chunks=data.get("num_chunks", 0))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(path)
+
+    def lookup(self, document_number_partial: str, article_number: str,
+               document_type: Optional[str] = None) -> Optional[List[int]]:
+        """
+        Trả về chunk id của Điều được trích dẫn, hoặc None nếu không có hoặc trích dẫn không rõ ràng
+        (số hiệu khớp nhiều văn bản, ví dụ "Nghị định 100" mà không có năm).
+        Số hiệu trong câu hỏi khớp khi là phần đầu của số hiệu đầy đủ: "168" và "168/2024" đều khớp "168/2024/NĐ-CP".
+        """
+        query_parts = _number_parts(document_number_partial)
+        if not query_parts:
+            return None
+        matches = [
+            key for key, number_parts in self._candidates.get((str(article_number), document_type), ())
+            if number_parts[:len(query_parts)] == query_parts
+        ]
+        if len({(key[0], key[1]) for key in matches}) != 1:
+            return None
+        return list(self.entries[matches[0]])
+
+    def __len__(self) -> int:
+        return len(self.entries)
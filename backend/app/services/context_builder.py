@@ -0,0 +1,176 @@
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from app.services.query_analysis import fold_text
+
+# Header ngữ cảnh mà data_loader thêm vào đầu mỗi Điều (chỉ chunk đầu tiên của Điều có header này)
+HEADER_PATTERN = re.compile(r"^Trích từ:[^\n]*\n+")
+# Ranh giới khoản ("1. ", "2. ") và điểm ("a) ", "đ) ") trong một Điều
+CLAUSE_SPLIT_PATTERN = re.compile(r"\n(?=\s*(?:\d+\.|[a-zđ]\))\s)")
+TOKEN_PATTERN = re.compile(r"\w+")
+# Phần gối đầu giữa hai chunk liên tiếp của cùng một Điều (text splitter dùng chunk_overlap=200)
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+GAP_MARKER = "[...]"
+
+
+def estimate_tokens(text: str, chars_per_token: float = 3.0) -> int:
+    """Ước lượng số token (không gọi API của LLM); tiếng Việt có dấu trung bình ~3 ký tự/token."""
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def _merge_overlapping(left: str, right: str) -> str:
+    """Nối hai đoạn liên tiếp, bỏ phần gối đầu (hậu tố dài nhất của `left` trùng tiền tố của `right`)."""
+    max_overlap = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(max_overlap, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left}\n{GAP_MARKER}\n{right}"
+
+
+@dataclass
+class _ArticleGroup:
+    """Các chunk của cùng một Điều trong kết quả retrieval, sắp theo vị trí trong văn bản."""
+    rank: int
+    metadata: Dict
+    chunks: List[Tuple[int, str]] = field(default_factory=list)  # (chunk id, nội dung không có header)
+
+    def header(self) -> str:
+        parts = [f"{self.metadata.get('document_type', '')} {self.metadata.get('document_number', '')}".strip()]
+        if self.metadata.get("chuong"):
+            parts.append(self.metadata["chuong"])
+        return f"Trích từ: {', '.join(parts)}"
+
+    def body(self) -> str:
+        chunks = sorted(self.chunks)
+        text = chunks[0][1]
+        for previous, (chunk_id, chunk_text) in zip(chunks, chunks[1:]):
+            if chunk_id == previous[0] + 1:
+                text = _merge_overlapping(text, chunk_text)
+            else:
+                text = f"{text}\n{GAP_MARKER}\n{chunk_text}"
+        # Điều được trích từ giữa: thêm tên Điều để LLM vẫn trích dẫn đúng
+        title = self.metadata.get("dieu")
+        if title and not text.lstrip().startswith("Điều"):
+            text = f"{title}\n{GAP_MARKER}\n{text}"
+        return text
+
+
+class ContextBuilder:
+    """
+    Dựng ngữ cảnh cho prompt trả lời từ các chunk đã rerank:
+    1. Gộp các chunk của cùng một Điều, bỏ phần gối đầu giữa các chunk liên tiếp.
+    2. Mỗi Điều chỉ giữ một header "Trích từ: ...".
+    3. Nếu vượt ngân sách token, chỉ giữ các khoản/điểm liên quan nhất tới câu hỏi
+       (ưu tiên Điều xếp hạng cao), đánh dấu phần bị lược bằng "[...]".
+    Trả về danh sách Document (mỗi Điều một Document) để dùng trực tiếp với combine_docs_chain.
+    """
+    def __init__(self, token_budget: int = 2000, chars_per_token: float = 3.0,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens or (lambda text: estimate_tokens(text, chars_per_token))
+
+    def _group(self, docs: List[Document]) -> List[_ArticleGroup]:
+        groups: Dict[Tuple, _ArticleGroup] = {}
+        for rank, doc in enumerate(docs):
+            metadata = doc.metadata
+            if metadata.get("article_number") is not None:
+                key = (metadata.get("source_file"), metadata.get("document_number"), str(metadata["article_number"]))
+            else:
+                key = ("chunk", rank)
+            group = groups.setdefault(key, _ArticleGroup(rank=rank, metadata=metadata))
+            chunk_id = metadata.get("chunk_id")
+            text = HEADER_PATTERN.sub("", doc.page_content, count=1).strip()
+            if any(text == existing for _, existing in group.chunks):
+                continue
+            group.chunks.append((int(chunk_id) if chunk_id is not None else rank, text))
+        return sorted(groups.values(), key=lambda group: group.rank)
+
+    @staticmethod
+    def _relevance(clause: str, query_tokens: set) -> float:
+        tokens = set(TOKEN_PATTERN.findall(fold_text(clause)))
+        if not tokens or not query_tokens:
+            return 0.0
+        return len(tokens & query_tokens) / len(query_tokens)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.count_tokens(text)
+        if tokens <= max_tokens:
+            return text
+        cut = max(0, int(len(text) * max_tokens / tokens))
+        return f"{text[:cut].rstrip()}\n{GAP_MARKER}"
+
+    def _select_clauses(self, question: str, groups: List[_ArticleGroup], bodies: List[str]) -> List[Optional[str]]:
+        """
+        Chọn các khoản/điểm liên quan nhất (độ trùng từ với câu hỏi, rồi hạng của Điều) cho vừa ngân sách.
+        Phần mở đầu của Điều (tên Điều) luôn đi kèm khi Điều có ít nhất một khoản được chọn.
+        Trả về nội dung đã cắt gọn của từng Điều (None nếu Điều bị loại).
+        """
+        query_tokens = {token for token in TOKEN_PATTERN.findall(fold_text(question)) if len(token) > 1}
+        clauses_per_group = [CLAUSE_SPLIT_PATTERN.split(body) for body in bodies]
+        selected: List[set] = [set() for _ in groups]
+
+        # Điều xếp hạng cao nhất luôn được giữ (ít nhất phần mở đầu) để câu trả lời có nguồn
+        header_cost = self.count_tokens(groups[0].header())
+        clauses_per_group[0][0] = self._truncate(clauses_per_group[0][0], max(self.token_budget - header_cost, 0))
+        remaining = self.token_budget - header_cost - self.count_tokens(clauses_per_group[0][0])
+        selected[0].add(0)
+
+        candidates = sorted(
+            (-self._relevance(clause, query_tokens), groups[g].rank, c, g)
+            for g, clauses in enumerate(clauses_per_group)
+            for c, clause in enumerate(clauses)
+            if c > 0 or g > 0
+        )
+        for _, _, c, g in candidates:
+            if c in selected[g]:
+                continue
+            clauses = clauses_per_group[g]
+            cost = self.count_tokens(clauses[c])
+            if not selected[g]:
+                cost += self.count_tokens(groups[g].header())
+                if c != 0:
+                    cost += self.count_tokens(clauses[0])
+            if cost > remaining:
+                continue
+            selected[g].update({0, c})
+            remaining -= cost
+
+        texts: List[Optional[str]] = []
+        for g, clauses in enumerate(clauses_per_group):
+            if not selected[g]:
+                texts.append(None)
+                continue
+            parts, previous = [], -1
+            for c in sorted(selected[g]):
+                if c != previous + 1:
+                    parts.append(GAP_MARKER)
+                parts.append(clauses[c])
+                previous = c
+            if previous != len(clauses) - 1:
+                parts.append(GAP_MARKER)
+            texts.append("\n".join(parts))
+        return texts
+
+    def build(self, question: str, docs: List[Document]) -> Tuple[List[Document], Dict[str, int]]:
+        """Trả về (các Document đã gộp/cắt gọn - mỗi Điều một Document, thống kê số token trước/sau)."""
+        if not docs:
+            return [], {"context_tokens": 0, "raw_context_tokens": 0}
+        groups = self._group(docs)
+        bodies: List[Optional[str]] = [group.body() for group in groups]
+        raw_tokens = sum(self.count_tokens(doc.page_content) for doc in docs)
+        total = sum(self.count_tokens(group.header()) + self.count_tokens(body) for group, body in zip(groups, bodies))
+        if self.token_budget and total > self.token_budget:
+            bodies = self._select_clauses(question, groups, bodies)
+
+        assembled = [
+            Document(page_content=f"{group.header()}\n\n{body}", metadata=group.metadata)
+            for group, body in zip(groups, bodies)
+            if body is not None
+        ]
+        context_tokens = sum(self.count_tokens(doc.page_content) for doc in assembled)
+        return assembled, {"context_tokens": context_tokens, "raw_context_tokens": raw_tokens}
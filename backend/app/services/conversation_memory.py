@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Sequence
+
+from langchain.prompts import PromptTemplate
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.core import metrics
+from app.core.config import settings
+from app.crud import crud_chat
+from app.db.session import AsyncSessionLocal
+from app.services.lru_cache import LRUCache
+from app.services.rag_service import rag_service
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT_TEMPLATE = """Tóm tắt ngắn gọn (tối đa 5 câu, tiếng Việt) nội dung cuộc trò chuyện về luật giao thông dưới đây,
+giữ lại các phương tiện, hành vi vi phạm, số hiệu văn bản và số Điều đã được nhắc tới.
+
+Tóm tắt trước đó:
+{summary}
+
+Các lượt trò chuyện tiếp theo:
+{turns}
+
+Tóm tắt mới:"""
+
+SUMMARY_PROMPT = PromptTemplate.from_template(SUMMARY_PROMPT_TEMPLATE)
+
+
+@dataclass
+class ConversationSummary:
+    # Tóm tắt bao gồm mọi tin nhắn có id <= covered_message_id
+    covered_message_id: int
+    text: str
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+
+class ConversationMemory:
+    """
+    Lịch sử hội thoại phía server cho bước viết lại câu hỏi, thay cho lịch sử client gửi kèm mỗi request:
+    - `window_turns` lượt gần nhất được đọc từ bảng ChatMessage (nguyên văn, mỗi lượt cắt tối đa `turn_max_chars`)
+    - các lượt cũ hơn được gộp vào một bản tóm tắt cuốn chiếu, cache theo session trong RAM (LRU)
+      và được làm mới ở nền sau mỗi tin nhắn mới, nên request không phải chờ LLM tóm tắt.
+    Bản tóm tắt có thể chậm một vài lượt so với cửa sổ; prompt viết lại câu hỏi luôn có kích thước giới hạn.
+    """
+    def __init__(
+        self,
+        get_llm: Callable[[], Any],
+        window_turns: int = 4,
+        turn_max_chars: int = 600,
+        summary_enabled: bool = True,
+        summary_cache_size: int = 10_000,
+        summary_max_turns: int = 20,
+    ):
+        self.get_llm = get_llm
+        self.window_turns = window_turns
+        self.turn_max_chars = turn_max_chars
+        self.summary_enabled = summary_enabled
+        self.summary_max_turns = summary_max_turns
+        self.summaries = LRUCache(summary_cache_size)
+        self._refreshing: set = set()
+        # Giữ tham chiếu tới các tác vụ nền để không bị garbage collect
+        self._tasks: set = set()
+
+    def to_messages(self, turns: Sequence[Any], summary: Optional[str] = None) -> List[BaseMessage]:
+        """Chuyển các lượt (question/answer) thành message LangChain, tóm tắt (nếu có) đứng đầu."""
+        messages: List[BaseMessage] = []
+        if summary:
+            messages.append(SystemMessage(content=f"Tóm tắt các lượt trước: {summary}"))
+        for turn in turns:
+            messages.append(HumanMessage(content=_truncate(turn.question, self.turn_max_chars)))
+            messages.append(AIMessage(content=_truncate(turn.answer, self.turn_max_chars)))
+        return messages
+
+    async def load(self, db, *, session_id: int, user_id: int) -> List[BaseMessage]:
+        """Đọc cửa sổ các lượt gần nhất của session (kèm tóm tắt các lượt cũ hơn nếu đã có trong cache)."""
+        with metrics.stage("history_load"):
+            # Lấy thêm một lượt để biết session có lượt nào nằm ngoài cửa sổ hay không
+            recent = await crud_chat.get_recent_messages(
+                db, session_id=session_id, user_id=user_id, limit=self.window_turns + 1
+            )
+        has_older_turns = len(recent) > self.window_turns
+        window = recent[-self.window_turns:] if self.window_turns > 0 else []
+        summary = None
+        if self.summary_enabled and has_older_turns:
+            cached: Optional[ConversationSummary] = self.summaries.get(session_id)
+            summary = cached.text if cached else None
+            if cached is None or cached.covered_message_id < recent[0].id:
+                # Tóm tắt chưa phủ hết các lượt ngoài cửa sổ: dùng bản hiện có, làm mới ở nền
+                self.schedule_refresh(session_id, user_id)
+        return self.to_messages(window, summary)
+
+    def schedule_refresh(self, session_id: int, user_id: int) -> None:
+        """Làm mới tóm tắt của session ở nền (bỏ qua nếu đang có một lần làm mới chạy cho session này)."""
+        if not self.summary_enabled or session_id in self._refreshing:
+            return
+        self._refreshing.add(session_id)
+        task = asyncio.create_task(self._refresh(session_id, user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def forget(self, session_id: int) -> None:
+        self.summaries.pop(session_id)
+
+    async def _refresh(self, session_id: int, user_id: int) -> None:
+        try:
+            llm = self.get_llm()
+            if llm is None:
+                return
+            cached: Optional[ConversationSummary] = self.summaries.get(session_id)
+            # Session DB riêng (request tạo ra tác vụ này có thể đã kết thúc); đầu vào của một lần tóm tắt
+            # có giới hạn nên lần đầu sau khi restart, các lượt rất cũ bị bỏ qua
+            async with AsyncSessionLocal() as db:
+                turns = await crud_chat.get_recent_messages(
+                    db, session_id=session_id, user_id=user_id,
+                    limit=self.summary_max_turns + self.window_turns,
+                    after_id=cached.covered_message_id if cached else None,
+                )
+            older = turns[:-self.window_turns] if self.window_turns > 0 else turns
+            if not older:
+                return
+            turns_text = "\n".join(
+                f"Human: {_truncate(turn.question, self.turn_max_chars)}\n"
+                f"Assistant: {_truncate(turn.answer, self.turn_max_chars)}"
+                for turn in older
+            )
+            with metrics.stage("history_summary"):
+                result = await llm.ainvoke(SUMMARY_PROMPT.format(
+                    summary=cached.text if cached else "(chưa có)", turns=turns_text
+                ))
+            text = getattr(result, "content", result)
+            self.summaries.put(session_id, ConversationSummary(covered_message_id=older[-1].id, text=str(text).strip()))
+        except Exception as e:
+            # Không ảnh hưởng request: lần sau sẽ thử lại, cửa sổ gần nhất vẫn được dùng
+            logger.warning("Could not refresh conversation summary for session %s: %s", session_id, e)
+        finally:
+            self._refreshing.discard(session_id)
+
+    def stats(self):
+        return {"summaries": self.summaries.stats(), "refreshing": len(self._refreshing)}
+
+
+def _get_llm():
+    return getattr(rag_service, "llm", None) if rag_service.is_ready else None
+
+
+# Instance dùng chung cho các endpoint chat
+conversation_memory = ConversationMemory(
+    get_llm=_get_llm,
+    window_turns=settings.CHAT_MEMORY_WINDOW_TURNS,
+    turn_max_chars=settings.CHAT_MEMORY_TURN_MAX_CHARS,
+    summary_enabled=settings.CHAT_MEMORY_SUMMARY_ENABLED,
+    summary_cache_size=settings.CHAT_MEMORY_SUMMARY_CACHE_SIZE,
+    summary_max_turns=settings.CHAT_MEMORY_SUMMARY_MAX_TURNS,
+)
@@ -0,0 +1,106 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from langchain.schema import Document
+
+
+def compute_corpus_version(chunks: Iterable[Document]) -> str:
+    """Tính phiên bản corpus = hash nội dung + metadata của tất cả chunks."""
+    hasher = hashlib.sha256()
+    for chunk in chunks:
+        hasher.update(chunk.page_content.encode("utf-8"))
+        hasher.update(json.dumps(chunk.metadata, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+
+def stamp_corpus_version(path: str, version: str, **extra: Any) -> Dict[str, Any]:
+    """Ghi file phiên bản corpus (được data_loader gọi sau mỗi lần build index)."""
+    info = {
+        "version": version,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        **extra,
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)  # Ghi nguyên tử để server không đọc phải file dở dang
+    return info
+
+
+def read_corpus_version(path: str) -> Optional[str]:
+    return read_corpus_info(path).get("version")
+
+
+def read_corpus_info(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+# Tên thư mục phiên bản = 16 ký tự hex của compute_corpus_version (thư mục nội bộ của Chroma là UUID có dấu "-")
+VERSION_DIRECTORY_PATTERN = re.compile(r"[0-9a-f]{16}")
+
+
+def versioned_directory(root: str, version: Optional[str]) -> str:
+    """
+    Thư mục Vector Store của một phiên bản corpus: `<root>/<version>`. Mỗi lần build ghi vào thư mục riêng
+    nên server vẫn đọc phiên bản cũ cho tới khi chuyển sang bản mới. Dữ liệu cũ (chưa phân phiên bản) nằm ngay tại `root`.
+    """
+    if version:
+        path = os.path.join(root, version)
+        if os.path.isdir(path):
+            return path
+    return root
+
+
+def remove_version_directories(root: str, keep: Iterable[Optional[str]]) -> None:
+    """Xóa các thư mục phiên bản (và checkpoint của chúng) không nằm trong `keep`."""
+    keep = {version for version in keep if version}
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        version = name[:-len(".checkpoint.json")] if name.endswith(".checkpoint.json") else name
+        if VERSION_DIRECTORY_PATTERN.fullmatch(version) and version not in keep:
+            path = os.path.join(root, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+class CorpusVersionTracker:
+    """
+    Theo dõi file phiên bản corpus với chi phí thấp: chỉ đọc lại nội dung
+    khi mtime của file thay đổi.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._version: Optional[str] = None
+        self.refresh()
+
+    def refresh(self) -> Optional[str]:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self._version = read_corpus_version(self.path) if mtime is not None else None
+            return self._version
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
@@ -1,18 +1,41 @@
+import hashlib
+import json
 import os
 import re
 import shutil
+import time
 from app.services.rag_service import SentenceTransformerEmbeddings
+from app.services.bm25_index import SparseBM25Index, bm25_tokenize
+from app.services.chunk_store import ChunkStore
+from app.services.citation_index import CitationIndex
+from app.services.corpus_version import (
+    VERSION_DIRECTORY_PATTERN, compute_corpus_version, read_corpus_info, remove_version_directories, stamp_corpus_version,
+    versioned_directory,
+)
 import fitz  # PyMuPDF
-import pickle
-import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from langchain.schema import Document
 from sentence_transformers import SentenceTransformer
 from langchain_chroma import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+# --- CÁC REGEX ĐƯỢC BIÊN DỊCH SẴN (dùng lại cho mọi trang / mọi file) ---
+
+PAGE_NUMBER_PATTERN = re.compile(r"^\s*\d+\s*$", re.MULTILINE)
+PAGE_HEADER_PATTERN = re.compile(r"^(CÔNG BÁO|DỰ THẢO|Luật số).*?\n", re.IGNORECASE | re.MULTILINE)
+SIGNED_BY_PATTERN = re.compile(r"Ký bởi:.*?\+07:00", re.DOTALL | re.IGNORECASE)
+RECIPIENTS_PATTERN = re.compile(r'Nơi nhận:.*?$(.*?\n)*?(TM\. CHÍNH PHỦ|KT\. THỦ TƯỚNG).*?$', re.DOTALL | re.MULTILINE)
+SIGNER_PATTERN = re.compile(r'Người ký:.*?(\n|$)', re.DOTALL)
+MULTI_SPACE_PATTERN = re.compile(r'[ \t]{2,}')
+MULTI_NEWLINE_PATTERN = re.compile(r'\n{3,}')
+
+ARTICLE_SPLIT_PATTERN = re.compile(r'(?=\nChương\s+[IVXLCDM\d]+|\nĐiều\s+\d+)')
+CHUONG_PATTERN = re.compile(r'Chương\s+([IVXLCDM\d]+)\.?\s*(.*)', re.IGNORECASE)
+DIEU_PATTERN = re.compile(r'Điều\s+(\d+)\.?:?\s*(.*)', re.IGNORECASE)
+
 # --- CÁC HÀM TIỆN ÍCH CHO VIỆC XỬ LÝ VĂN BẢN ---
 
 def join_broken_lines(text: str) -> str:
@@ -32,27 +55,37 @@ def join_broken_lines(text: str) -> str:
         i += 1
     return "\n".join(result_lines)
 
+def clean_page_text(page_text: str) -> str:
+    """Loại bỏ số trang, header công báo, chữ ký số và phần nơi nhận của một trang."""
+    page_text = PAGE_NUMBER_PATTERN.sub("", page_text)
+    page_text = PAGE_HEADER_PATTERN.sub("", page_text)
+    page_text = SIGNED_BY_PATTERN.sub("", page_text)
+    page_text = RECIPIENTS_PATTERN.sub('', page_text)
+    page_text = SIGNER_PATTERN.sub('', page_text)
+    return page_text
+
+def extract_clean_pages(pdf_path: str, start_page: int = 0, end_page: Optional[int] = None) -> List[str]:
+    """Trích xuất và làm sạch các trang [start_page, end_page) của một file PDF."""
+    with fitz.open(pdf_path) as doc:
+        end_page = doc.page_count if end_page is None else min(end_page, doc.page_count)
+        return [clean_page_text(doc[page_no].get_text("text")) for page_no in range(start_page, end_page)]
+
+def finalize_text(page_texts: List[str]) -> str:
+    """Ghép các trang đã làm sạch (dùng list + join thay vì cộng chuỗi) và chuẩn hóa khoảng trắng."""
+    full_text = "".join(page_text + "\n" for page_text in page_texts)
+    full_text = join_broken_lines(full_text)
+    full_text = MULTI_SPACE_PATTERN.sub(' ', full_text)
+    full_text = MULTI_NEWLINE_PATTERN.sub('\n\n', full_text).strip()
+    return full_text
+
 def extract_and_clean_text(pdf_path: str) -> str:
     """Trích xuất và làm sạch văn bản từ một file PDF."""
-    full_text = ""
     try:
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                page_text = page.get_text("text")
-                page_text = re.sub(r"^\s*\d+\s*$", "", page_text, flags=re.MULTILINE)
-                page_text = re.sub(r"^(CÔNG BÁO|DỰ THẢO|Luật số).*?\n", "", page_text, flags=re.IGNORECASE | re.MULTILINE)
-                page_text = re.sub(r"Ký bởi:.*?\+07:00", "", page_text, flags=re.DOTALL | re.IGNORECASE)
-                page_text = re.sub(r'Nơi nhận:.*?$(.*?\n)*?(TM\. CHÍNH PHỦ|KT\. THỦ TƯỚNG).*?$', '', page_text, flags=re.DOTALL | re.MULTILINE)
-                page_text = re.sub(r'Người ký:.*?(\n|$)', '', page_text, flags=re.DOTALL)
-                full_text += page_text + "\n"
+        page_texts = extract_clean_pages(pdf_path)
     except Exception as e:
         print(f"❌ Lỗi khi xử lý PDF '{os.path.basename(pdf_path)}': {e}")
         return ""
-
-    full_text = join_broken_lines(full_text)
-    full_text = re.sub(r'[ \t]{2,}', ' ', full_text)
-    full_text = re.sub(r'\n{3,}', '\n\n', full_text).strip()
-    return full_text
+    return finalize_text(page_texts)
 
 def extract_document_details(filename: str) -> Dict[str, Any]:
     """Trích xuất loại văn bản, số hiệu và ngày ban hành từ tên file để làm metadata."""
@@ -104,18 +137,18 @@ def split_law_document_semantically(cleaned_full_text: str, source_filename: str
     )
 
     # Tách toàn bộ văn bản thành các Điều
-    articles = re.split(r'(?=\nChương\s+[IVXLCDM\d]+|\nĐiều\s+\d+)', cleaned_full_text)
+    articles = ARTICLE_SPLIT_PATTERN.split(cleaned_full_text)
     
     for text_block in articles:
         text_block = text_block.strip()
         if not text_block: continue
 
-        chuong_match = re.match(r'Chương\s+([IVXLCDM\d]+)\.?\s*(.*)', text_block, re.IGNORECASE)
+        chuong_match = CHUONG_PATTERN.match(text_block)
         if chuong_match:
             current_chuong = f"Chương {chuong_match.group(1)} - {chuong_match.group(2).strip()}"
             continue
 
-        dieu_match = re.match(r'Điều\s+(\d+)\.?:?\s*(.*)', text_block, re.IGNORECASE)
+        dieu_match = DIEU_PATTERN.match(text_block)
         if not dieu_match: continue
 
         dieu_so = dieu_match.group(1)
@@ -141,87 +174,385 @@ def split_law_document_semantically(cleaned_full_text: str, source_filename: str
             
     return documents
 
+# --- XỬ LÝ SONG SONG NHIỀU FILE / NHIỀU TRANG ---
+
+def _extract_pages_task(task) -> Optional[List[str]]:
+    """Tác vụ chạy trong process pool: trích xuất + làm sạch một dải trang."""
+    pdf_path, start_page, end_page = task
+    try:
+        return extract_clean_pages(pdf_path, start_page, end_page)
+    except Exception as e:
+        print(f"❌ Lỗi khi xử lý PDF '{os.path.basename(pdf_path)}' (trang {start_page}-{end_page}): {e}")
+        return None
+
+def _split_task(task) -> List[Document]:
+    """Tác vụ chạy trong process pool: ghép các trang và chia văn bản thành chunks."""
+    page_texts, source_filename = task
+    cleaned_text = finalize_text(page_texts)
+    if not cleaned_text:
+        return []
+    return split_law_document_semantically(cleaned_text, source_filename)
+
+def process_pdfs(pdf_files: List[Path], workers: int = 1, pages_per_task: int = 20) -> List[List[Document]]:
+    """
+    Trích xuất, làm sạch và chia chunk cho danh sách PDF, trả về chunks của từng file theo đúng thứ tự đầu vào.
+    Với workers > 1, các dải trang (file lớn được chia nhỏ theo `pages_per_task`) và bước chia chunk
+    được chạy trên process pool; executor.map giữ nguyên thứ tự nên kết quả vẫn tất định.
+    """
+    if workers <= 1:
+        results = []
+        for pdf_path in pdf_files:
+            print(f"⚙️ Đang xử lý file: {pdf_path.name}")
+            cleaned_text = extract_and_clean_text(str(pdf_path))
+            results.append(split_law_document_semantically(cleaned_text, pdf_path.name) if cleaned_text else [])
+        return results
+
+    tasks, owners = [], []
+    for file_index, pdf_path in enumerate(pdf_files):
+        try:
+            with fitz.open(str(pdf_path)) as doc:
+                page_count = doc.page_count
+        except Exception as e:
+            print(f"❌ Lỗi khi mở PDF '{pdf_path.name}': {e}")
+            continue
+        for start_page in range(0, page_count, pages_per_task):
+            tasks.append((str(pdf_path), start_page, start_page + pages_per_task))
+            owners.append(file_index)
+
+    print(f"⚙️ Đang xử lý {len(pdf_files)} file ({len(tasks)} dải trang) với {workers} process...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pages_per_file: List[Optional[List[str]]] = [[] for _ in pdf_files]
+        for file_index, page_texts in zip(owners, executor.map(_extract_pages_task, tasks)):
+            if page_texts is None or pages_per_file[file_index] is None:
+                pages_per_file[file_index] = None  # Một dải trang lỗi -> bỏ qua cả file như khi chạy tuần tự
+            else:
+                pages_per_file[file_index].extend(page_texts)
+
+        split_tasks = [(page_texts or [], pdf_path.name) for page_texts, pdf_path in zip(pages_per_file, pdf_files)]
+        return list(executor.map(_split_task, split_tasks))
+
+# --- MANIFEST: HASH NỘI DUNG PDF VÀ CHUNK ID CỦA TỪNG FILE ---
+
+def file_sha256(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def load_manifest(manifest_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_manifest(manifest_path: str, manifest: Dict[str, Any]) -> None:
+    Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+# --- CÁC BƯỚC DÙNG CHUNG CHO BUILD TOÀN BỘ VÀ BUILD TĂNG DẦN ---
+
+def filter_chunks(chunks: List[Document]) -> List[Document]:
+    """Lọc chunks rác: chỉ giữ chunk có hơn 8 từ."""
+    return [chunk for chunk in chunks if len(chunk.page_content.split()) > 8]
+
+def chunk_pdf_files(pdf_files: List[Path], manifest: Dict[str, Any], workers: int, pages_per_task: int) -> List[Document]:
+    """Xử lý các PDF, lọc chunks, gán chunk id mới (tăng dần) và ghi vào manifest; trả về các chunks mới."""
+    new_chunks = []
+    per_file_chunks = process_pdfs(pdf_files, workers=workers, pages_per_task=pages_per_task)
+    for pdf_path, chunks in zip(pdf_files, per_file_chunks):
+        kept = filter_chunks(chunks)
+        chunk_ids = []
+        for chunk in kept:
+            chunk.metadata["chunk_id"] = manifest["next_chunk_id"]
+            chunk_ids.append(manifest["next_chunk_id"])
+            manifest["next_chunk_id"] += 1
+        manifest["files"][pdf_path.name] = {"sha256": file_sha256(pdf_path), "chunk_ids": chunk_ids}
+        new_chunks.extend(kept)
+        if chunks:
+            print(f"✅ Đã chia thành công {len(chunks)} chunks ({len(kept)} chunks chất lượng) từ file {pdf_path.name}.")
+    return new_chunks
+
+def save_chunk_store_and_bm25(chunks: List[Document], chunk_store_path: str, bm25_index_path: str) -> None:
+    """Ghi kho chunk và BM25 Index (ghi ra thư mục tạm rồi mới thay thế thư mục cũ)."""
+    for path, writer in (
+        (chunk_store_path, lambda tmp: ChunkStore.from_documents(chunks).save(tmp)),
+        (bm25_index_path, lambda tmp: SparseBM25Index.from_tokenized_corpus(
+            [bm25_tokenize(chunk.page_content) for chunk in chunks]).save(tmp)),
+    ):
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        writer(tmp_path)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    print(f"✅ Đã lưu {len(chunks)} chunks vào kho chunk '{chunk_store_path}' và BM25 Index '{bm25_index_path}'.")
+
+def save_citation_index(chunks: List[Document], citation_index_path: str) -> None:
+    """Ghi index trích dẫn (loại văn bản, số hiệu, số Điều) -> chunk id cho đường tắt câu hỏi trích dẫn."""
+    citation_index = CitationIndex.from_metadata((chunk.metadata["chunk_id"], chunk.metadata) for chunk in chunks)
+    citation_index.save(citation_index_path)
+    print(f"✅ Đã lưu index trích dẫn ({len(citation_index)} Điều) vào '{citation_index_path}'.")
+
+def load_embedding_function() -> SentenceTransformerEmbeddings:
+    # Tải model embedding từ local (chỉ cần cho bước tạo Vector Store)
+    embedding_model_path = "models/bkai-foundation-models_vietnamese-bi-encoder"
+    print(f"   - Tải embedding model từ: {embedding_model_path}")
+    embedding_model = SentenceTransformer(embedding_model_path)
+    return SentenceTransformerEmbeddings(embedding_model)
+
+def embed_into_vector_store(vector_store: Chroma, chunks: List[Document], checkpoint_path: str,
+                            batch_size: int = 256) -> None:
+    """
+    Embedding và ghi chunks vào Chroma theo từng batch cố định thay vì một lần cho toàn bộ corpus.
+    Sau mỗi batch, tiến độ được ghi vào file checkpoint (gắn với phiên bản của danh sách chunks),
+    nên nếu build bị dừng giữa chừng, lần chạy lại sẽ tiếp tục từ batch chưa xong.
+    Chunks được ghi kèm id cố định nên ghi lại một batch dở dang cũng không tạo bản trùng.
+    """
+    version = compute_corpus_version(chunks)
+    checkpoint = load_manifest(checkpoint_path) or {}
+    done = resumed_from = checkpoint.get("done", 0) if checkpoint.get("version") == version else 0
+    if done:
+        print(f"   - Tiếp tục từ checkpoint: đã embedding {done}/{len(chunks)} chunks.")
+
+    started_at = time.perf_counter()
+    for start in range(done, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        vector_store.add_texts(
+            texts=[chunk.page_content for chunk in batch],
+            metadatas=[chunk.metadata for chunk in batch],
+            ids=[str(chunk.metadata["chunk_id"]) for chunk in batch],
+        )
+        done = start + len(batch)
+        save_manifest(checkpoint_path, {"version": version, "done": done, "total": len(chunks)})
+        elapsed = time.perf_counter() - started_at
+        rate = (done - resumed_from) / elapsed if elapsed else 0.0
+        print(f"   - Đã embedding {done}/{len(chunks)} chunks ({rate:.1f} chunks/giây)")
+
+    # Build xong thì xóa checkpoint để lần build sau bắt đầu lại từ đầu
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+def stamp_new_corpus_version(chunks: List[Document], corpus_version_path: str,
+                             previous_version: Optional[str] = None) -> None:
+    """
+    Đóng dấu phiên bản corpus để server biết index đã thay đổi (ví dụ: xóa cache câu trả lời).
+    `previous_version` được ghi lại để lần build sau không xóa thư mục Vector Store server có thể vẫn đang đọc.
+    """
+    version = compute_corpus_version(chunks)
+    if previous_version == version:
+        previous_version = read_corpus_info(corpus_version_path).get("previous_version")
+    stamp_corpus_version(corpus_version_path, version, num_chunks=len(chunks), previous_version=previous_version)
+    print(f"✅ Phiên bản corpus mới: {version} (lưu tại '{corpus_version_path}')")
+
 # --- HÀM ĐIỀU PHỐI CHÍNH ---
 
-def process_and_save_data(pdf_dir: str, all_chunks_path: str, json_all_chunks_path: str, vector_store_path: str):
-    """Xử lý tất cả PDF, lưu danh sách các chunks ra file pickle và JSON."""
+def process_and_save_data(pdf_dir: str, chunk_store_path: str, vector_store_path: str,
+                          corpus_version_path: Optional[str] = None, bm25_index_path: Optional[str] = None,
+                          manifest_path: Optional[str] = None, workers: int = 1, pages_per_task: int = 20,
+                          embed_batch_size: int = 256, citation_index_path: Optional[str] = None):
+    """Xử lý tất cả PDF, lưu các chunks vào kho chunk dạng cột, BM25 Index và Vector Store."""
     print("🚀 Bắt đầu quá trình xử lý dữ liệu...")
     
-    Path(all_chunks_path).parent.mkdir(parents=True, exist_ok=True)
-    Path(json_all_chunks_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(chunk_store_path).parent.mkdir(parents=True, exist_ok=True)
+    corpus_version_path = corpus_version_path or str(Path(chunk_store_path).parent / "corpus_version.json")
+    bm25_index_path = bm25_index_path or str(Path(chunk_store_path).parent / "bm25")
+    manifest_path = manifest_path or str(Path(chunk_store_path).parent / "manifest.json")
+    citation_index_path = citation_index_path or str(Path(chunk_store_path).parent / "citation_index.json")
     
     pdf_files = sorted(list(Path(pdf_dir).glob("*.pdf")))
     if not pdf_files:
         print(f"⚠️ Không tìm thấy file PDF nào trong thư mục '{pdf_dir}'")
         return
 
-    all_chunks = []
-    for pdf_path in pdf_files:
-        print(f"⚙️ Đang xử lý file: {pdf_path.name}")
-        cleaned_text = extract_and_clean_text(str(pdf_path))
-        if cleaned_text:
-            chunks = split_law_document_semantically(cleaned_text, pdf_path.name)
-            all_chunks.extend(chunks)
-            print(f"✅ Đã chia thành công {len(chunks)} chunks từ file {pdf_path.name}.")
-
-     # --- BƯỚC LỌC CHUNKS RÁC ---
-    print(f"\nLọc {len(all_chunks)} chunks thô...")
-    final_chunks = [
-        chunk for chunk in all_chunks 
-        if len(chunk.page_content.split()) > 8 # Chỉ giữ chunk có hơn 8 từ
-    ]
-    print(f"✅ Đã lọc, còn lại {len(final_chunks)} chunks chất lượng.")
-
-    # --- LƯU CÁC CHUNKS ĐÃ LỌC ---
-    with open(all_chunks_path, "wb") as f:
-        pickle.dump(final_chunks, f)
-    
-    json_data = [{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in final_chunks]
-    with open(json_all_chunks_path, "w", encoding="utf-8") as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=4)
-        
-    print(f"\nĐã lưu {len(final_chunks)} chunks vào '{all_chunks_path}' và '{json_all_chunks_path}'.")
+    # --- XỬ LÝ, LỌC CHUNKS RÁC VÀ GÁN CHUNK ID ỔN ĐỊNH (dùng chung cho Chroma, BM25 và các cache) ---
+    manifest = {"next_chunk_id": 0, "files": {}}
+    final_chunks = chunk_pdf_files(pdf_files, manifest, workers=workers, pages_per_task=pages_per_task)
+    print(f"✅ Tổng cộng {len(final_chunks)} chunks chất lượng.")
 
     # ====================================================================
     # <<< LOGIC TẠO VÀ LƯU TRỮ CHROMA DB VĨNH VIỄN >>>
     # ====================================================================
     print("\n⚙️ Bắt đầu tạo Vector Store (ChromaDB)...")
 
-    # 1. Xóa thư mục vector store cũ để đảm bảo tạo mới hoàn toàn
-    if os.path.exists(vector_store_path):
-        print(f"   - Tìm thấy thư mục Vector Store cũ. Đang xóa: {vector_store_path}")
-        shutil.rmtree(vector_store_path)
-    
-    # 2. Tải model embedding (chỉ cần cho bước này)
-    # Tải model embedding từ local
-    embedding_model_path = "models/bkai-foundation-models_vietnamese-bi-encoder"
-    print(f"   - Tải embedding model từ: {embedding_model_path}")
-    embedding_model = SentenceTransformer(embedding_model_path)
-    langchain_embedding = SentenceTransformerEmbeddings(embedding_model)
-
-    # 3. Tạo ChromaDB từ các chunks và lưu nó vào đĩa
-    print(f"   - Đang embedding và tạo database tại: {vector_store_path}")
-    vector_store = Chroma.from_documents(
-        documents=final_chunks,
-        embedding=langchain_embedding,
-        persist_directory=vector_store_path # <-- Chỉ định thư mục lưu trữ
-    )
-    
-    # Dòng này không cần thiết với phiên bản Chroma mới, from_documents đã tự lưu
-    # vector_store.persist() 
+    # 1. Mỗi phiên bản corpus được build vào thư mục riêng <vector_store>/<version>, không đụng tới thư mục
+    #    server đang đọc (bản hiện tại, và bản trước đó trong lúc chờ gỡ sau khi reload); chỉ dọn các bản khác
+    version = compute_corpus_version(final_chunks)
+    corpus_info = read_corpus_info(corpus_version_path)
+    current_version = corpus_info.get("version")
+    remove_version_directories(vector_store_path, keep={version, current_version, corpus_info.get("previous_version")})
+    version_store_path = os.path.join(vector_store_path, version)
+    embed_checkpoint_path = f"{version_store_path}.checkpoint.json"
+
+    # Đúng bộ chunks này đã được build xong (không còn checkpoint): không cần embedding lại.
+    # Có checkpoint của đúng bộ chunks này: tiếp tục build dở dang. Còn lại: xóa thư mục dở dang, build mới.
+    checkpoint = load_manifest(embed_checkpoint_path)
+    already_built = os.path.isdir(version_store_path) and checkpoint is None and version == current_version
+    resuming = os.path.isdir(version_store_path) and (checkpoint or {}).get("version") == version
+    if os.path.isdir(version_store_path) and not (already_built or resuming):
+        print(f"   - Tìm thấy thư mục build dở dang. Đang xóa: {version_store_path}")
+        shutil.rmtree(version_store_path)
+    if not (already_built or resuming):
+        # Checkpoint được ghi trước khi tạo thư mục: thư mục không có checkpoint nghĩa là đã build xong
+        save_manifest(embed_checkpoint_path, {"version": version, "done": 0, "total": len(final_chunks)})
+
+    if already_built:
+        print(f"   - Vector Store của phiên bản {version} đã có sẵn tại: {version_store_path}")
+    else:
+        # 2. Tải model embedding (chỉ cần cho bước này)
+        langchain_embedding = load_embedding_function()
+
+        # 3. Embedding theo batch và ghi dần vào ChromaDB trên đĩa
+        print(f"   - Đang embedding và tạo database tại: {version_store_path}")
+        vector_store = Chroma(
+            embedding_function=langchain_embedding,
+            persist_directory=version_store_path # <-- Chỉ định thư mục lưu trữ
+        )
+        embed_into_vector_store(vector_store, final_chunks, embed_checkpoint_path, batch_size=embed_batch_size)
 
     print("✅ Đã tạo và lưu trữ thành công Vector Store trên đĩa!")
+
+    # 4. Lưu kho chunk dạng cột và BM25 Index (server sẽ memory-map thay vì tạo lại khi khởi động),
+    #    chỉ sau khi Vector Store đã build xong để các index luôn khớp nhau
+    save_chunk_store_and_bm25(final_chunks, chunk_store_path, bm25_index_path)
+    save_citation_index(final_chunks, citation_index_path)
+
+    # 5. Lưu manifest (dùng cho build tăng dần) và đóng dấu phiên bản corpus
+    save_manifest(manifest_path, manifest)
+    stamp_new_corpus_version(final_chunks, corpus_version_path, previous_version=current_version)
     print("\n🎉 HOÀN TẤT TOÀN BỘ QUÁ TRÌNH XỬ LÝ DỮ LIỆU!")
 
+def update_data(pdf_dir: str, chunk_store_path: str, vector_store_path: str,
+                corpus_version_path: Optional[str] = None, bm25_index_path: Optional[str] = None,
+                manifest_path: Optional[str] = None, workers: int = 1, pages_per_task: int = 20,
+                embed_batch_size: int = 256, citation_index_path: Optional[str] = None):
+    """
+    Build tăng dần: so sánh hash nội dung các PDF với manifest, chỉ xử lý và embedding
+    các file mới/thay đổi, xóa chunks của file đã bị xóa/thay đổi khỏi Chroma và kho chunk.
+    BM25 Index được tạo lại từ kho chunk (IDF và độ dài trung bình là thống kê toàn corpus,
+    nên trọng số của mọi tài liệu đều đổi khi thêm/xóa file; bước này không cần model nên rất nhanh).
+    """
+    corpus_version_path = corpus_version_path or str(Path(chunk_store_path).parent / "corpus_version.json")
+    bm25_index_path = bm25_index_path or str(Path(chunk_store_path).parent / "bm25")
+    manifest_path = manifest_path or str(Path(chunk_store_path).parent / "manifest.json")
+    citation_index_path = citation_index_path or str(Path(chunk_store_path).parent / "citation_index.json")
+
+    manifest = load_manifest(manifest_path)
+    corpus_info = read_corpus_info(corpus_version_path)
+    current_version = corpus_info.get("version")
+    current_store_path = versioned_directory(vector_store_path, current_version)
+    if (manifest is None or not ChunkStore.exists(chunk_store_path)
+            or not os.path.exists(os.path.join(current_store_path, "chroma.sqlite3"))):
+        print("⚠️ Chưa có manifest hoặc index trước đó, chuyển sang build toàn bộ.")
+        return process_and_save_data(pdf_dir, chunk_store_path, vector_store_path, corpus_version_path,
+                                     bm25_index_path, manifest_path, workers=workers, pages_per_task=pages_per_task,
+                                     embed_batch_size=embed_batch_size, citation_index_path=citation_index_path)
+
+    print("🚀 Bắt đầu cập nhật dữ liệu tăng dần...")
+    pdf_files = {pdf_path.name: pdf_path for pdf_path in sorted(Path(pdf_dir).glob("*.pdf"))}
+    known_files = manifest["files"]
+    removed = sorted(name for name in known_files if name not in pdf_files)
+    changed = sorted(name for name, pdf_path in pdf_files.items()
+                     if name in known_files and known_files[name]["sha256"] != file_sha256(pdf_path))
+    added = sorted(name for name in pdf_files if name not in known_files)
+    print(f"   - Thêm mới: {len(added)}, thay đổi: {len(changed)}, bị xóa: {len(removed)}")
+    if not (added or changed or removed):
+        print("✅ Không có thay đổi nào, index vẫn là bản mới nhất.")
+        return
+
+    # 1. Xác định các chunk cần xóa (của file bị xóa hoặc thay đổi)
+    # Chỉ manifest mới quyết định chunk id nào đã được cấp: kho chunk có id >= next_chunk_id là dư thừa
+    # của một lần chạy trước bị lỗi giữa chừng (các id này sẽ được cấp lại cho đúng các chunk mới bên dưới)
+    committed_next_chunk_id = manifest["next_chunk_id"]
+    stale_ids = set()
+    for name in removed + changed:
+        stale_ids.update(known_files.pop(name)["chunk_ids"])
+
+    # 2. Xử lý các file mới/thay đổi, chunk id mới tiếp nối next_chunk_id nên ids vẫn tăng dần
+    new_chunks = chunk_pdf_files([pdf_files[name] for name in added + changed], manifest,
+                                 workers=workers, pages_per_task=pages_per_task)
+
+    # 3. Danh sách chunks mới của corpus (ids vẫn tăng dần, không trùng)
+    old_store = ChunkStore.load(chunk_store_path)
+    kept_chunks = [old_store.get_document(row) for row in range(len(old_store))
+                   if old_store.chunk_id(row) not in stale_ids and old_store.chunk_id(row) < committed_next_chunk_id]
+    all_chunks = kept_chunks + new_chunks
+
+    version = compute_corpus_version(all_chunks)
+    if version == current_version:
+        save_manifest(manifest_path, manifest)
+        print("✅ Nội dung corpus không đổi, index vẫn là bản mới nhất.")
+        return
+
+    # 4. Phiên bản mới được build trong thư mục riêng, là bản sao của thư mục server đang đọc, rồi mới
+    #    xóa/upsert đúng các chunk liên quan - trước khi ghi đè bất kỳ file index nào, để nếu bước này lỗi
+    #    thì kho chunk, BM25, manifest và Vector Store đang phục vụ vẫn là bản cũ và có thể chạy lại an toàn
+    remove_version_directories(vector_store_path, keep={version, current_version, corpus_info.get("previous_version")})
+    version_store_path = os.path.join(vector_store_path, version)
+    embed_checkpoint_path = f"{version_store_path}.checkpoint.json"
+    if not (os.path.isdir(version_store_path) and os.path.exists(embed_checkpoint_path)):
+        if os.path.isdir(version_store_path):
+            shutil.rmtree(version_store_path)
+        # Dữ liệu cũ (chưa phân phiên bản) nằm ngay tại thư mục gốc: bỏ qua các thư mục phiên bản khi sao chép
+        shutil.copytree(current_store_path, version_store_path, ignore=lambda directory, names: [
+            name for name in names
+            if directory == current_store_path == vector_store_path
+            and (VERSION_DIRECTORY_PATTERN.fullmatch(name) or name.endswith(".checkpoint.json"))
+        ])
+        save_manifest(embed_checkpoint_path, {"version": compute_corpus_version(new_chunks), "done": 0,
+                                              "total": len(new_chunks)})
+        print(f"   - Đã sao chép Vector Store phiên bản {current_version} sang: {version_store_path}")
+
+    vector_store = Chroma(persist_directory=version_store_path, embedding_function=load_embedding_function())
+    if stale_ids:
+        vector_store.delete(ids=[str(chunk_id) for chunk_id in sorted(stale_ids)])
+        print(f"   - Đã xóa {len(stale_ids)} chunks cũ khỏi Vector Store.")
+    if new_chunks:
+        embed_into_vector_store(vector_store, new_chunks, embed_checkpoint_path, batch_size=embed_batch_size)
+        print(f"   - Đã thêm {len(new_chunks)} chunks mới vào Vector Store.")
+    if os.path.exists(embed_checkpoint_path):
+        os.remove(embed_checkpoint_path)
+
+    # 5. Chroma đã xong: ghi kho chunk + BM25 + index trích dẫn, rồi manifest và phiên bản corpus mới
+    save_chunk_store_and_bm25(all_chunks, chunk_store_path, bm25_index_path)
+    save_citation_index(all_chunks, citation_index_path)
+    save_manifest(manifest_path, manifest)
+    stamp_new_corpus_version(all_chunks, corpus_version_path, previous_version=current_version)
+    print("\n🎉 HOÀN TẤT CẬP NHẬT DỮ LIỆU TĂNG DẦN!")
+
 if __name__ == "__main__":
+    import argparse
     import sys
     sys.path.append(os.getcwd())
     from app.core.config import settings
 
+    parser = argparse.ArgumentParser(description="Xử lý PDF và xây dựng các index cho RAG service.")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS,
+                        help="Số process xử lý PDF song song (0 = số CPU, 1 = tuần tự).")
+    parser.add_argument("--pages-per-task", type=int, default=settings.INGEST_PAGES_PER_TASK,
+                        help="Số trang mỗi tác vụ khi chia nhỏ các file PDF lớn.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Chỉ xử lý các PDF mới/thay đổi/bị xóa so với manifest thay vì build lại toàn bộ.")
+    parser.add_argument("--embed-batch-size", type=int, default=settings.EMBED_BATCH_SIZE,
+                        help="Số chunks embedding và ghi vào Vector Store mỗi batch (có checkpoint sau mỗi batch).")
+    args = parser.parse_args()
+
     print("Chạy data_loader như một script độc lập...")
-    process_and_save_data(
+    build = update_data if args.incremental else process_and_save_data
+    build(
         pdf_dir=settings.PDF_DIRECTORY,
-        all_chunks_path=settings.ALL_CHUNKS_PATH,
-        json_all_chunks_path=settings.ALL_CHUNKS_JSON_PATH,
-        vector_store_path=settings.VECTOR_STORE_DIRECTORY
-    )
\ No newline at end of file
+        chunk_store_path=settings.CHUNK_STORE_DIRECTORY,
+        vector_store_path=settings.VECTOR_STORE_DIRECTORY,
+        corpus_version_path=settings.CORPUS_VERSION_PATH,
+        bm25_index_path=settings.BM25_INDEX_DIRECTORY,
+        manifest_path=settings.INGEST_MANIFEST_PATH,
+        workers=args.workers or os.cpu_count() or 1,
+        pages_per_task=args.pages_per_task,
+        embed_batch_size=args.embed_batch_size,
+        citation_index_path=settings.CITATION_INDEX_PATH
+    )
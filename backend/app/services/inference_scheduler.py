@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Sequence
+
+
+@dataclass
+class _BatchRequest:
+    items: List[Any]
+    future: Future = field(default_factory=Future)
+
+
+class MicroBatcher:
+    """
+    Gom các yêu cầu inference (rerank, embedding câu truy vấn) từ nhiều request đồng thời.
+    Một luồng riêng chờ tối đa `max_wait_ms` (hoặc đến khi đủ `max_batch_size` phần tử),
+    chạy một lần forward pass trên model dùng chung rồi trả kết quả về từng request qua Future.
+    Khi dừng, các yêu cầu còn trong hàng đợi nhận lỗi thay vì chờ mãi.
+    """
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        name: str = "inference",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[_BatchRequest | None]" = queue.Queue()
+        # Khóa giữa submit và shutdown: không yêu cầu nào lọt vào hàng đợi sau khi đã dừng
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, items: List[Any]) -> Future:
+        request = _BatchRequest(items=list(items))
+        if not request.items:
+            request.future.set_result([])
+            return request.future
+        with self._submit_lock:
+            if self._closed:
+                request.future.set_exception(self._closed_error())
+            else:
+                self._queue.put(request)
+        return request.future
+
+    def run(self, items: List[Any]) -> List[Any]:
+        """Gửi yêu cầu và chờ kết quả (gọi từ các luồng của inference executor)."""
+        return self.submit(items).result()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def shutdown(self) -> None:
+        """Dừng luồng batcher; batch đang chạy vẫn hoàn tất, các yêu cầu còn chờ nhận RuntimeError."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._fail_pending()
+        self._queue.put(None)
+
+    def _closed_error(self) -> RuntimeError:
+        return RuntimeError(f"Micro-batcher '{self.name}' đã dừng.")
+
+    def _fail_pending(self) -> None:
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request.future.set_exception(self._closed_error())
+
+    def _collect(self, first: _BatchRequest):
+        batch = [first]
+        size = len(first.items)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            size += len(request.items)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._fail_pending()
+                return
+            batch, stop = self._collect(first)
+            self._execute(batch)
+            if stop:
+                self._fail_pending()
+                return
+
+    def _execute(self, batch: List[_BatchRequest]) -> None:
+        all_items = [item for request in batch for item in request.items]
+        try:
+            outputs = self.batch_fn(all_items)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(all_items)
+        offset = 0
+        for request in batch:
+            n = len(request.items)
+            request.future.set_result(outputs[offset:offset + n])
+            offset += n
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queue_depth": self.queue_depth(),
+        }
@@ -0,0 +1,142 @@
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+
+LLM_PROVIDERS = ("gemini", "offline")
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+# Nhận diện prompt của hai chain (xem CONDENSE_QUESTION_PROMPT và RAG_PROMPT trong rag_service)
+FOLLOW_UP_PATTERN = re.compile(r"Câu hỏi tiếp theo:\s*(.+?)\s*(?:\n|$)")
+RAG_QUESTION_PATTERN = re.compile(r"\*\*CÂU HỎI:\*\*\s*(.+?)\s*(?:\n|$)")
+SOURCE_PATTERN = re.compile(r"Trích từ:\s*([^,\n]+)[^\n]*\n+\s*(Điều\s+\d+)")
+STREAM_TOKEN_PATTERN = re.compile(r"\S+\s*")
+
+OFFLINE_ANSWER_TEMPLATE = "Dựa trên các tài liệu được cung cấp, về câu hỏi \"{question}\": {citations}"
+OFFLINE_NO_SOURCE_ANSWER = "Dựa trên các tài liệu được cung cấp, tôi không tìm thấy thông tin cụ thể về {question}."
+
+
+class OfflineChatModel(BaseChatModel):
+    """
+    LLM giả lập chạy offline, tất định - dùng cho load test/benchmark không cần API key và mạng.
+    - Prompt viết lại câu hỏi: trả về nguyên câu hỏi tiếp theo.
+    - Prompt trả lời: trả về câu trả lời theo mẫu, trích dẫn các Điều có trong ngữ cảnh.
+    Độ trễ mô phỏng theo phân phối cấu hình được (seed cố định), streaming từng token với độ trễ mỗi token.
+    """
+    latency_ms: float = 800.0
+    jitter_ms: float = 200.0
+    distribution: str = "lognormal"
+    token_delay_ms: float = 10.0
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _rng_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Phân phối độ trễ không hợp lệ: '{self.distribution}' (hỗ trợ: {', '.join(LATENCY_DISTRIBUTIONS)})")
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline"
+
+    def sample_latency(self) -> float:
+        """Độ trễ (giây) trước token đầu tiên, lấy mẫu theo phân phối đã cấu hình."""
+        mean, jitter = self.latency_ms, self.jitter_ms
+        with self._rng_lock:
+            if self.distribution == "fixed" or jitter <= 0 or mean <= 0:
+                value = mean
+            elif self.distribution == "uniform":
+                value = self._rng.uniform(mean - jitter, mean + jitter)
+            elif self.distribution == "normal":
+                value = self._rng.gauss(mean, jitter)
+            else:
+                # Lognormal với kỳ vọng = mean và độ lệch chuẩn = jitter (đuôi dài giống API thật)
+                sigma = math.sqrt(math.log(1 + (jitter / mean) ** 2))
+                value = self._rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        return max(value, 0.0) / 1000.0
+
+    @staticmethod
+    def _respond(messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        follow_up = FOLLOW_UP_PATTERN.search(prompt)
+        if follow_up:
+            return follow_up.group(1)
+        question_match = RAG_QUESTION_PATTERN.search(prompt)
+        question = question_match.group(1) if question_match else prompt.strip().splitlines()[-1] if prompt.strip() else ""
+        citations = []
+        for document, article in SOURCE_PATTERN.findall(prompt):
+            citation = f"(theo {article} của {document.strip()})"
+            if citation not in citations:
+                citations.append(citation)
+        if not citations:
+            return OFFLINE_NO_SOURCE_ANSWER.format(question=question)
+        return OFFLINE_ANSWER_TEMPLATE.format(question=question, citations="; ".join(citations))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.sample_latency())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.sample_latency())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.sample_latency())
+        for token in STREAM_TOKEN_PATTERN.findall(self._respond(messages)):
+            time.sleep(self.token_delay_ms / 1000.0)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.sample_latency())
+        for token in STREAM_TOKEN_PATTERN.findall(self._respond(messages)):
+            await asyncio.sleep(self.token_delay_ms / 1000.0)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def create_llm(provider: Optional[str] = None) -> BaseChatModel:
+    """Tạo LLM cho các chain viết lại câu hỏi và trả lời theo LLM_PROVIDER."""
+    provider = provider or settings.LLM_PROVIDER
+    if provider == "gemini":
+        if not settings.GOOGLE_API_KEY:
+            raise ValueError("LLM_PROVIDER='gemini' cần GOOGLE_API_KEY.")
+        # Import tại đây để provider offline không cần gói langchain_google_genai
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=settings.LLM_MODEL,
+            temperature=settings.LLM_TEMPERATURE,
+            convert_system_message_to_human=True,
+            google_api_key=settings.GOOGLE_API_KEY
+        )
+    if provider == "offline":
+        return OfflineChatModel(
+            latency_ms=settings.OFFLINE_LLM_LATENCY_MS,
+            jitter_ms=settings.OFFLINE_LLM_JITTER_MS,
+            distribution=settings.OFFLINE_LLM_LATENCY_DISTRIBUTION,
+            token_delay_ms=settings.OFFLINE_LLM_TOKEN_DELAY_MS,
+            seed=settings.OFFLINE_LLM_SEED,
+        )
+    raise ValueError(f"LLM provider không hợp lệ: '{provider}' (hỗ trợ: {', '.join(LLM_PROVIDERS)})")
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class LRUCache:
+    """
+    Cache LRU an toàn luồng (dùng chung cho các cache trong RAG service).
+    Hỗ trợ TTL tùy chọn, giới hạn bộ nhớ tùy chọn (theo kích thước do người gọi ước lượng)
+    và đếm số lần hit/miss để theo dõi hiệu quả.
+    """
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, created_at, size = entry
+            if self._expired(created_at):
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> None:
+        if self.max_size <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic(), size)
+            self._bytes += size
+            while len(self._data) > self.max_size or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._data))
+                self._remove(oldest_key)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Key có trong cache và còn hạn hay không (không tính hit/miss, không cập nhật thứ tự LRU)."""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry[1])
+
+    def values(self) -> List[Any]:
+        """Ảnh chụp các giá trị còn hạn (không cập nhật thứ tự LRU)."""
+        with self._lock:
+            return [value for value, created_at, _ in self._data.values() if not self._expired(created_at)]
+
+    def items(self) -> List[tuple]:
+        """Ảnh chụp các cặp (key, value) còn hạn theo thứ tự LRU (cũ -> mới), dùng để lưu ra đĩa."""
+        with self._lock:
+            return [(key, value) for key, (value, created_at, _) in self._data.items() if not self._expired(created_at)]
+
+    def pop(self, key: Hashable) -> None:
+        """Xóa một mục (nếu có)."""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - created_at > self.ttl_seconds
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,161 @@
+"""
+Tạo các bản ONNX (fp32 và int8 lượng tử hóa) của model embedding và reranker trong MODELS_DIRECTORY,
+sau đó đo tốc độ và độ lệch điểm của từng backend so với model fp32 PyTorch trên chính corpus của chúng ta.
+
+    python -m app.services.model_export --quantization avx512_vnni --samples 256
+"""
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sentence_transformers import CrossEncoder, SentenceTransformer, export_dynamic_quantized_onnx_model
+
+from app.core.config import settings
+from app.services.chunk_store import ChunkStore
+from app.services.model_loader import (
+    EMBEDDING_MODEL_FOLDER, RERANKER_MODEL_FOLDER, load_embedding_model, load_reranker
+)
+
+BENCHMARK_QUERIES = [
+    "Mức phạt khi vượt đèn đỏ đối với xe máy là bao nhiêu?",
+    "Không đội mũ bảo hiểm bị phạt bao nhiêu tiền?",
+    "Điều khiển ô tô có nồng độ cồn bị xử phạt thế nào?",
+    "Đi sai làn đường bị phạt bao nhiêu?",
+    "Không có giấy phép lái xe khi điều khiển xe máy bị phạt thế nào?",
+    "Chạy quá tốc độ cho phép từ 10 km/h đến 20 km/h bị phạt bao nhiêu?",
+    "Điều 7 Nghị định 168/2024/NĐ-CP quy định gì?",
+    "Độ tuổi được phép lái xe ô tô là bao nhiêu?",
+]
+
+
+def export_onnx_models(model_path: str, kind: str, quantization: Optional[str]) -> None:
+    """
+    Xuất `onnx/model.onnx` (và `onnx/model_qint8_<quantization>.onnx`) vào thư mục model.
+    Chỉ thư mục con `onnx/` được ghi: config và trọng số fp32 mà backend torch/int8 đọc được giữ nguyên.
+    """
+    model_cls = SentenceTransformer if kind == "embedding" else CrossEncoder
+    print(f"⚙️ Exporting {kind} model to ONNX: {model_path}")
+    # Nếu thư mục model chưa có file ONNX, sentence-transformers tự chuyển đổi khi tải với backend="onnx"
+    model = model_cls(model_path, device="cpu", backend="onnx")
+    onnx_dir = os.path.join(model_path, "onnx")
+    os.makedirs(onnx_dir, exist_ok=True)
+    # Lưu toàn bộ model ra thư mục tạm rồi chỉ chép các file ONNX (kèm dữ liệu ngoài nếu có) sang `onnx/`
+    with tempfile.TemporaryDirectory() as export_dir:
+        model.save_pretrained(export_dir)
+        for directory, _, file_names in os.walk(export_dir):
+            for file_name in file_names:
+                if file_name.endswith((".onnx", ".onnx_data")):
+                    shutil.copy2(os.path.join(directory, file_name), os.path.join(onnx_dir, file_name))
+    if quantization:
+        print(f"   - Quantizing to int8 ({quantization})...")
+        export_dynamic_quantized_onnx_model(model, quantization_config=quantization, model_name_or_path=model_path)
+    del model
+    gc.collect()
+
+
+def sample_corpus(num_samples: int) -> List[str]:
+    """Lấy mẫu đều các chunk trong kho chunk để benchmark."""
+    store = ChunkStore.load(settings.CHUNK_STORE_DIRECTORY)
+    rows = np.linspace(0, len(store) - 1, num=min(num_samples, len(store)), dtype=np.int64)
+    return [store.get_text(int(row)) for row in np.unique(rows)]
+
+
+def _timed(fn) -> Tuple[Any, float]:
+    started_at = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started_at
+
+
+def benchmark_embedding(model_path: str, variants: List[Tuple[str, Optional[str]]], texts: List[str], batch_size: int):
+    results, reference = [], None
+    for backend, onnx_file_name in variants:
+        model = load_embedding_model(model_path, "cpu", backend=backend, onnx_file_name=onnx_file_name)
+        model.encode(texts[:batch_size], batch_size=batch_size, show_progress_bar=False)  # Làm nóng
+        vectors, elapsed = _timed(lambda: model.encode(
+            texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False
+        ))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if reference is None:
+            reference = vectors
+        cosine = np.sum(vectors * reference, axis=1)
+        results.append({
+            "variant": f"{backend}:{onnx_file_name or '-'}",
+            "texts_per_sec": len(texts) / elapsed,
+            "cosine_mean": float(cosine.mean()),
+            "cosine_min": float(cosine.min()),
+        })
+        del model
+        gc.collect()
+    return results
+
+
+def benchmark_reranker(model_path: str, variants: List[Tuple[str, Optional[str]]], texts: List[str], batch_size: int, top_k: int = 5):
+    pairs = [[query, text] for query in BENCHMARK_QUERIES for text in texts]
+    results, reference = [], None
+    for backend, onnx_file_name in variants:
+        reranker = load_reranker(model_path, "cpu", backend=backend, onnx_file_name=onnx_file_name)
+        reranker.predict(pairs[:batch_size], batch_size=batch_size, show_progress_bar=False)  # Làm nóng
+        scores, elapsed = _timed(lambda: reranker.predict(pairs, batch_size=batch_size, show_progress_bar=False))
+        scores = np.asarray(scores, dtype=np.float32).reshape(len(BENCHMARK_QUERIES), len(texts))
+        if reference is None:
+            reference = scores
+        diff = np.abs(scores - reference)
+        # Tỉ lệ top-k của mỗi câu hỏi trùng với top-k của model fp32 (điều thực sự ảnh hưởng tới câu trả lời)
+        top_overlap = np.mean([
+            len(set(np.argsort(-scores[i])[:top_k]) & set(np.argsort(-reference[i])[:top_k])) / top_k
+            for i in range(len(BENCHMARK_QUERIES))
+        ])
+        results.append({
+            "variant": f"{backend}:{onnx_file_name or '-'}",
+            "pairs_per_sec": len(pairs) / elapsed,
+            "abs_diff_mean": float(diff.mean()),
+            "abs_diff_max": float(diff.max()),
+            f"top{top_k}_overlap": float(top_overlap),
+        })
+        del reranker
+        gc.collect()
+    return results
+
+
+def print_report(title: str, results: List[Dict[str, Any]]) -> None:
+    print(f"\n📊 {title}")
+    baseline_speed = None
+    for row in results:
+        speed_key = next(key for key in row if key.endswith("_per_sec"))
+        baseline_speed = baseline_speed or row[speed_key]
+        metrics = ", ".join(f"{key}={value:.4f}" for key, value in row.items() if key not in ("variant", speed_key))
+        print(f"   - {row['variant']:<45} {row[speed_key]:8.1f} {speed_key} "
+              f"(x{row[speed_key] / baseline_speed:.2f}), {metrics}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Xuất model ONNX/int8 và benchmark so với fp32.")
+    parser.add_argument("--quantization", default="avx512_vnni",
+                        help="Cấu hình lượng tử hóa ONNX: arm64, avx2, avx512, avx512_vnni ('' = không lượng tử hóa).")
+    parser.add_argument("--samples", type=int, default=256, help="Số chunk lấy mẫu từ corpus để benchmark.")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--skip-export", action="store_true", help="Chỉ benchmark các file đã có.")
+    args = parser.parse_args()
+
+    embedding_path = os.path.join(settings.MODELS_DIRECTORY, EMBEDDING_MODEL_FOLDER)
+    reranker_path = os.path.join(settings.MODELS_DIRECTORY, RERANKER_MODEL_FOLDER)
+
+    if not args.skip_export:
+        export_onnx_models(embedding_path, "embedding", args.quantization)
+        export_onnx_models(reranker_path, "reranker", args.quantization)
+
+    # Biến thể đầu tiên (fp32 PyTorch) là mốc để tính độ lệch
+    variants = [("torch", None), ("int8", None), ("onnx", "onnx/model.onnx")]
+    if args.quantization:
+        variants.append(("onnx", f"onnx/model_qint8_{args.quantization}.onnx"))
+
+    texts = sample_corpus(args.samples)
+    print(f"\nBenchmarking on {len(texts)} chunks, {len(BENCHMARK_QUERIES)} queries...")
+    print_report("Embedding", benchmark_embedding(embedding_path, variants, texts, args.batch_size))
+    print_report("Reranker", benchmark_reranker(reranker_path, variants, texts, args.batch_size))
+    print("\nĐặt INFERENCE_BACKEND / ONNX_FILE_NAME trong .env để dùng backend đã chọn.")
@@ -0,0 +1,65 @@
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import torch
+from sentence_transformers import CrossEncoder, SentenceTransformer
+
+EMBEDDING_MODEL_FOLDER = "bkai-foundation-models_vietnamese-bi-encoder"
+RERANKER_MODEL_FOLDER = "AITeamVN_Vietnamese_Reranker"
+
+logger = logging.getLogger(__name__)
+
+# "torch": fp32 PyTorch (mặc định)
+# "int8": lượng tử hóa động int8 các lớp Linear khi tải (chỉ chạy trên CPU, không cần file riêng)
+# "onnx": chạy bằng ONNX Runtime từ file trong thư mục `onnx/` của model (tạo bằng app.services.model_export)
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+
+
+def _resolve_device(device: str, backend: str) -> str:
+    if backend == "int8" and device != "cpu":
+        logger.warning("Backend 'int8' chỉ hỗ trợ CPU, bỏ qua thiết bị '%s'.", device)
+        return "cpu"
+    return device
+
+
+def _backend_kwargs(backend: str, onnx_file_name: Optional[str]) -> Dict[str, Any]:
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Inference backend không hợp lệ: '{backend}' (hỗ trợ: {', '.join(INFERENCE_BACKENDS)})")
+    if backend != "onnx":
+        return {}
+    kwargs: Dict[str, Any] = {"backend": "onnx"}
+    if onnx_file_name:
+        kwargs["model_kwargs"] = {"file_name": onnx_file_name}
+    return kwargs
+
+
+def quantize_dynamic_int8(module: torch.nn.Module) -> torch.nn.Module:
+    """Lượng tử hóa động int8 (trọng số int8, activation lượng tử hóa lúc chạy) cho các lớp Linear."""
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_embedding_model(
+    model_path: str, device: str, backend: str = "torch", onnx_file_name: Optional[str] = None
+) -> SentenceTransformer:
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Thư mục model embedding không tồn tại: {model_path}")
+    device = _resolve_device(device, backend)
+    logger.info("Loading embedding model from: %s (backend: %s)", model_path, backend)
+    model = SentenceTransformer(model_path, device=device, **_backend_kwargs(backend, onnx_file_name))
+    if backend == "int8":
+        quantize_dynamic_int8(model)
+    return model
+
+
+def load_reranker(
+    model_path: str, device: str, backend: str = "torch", onnx_file_name: Optional[str] = None, max_length: int = 512
+) -> CrossEncoder:
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Thư mục model reranker không tồn tại: {model_path}")
+    device = _resolve_device(device, backend)
+    logger.info("Loading reranker model from: %s (backend: %s)", model_path, backend)
+    reranker = CrossEncoder(model_path, device=device, max_length=max_length, **_backend_kwargs(backend, onnx_file_name))
+    if backend == "int8":
+        quantize_dynamic_int8(reranker.model)
+    return reranker
@@ -0,0 +1,215 @@
+import logging
+import re
+import threading
+import unicodedata
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_EXPANSION_PATH = Path(__file__).parent / "resources" / "query_expansion.tsv"
+
+# Các mẫu trích xuất chạy trên câu hỏi đã bỏ dấu (xem fold_text), nên "nghi dinh 100" cũng khớp
+DOCUMENT_PATTERN = re.compile(r'(luat|nghi dinh|thong tu)\s*(\d+/?\d*)')
+ARTICLE_PATTERN = re.compile(r'dieu\s+(\d+)')
+DOCUMENT_TYPES = {"luat": "Luật", "nghi dinh": "Nghị định", "thong tu": "Thông tư"}
+WHITESPACE_PATTERN = re.compile(r"\s+")
+NUMBER_PATTERN = re.compile(r"\d+")
+# Loại phương tiện (so khớp trên câu đã bỏ dấu) -> tên chuẩn; cụm dài đứng trước để
+# "xe máy chuyên dùng" không bị nhận thành "xe máy", "xe đạp máy" không thành "xe đạp"
+VEHICLE_TYPES = (
+    ("xe may chuyen dung", "xe máy chuyên dùng"),
+    ("may keo", "xe máy chuyên dùng"),
+    ("xe dap dien", "xe đạp máy"),
+    ("xe dap may", "xe đạp máy"),
+    ("xe dap", "xe đạp"),
+    ("xe tho so", "xe thô sơ"),
+    ("xe gan may", "mô tô, xe gắn máy"),
+    ("xe may", "mô tô, xe gắn máy"),
+    ("mo to", "mô tô, xe gắn máy"),
+    ("moto", "mô tô, xe gắn máy"),
+    ("o to", "ô tô"),
+    ("oto", "ô tô"),
+    ("xe hoi", "ô tô"),
+    ("xe con", "ô tô"),
+    ("xe tai", "ô tô"),
+    ("xe khach", "ô tô"),
+    ("xe buyt", "ô tô"),
+)
+VEHICLE_PATTERN = re.compile(r"\b(" + "|".join(re.escape(phrase) for phrase, _ in VEHICLE_TYPES) + r")\b")
+
+
+def fold_text(text: str) -> str:
+    """Chuẩn hóa để so khớp: chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d), gộp khoảng trắng."""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).replace("đ", "d")
+    return WHITESPACE_PATTERN.sub(" ", stripped).strip()
+
+
+class AhoCorasickMatcher:
+    """
+    Automaton Aho–Corasick: tìm mọi lần xuất hiện của tất cả mẫu trong một lần duyệt văn bản,
+    chi phí theo độ dài văn bản + số kết quả, không phụ thuộc số lượng mẫu.
+    """
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self._lengths: List[int] = []
+        self._values: List[Any] = []
+
+    def add(self, pattern: str, value: Any) -> None:
+        node = 0
+        for ch in pattern:
+            next_node = self._goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][ch] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(len(self._values))
+        self._lengths.append(len(pattern))
+        self._values.append(value)
+
+    def build(self) -> "AhoCorasickMatcher":
+        """Tính liên kết thất bại theo BFS (gọi một lần sau khi đã thêm hết các mẫu)."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0) if node else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """Sinh (vị trí bắt đầu, vị trí kết thúc, giá trị) của mọi mẫu xuất hiện trong văn bản."""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern_id in self._output[node]:
+                end = i + 1
+                yield end - self._lengths[pattern_id], end, self._values[pattern_id]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+def load_query_expansions(path: str) -> Dict[str, str]:
+    """Đọc từ điển mở rộng (TSV: cách nói phổ thông <TAB> thuật ngữ pháp lý, '#' là chú thích)."""
+    expansions: Dict[str, str] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split("\t")
+            if len(parts) != 2 or not parts[0].strip() or not parts[1].strip():
+                logger.warning("Bỏ qua dòng %s không hợp lệ trong '%s': %r", line_number, path, line)
+                continue
+            expansions.setdefault(parts[0].strip(), parts[1].strip())
+    return expansions
+
+
+class QueryAnalyzer:
+    """
+    Phân tích câu hỏi trước retrieval:
+    - `expand`: thêm thuật ngữ pháp lý cho mọi cụm từ phổ thông tìm thấy (không chồng lấn, ưu tiên cụm dài nhất),
+      so khớp không phân biệt dấu bằng automaton Aho–Corasick.
+    - `extract_details`: trích xuất loại/số hiệu văn bản và số Điều bằng các regex biên dịch sẵn.
+    """
+    def __init__(self, expansions: Dict[str, str]):
+        self.matcher = AhoCorasickMatcher()
+        seen = set()
+        for phrase, legal_term in expansions.items():
+            folded = fold_text(phrase)
+            if folded and folded not in seen:
+                seen.add(folded)
+                self.matcher.add(folded, legal_term)
+        self.matcher.build()
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "QueryAnalyzer":
+        path = path or str(DEFAULT_QUERY_EXPANSION_PATH)
+        analyzer = cls(load_query_expansions(path))
+        logger.info("Loaded %s query expansion phrases from '%s'.", len(analyzer.matcher), path)
+        return analyzer
+
+    @staticmethod
+    def _is_word_boundary(text: str, start: int, end: int) -> bool:
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+    def find_expansions(self, query: str) -> List[str]:
+        """Thuật ngữ pháp lý của các cụm khớp, theo thứ tự xuất hiện (trái -> phải, cụm dài nhất, không chồng lấn)."""
+        folded = fold_text(query)
+        matches = sorted(
+            (match for match in self.matcher.iter_matches(folded) if self._is_word_boundary(folded, match[0], match[1])),
+            key=lambda match: (match[0], -(match[1] - match[0])),
+        )
+        terms: List[str] = []
+        last_end = 0
+        for start, end, legal_term in matches:
+            if start < last_end:
+                continue
+            last_end = end
+            if legal_term not in terms:
+                terms.append(legal_term)
+        return terms
+
+    def expand(self, query: str) -> str:
+        terms = self.find_expansions(query)
+        if not terms:
+            return query
+        # Trả về cả câu gốc và thuật ngữ pháp lý để tăng khả năng tìm kiếm
+        return f"{query} ({'; '.join(terms)})"
+
+    def extract_details(self, query: str) -> Dict[str, str]:
+        details: Dict[str, str] = {}
+        folded = fold_text(query)
+        # Ví dụ: "nghị định 100", "luật 35/2024", "thông tư 79"
+        doc_match = DOCUMENT_PATTERN.search(folded)
+        if doc_match:
+            details['document_type'] = DOCUMENT_TYPES[doc_match.group(1)]
+            # Tìm kiếm một phần của document_number
+            details['document_number_partial'] = doc_match.group(2)
+        # Ví dụ: "điều 9", "theo điều 15"
+        article_match = ARTICLE_PATTERN.search(folded)
+        if article_match:
+            details['article_number'] = article_match.group(1)
+        return details
+
+
+def extract_entities(query: str) -> Dict[str, Tuple[str, ...]]:
+    """
+    Các số (số Điều, số hiệu văn bản, tốc độ, nồng độ...) và loại phương tiện nhắc tới trong câu hỏi.
+    Hai câu hỏi gần giống nhau về câu chữ nhưng khác các thực thể này có câu trả lời khác nhau.
+    """
+    folded = fold_text(query)
+    vehicle_names = dict(VEHICLE_TYPES)
+    return {
+        "numbers": tuple(sorted(set(NUMBER_PATTERN.findall(folded)))),
+        "vehicle_types": tuple(sorted({vehicle_names[match] for match in VEHICLE_PATTERN.findall(folded)})),
+    }
+
+
+_analyzer: Optional[QueryAnalyzer] = None
+_analyzer_lock = threading.Lock()
+
+
+def get_query_analyzer() -> QueryAnalyzer:
+    """QueryAnalyzer dùng chung, tải từ điển (QUERY_EXPANSION_PATH) ở lần gọi đầu tiên."""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                from app.core.config import settings
+                _analyzer = QueryAnalyzer.from_file(settings.QUERY_EXPANSION_PATH)
+    return _analyzer
@@ -0,0 +1,101 @@
+import hashlib
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+
+from app.services.lru_cache import LRUCache
+
+# Đại từ / từ chỉ định thường trỏ về nội dung ở lượt trước
+ANAPHORA_PATTERN = re.compile(
+    r"(?<!\w)(đó|này|kia|ấy|nó|họ|như vậy|như thế|trường hợp đó|trường hợp này|"
+    r"lỗi đó|lỗi này|hành vi đó|hành vi này|điều đó|điều này|văn bản đó|văn bản này)(?!\w)",
+    re.IGNORECASE,
+)
+# Câu hỏi tỉnh lược: "còn xe máy?", "vậy ô tô thì sao", "thế tái phạm thì sao"
+ELLIPSIS_START_PATTERN = re.compile(r"^\s*(còn|vậy|thế|thế còn|thì|và|cả)(?!\w)", re.IGNORECASE)
+ELLIPSIS_END_PATTERN = re.compile(r"(thì sao|thế nào|ra sao|nữa)\s*\??\s*$", re.IGNORECASE)
+# Câu quá ngắn mà không có trích dẫn cụ thể thường phụ thuộc ngữ cảnh
+MIN_SELF_CONTAINED_WORDS = 5
+
+
+class QuestionRewriter:
+    """
+    Bước tái cấu trúc câu hỏi (condense question) trước retrieval.
+    - Bỏ qua LLM khi không có lịch sử hoặc câu hỏi đã tự đủ nghĩa (heuristic cục bộ).
+    - Cache kết quả viết lại theo hash của (lịch sử, câu hỏi).
+    """
+    def __init__(
+        self,
+        question_generator,
+        extract_details: Callable[[str], Dict[str, Any]],
+        get_chat_history: Optional[Callable[[List[Any]], str]] = None,
+        cache_size: int = 1024,
+    ):
+        self.question_generator = question_generator
+        self.extract_details = extract_details
+        self.get_chat_history = get_chat_history or _get_chat_history
+        self.cache = LRUCache(cache_size)
+        self.bypassed = 0
+        self.llm_calls = 0
+
+    def is_self_contained(self, question: str) -> bool:
+        """Heuristic: câu hỏi có thể hiểu được mà không cần lịch sử hay không."""
+        if ELLIPSIS_START_PATTERN.search(question) or ELLIPSIS_END_PATTERN.search(question):
+            return False
+        details = self.extract_details(question)
+        has_explicit_reference = bool(details.get('document_number_partial') or details.get('article_number'))
+        if ANAPHORA_PATTERN.search(question):
+            # "Điều 7 Nghị định 168 này..." vẫn tự đủ nghĩa nhờ trích dẫn cụ thể
+            return has_explicit_reference
+        if len(question.split()) < MIN_SELF_CONTAINED_WORDS:
+            return has_explicit_reference
+        return True
+
+    def needs_llm(self, question: str, chat_history: list) -> bool:
+        return bool(chat_history) and not self.is_self_contained(question)
+
+    def will_call_llm(self, question: str, expanded_question: str, chat_history: list) -> bool:
+        """Lần rewrite tới có thật sự gọi LLM không: cần viết lại và kết quả chưa có trong cache."""
+        if not self.needs_llm(question, chat_history):
+            return False
+        return self._cache_key(self.get_chat_history(chat_history), expanded_question) not in self.cache
+
+    def _cache_key(self, history_text: str, question: str) -> str:
+        return hashlib.sha256(f"{history_text}\x1f{question}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, question: str, expanded_question: str, chat_history: list):
+        """Trả về (câu hỏi độc lập nếu không cần gọi LLM, input cho LLM, cache key)."""
+        if not self.needs_llm(question, chat_history):
+            self.bypassed += 1
+            return expanded_question, None, None
+        history_text = self.get_chat_history(chat_history)
+        key = self._cache_key(history_text, expanded_question)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, None, None
+        self.llm_calls += 1
+        return None, {"question": expanded_question, "chat_history": history_text}, key
+
+    def rewrite(self, question: str, expanded_question: str, chat_history: list) -> str:
+        """Trả về câu hỏi độc lập (đồng bộ)."""
+        standalone_question, llm_inputs, key = self._lookup(question, expanded_question, chat_history)
+        if standalone_question is not None:
+            return standalone_question
+        result = self.question_generator.invoke(llm_inputs)
+        standalone_question = result.get('text', expanded_question)
+        self.cache.put(key, standalone_question)
+        return standalone_question
+
+    async def arewrite(self, question: str, expanded_question: str, chat_history: list) -> str:
+        """Trả về câu hỏi độc lập (bất đồng bộ, dùng ainvoke)."""
+        standalone_question, llm_inputs, key = self._lookup(question, expanded_question, chat_history)
+        if standalone_question is not None:
+            return standalone_question
+        result = await self.question_generator.ainvoke(llm_inputs)
+        standalone_question = result.get('text', expanded_question)
+        self.cache.put(key, standalone_question)
+        return standalone_question
+
+    def stats(self) -> Dict[str, Any]:
+        return {"bypassed": self.bypassed, "llm_calls": self.llm_calls, "cache": self.cache.stats()}
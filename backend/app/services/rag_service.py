@@ -1,157 +1,348 @@
+import asyncio
+import logging
 import os
 import pickle
-import re
+import shutil
+import threading
+import time
+import unicodedata
 import numpy as np
 import torch
 # import sentencepiece
 # import google.generativeai as genai
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 
 from langchain.schema import Document
 from langchain.prompts import PromptTemplate
+from langchain_core.prompts import format_document
 from langchain.chains import RetrievalQA
 from langchain_chroma import Chroma
 from langchain_core.embeddings import Embeddings
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 
 from sentence_transformers import SentenceTransformer, CrossEncoder
-from rank_bm25 import BM25Okapi
 # from transformers import AutoTokenizer, AutoModel
 
+from app.core import metrics
 from app.core.config import settings
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.bm25_index import SparseBM25Index, bm25_tokenize
+from app.services.chunk_store import ChunkStore
+from app.services.citation_index import CitationIndex
+from app.services.context_builder import ContextBuilder
+from app.services.corpus_version import CorpusVersionTracker, read_corpus_version, versioned_directory
+from app.services.inference_scheduler import MicroBatcher
+from app.services.llm_provider import create_llm
+from app.services.lru_cache import LRUCache
+from app.services.model_loader import (
+    EMBEDDING_MODEL_FOLDER, RERANKER_MODEL_FOLDER, load_embedding_model, load_reranker
+)
+from app.services.query_analysis import get_query_analyzer
+from app.services.question_rewriter import QuestionRewriter
+from app.services.rerank_cache import RerankScoreCache, get_chunk_id
+from app.services.speculative_retrieval import SpeculationTracker, SpeculativeRetrieval
+
+logger = logging.getLogger(__name__)
 
 # --- CÁC CLASS VÀ BIẾN TOÀN CỤC (đã được kiểm chứng từ Colab) ---
 
 class SentenceTransformerEmbeddings(Embeddings):
-    """Wrapper cho SentenceTransformer để tương thích với LangChain."""
-    def __init__(self, model):
+    """
+    Wrapper cho SentenceTransformer để tương thích với LangChain.
+    Vector của câu truy vấn được cache (LRU, lưu dạng mảng numpy gọn) để không
+    phải encode lại các câu hỏi lặp lại.
+    """
+    def __init__(self, model, cache_size: int = 0, cache_dtype: str = "float32", batcher: Optional[MicroBatcher] = None):
         super().__init__()
         self.model = model
+        self.cache = LRUCache(cache_size)
+        self.cache_dtype = np.dtype(cache_dtype)
+        # Nếu có batcher, các câu truy vấn từ nhiều request đồng thời được encode chung một batch
+        self.batcher = batcher
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text).split())
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         # Không hiển thị progress bar khi chạy trên server
         return self.model.encode(texts, convert_to_tensor=False, show_progress_bar=False).tolist()
 
     def embed_query(self, text: str) -> List[float]:
-        return self.model.encode([text], convert_to_tensor=False)[0].tolist()
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed nhiều câu truy vấn: lấy từ cache nếu có, các câu còn lại encode chung một batch."""
+        with metrics.stage("embed"):
+            return self._embed_queries(texts)
+
+    def _embed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._normalize(text) for text in texts]
+        vectors: List[Optional[np.ndarray]] = [None] * len(keys)
+        missing: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is not None:
+                vectors[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            if self.batcher is not None:
+                encoded = self.batcher.run(list(missing))
+            else:
+                encoded = self.model.encode(list(missing), convert_to_tensor=False, show_progress_bar=False)
+            for key, vector in zip(missing, encoded):
+                compact = np.asarray(vector, dtype=self.cache_dtype)
+                self.cache.put(key, compact, size=compact.nbytes)
+                for i in missing[key]:
+                    vectors[i] = compact
+
+        return [vector.astype(np.float32).tolist() for vector in vectors]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
     
 
+@dataclass
+class RetrievalCandidate:
+    """Một ứng viên trong quá trình retrieval; `Document` chỉ được tạo khi lọt vào kết quả cuối."""
+    chunk_id: str
+    text: str
+    document: Optional[Document] = None  # Có sẵn nếu đến từ Chroma
+    row: Optional[int] = None            # Vị trí trong chunk store nếu đến từ BM25
+    vector_rank: Optional[int] = None    # Thứ hạng (từ 0) trong kết quả vector search
+    keyword_rank: Optional[int] = None   # Thứ hạng (từ 0) trong kết quả BM25
+
+
 class HybridRerankingRetriever(BaseRetriever):
     """Retriever lai ghép, kết hợp vector và keyword, sau đó re-rank."""
     vector_store: Chroma
-    bm25_searcher: BM25Okapi
-    all_docs: List[Document]
+    bm25_searcher: SparseBM25Index
+    chunk_store: ChunkStore
     reranker: CrossEncoder
+    # Micro-batcher dùng chung cho reranker (None = gọi predict trực tiếp)
+    rerank_batcher: Optional[Any] = None
+    # Cache điểm rerank theo (query, chunk id); None = luôn chấm lại
+    score_cache: Optional[Any] = None
+    # Phiên bản corpus của các index này (điểm rerank chỉ dùng chung giữa các retriever cùng phiên bản)
+    corpus_version: Optional[str] = None
+    # Index trích dẫn (văn bản, Điều) -> chunk id; None = không dùng đường tắt cho câu hỏi trích dẫn
+    citation_index: Optional[CitationIndex] = None
     top_n_vector: int = 15
     top_n_keyword: int = 15
     top_k_final: int = 5
+    # Hợp nhất kết quả: "union" = rerank toàn bộ hợp của hai danh sách (như trước),
+    # "rrf" = reciprocal-rank fusion rồi áp dụng chính sách rerank theo tầng bên dưới
+    fusion: str = "union"
+    rrf_k: int = 60
+    # Chỉ rerank top-M ứng viên sau fusion (0 = tất cả)
+    rerank_top_m: int = 0
+    # False = không dùng CrossEncoder cho retrieval thường (chỉ fusion); đường tắt trích dẫn vẫn rerank
+    rerank_enabled: bool = True
+    # Bỏ qua rerank khi fusion đã rõ ràng: (điểm thứ k - điểm thứ k+1) / điểm cao nhất >= ngưỡng (None = luôn rerank)
+    rerank_skip_margin: Optional[float] = None
 
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun, where_filter: Dict[str, Any] = None
     ) -> List[Document]:
         
         # 1. Vector Search với bộ lọc metadata (nếu có)
-        print(f"DEBUG: Performing vector search with filter: {where_filter}")
-        if where_filter:
-            vector_docs = self.vector_store.similarity_search(query, k=self.top_n_vector, filter=where_filter)
-        else:
-            vector_docs = self.vector_store.similarity_search(query, k=self.top_n_vector)
-        
-        # 2. Keyword Search (BM25)
-        tokenized_query = query.split(" ")
-        bm25_scores = self.bm25_searcher.get_scores(tokenized_query)
-        # Lấy các index có score > 0 để tránh kết quả không liên quan
-        top_n_indices = np.argsort(bm25_scores)[::-1][:self.top_n_keyword]
-        bm25_docs = [self.all_docs[i] for i in top_n_indices if bm25_scores[i] > 0]
+        logger.debug("Performing vector search with filter: %s", where_filter)
+        vector_docs = self._vector_search(query, where_filter)
         
-        # 3. Kết hợp và loại bỏ trùng lặp
-        combined_docs_dict = {doc.page_content: doc for doc in vector_docs}
-        for doc in bm25_docs:
-            if doc.page_content not in combined_docs_dict:
-                combined_docs_dict[doc.page_content] = doc
+        # 2. Keyword Search (BM25) - chỉ duyệt posting list của các từ trong câu truy vấn
+        bm25_rows = self._keyword_search(query)
         
-        combined_docs = list(combined_docs_dict.values())
+        # 3. Kết hợp và loại bỏ trùng lặp (theo chunk id)
+        with metrics.stage("merge"):
+            candidates = self._merge_candidates(vector_docs, bm25_rows)
+        metrics.observe_candidates("vector", len(vector_docs))
+        metrics.observe_candidates("keyword", len(bm25_rows))
+        metrics.observe_candidates("merged", len(candidates))
 
-        if not combined_docs:
+        if not candidates:
             return []
+
+        # 3b. Fusion + rerank theo tầng: chỉ gửi top-M ứng viên cho CrossEncoder, hoặc bỏ qua nếu đã rõ ràng
+        # (khi tắt reranker, thứ tự cuối cùng là thứ tự reciprocal-rank fusion)
+        if self.fusion == "rrf" or not self.rerank_enabled:
+            candidates, fused_scores = self._fuse(candidates)
+            if not self.rerank_enabled or self._fusion_is_decisive(fused_scores):
+                metrics.REQUEST_PATHS.labels(path="rerank_skipped").inc()
+                return [self._materialize(candidate) for candidate in candidates[:self.top_k_final]]
+            if self.rerank_top_m > 0:
+                candidates = candidates[:max(self.rerank_top_m, self.top_k_final)]
         
-        # 4. Re-ranking
-        sentence_pairs = [[query, doc.page_content] for doc in combined_docs]
-        scores = self.reranker.predict(sentence_pairs, show_progress_bar=False)
+        # 4. Re-ranking (chỉ chấm các chunk chưa có trong cache)
+        scores = self._rerank_scores(query, candidates)
 
         # --- Metadata boosting ---
+        with metrics.stage("metadata_boost"):
+            adjusted_scores = self._apply_metadata_boost(scores, candidates, where_filter)
+
+        scored_candidates = sorted(zip(adjusted_scores, candidates), key=lambda x: x[0], reverse=True)
+        return [self._materialize(candidate) for _, candidate in scored_candidates[:self.top_k_final]]
+
+    def citation_search(self, query: str) -> Optional[List[Document]]:
+        """
+        Đường tắt cho câu hỏi chỉ rõ số hiệu văn bản và số Điều: lấy thẳng các chunk của Điều đó
+        từ index trích dẫn, không cần vector search/BM25. Chỉ rerank khi Điều bị chia thành nhiều chunk.
+        Trả về None nếu câu hỏi không phải trích dẫn rõ ràng (để chạy retrieval bình thường).
+        """
+        if self.citation_index is None:
+            return None
+        details = extract_query_details(query)
+        if not details.get('document_number_partial') or not details.get('article_number'):
+            return None
+        with metrics.stage("citation_lookup"):
+            chunk_ids = self.citation_index.lookup(
+                details['document_number_partial'], details['article_number'], details.get('document_type')
+            )
+        if not chunk_ids:
+            return None
+
+        rows = [row for row in (self.chunk_store.row_of(chunk_id) for chunk_id in chunk_ids) if row is not None]
+        candidates = [
+            RetrievalCandidate(chunk_id=str(self.chunk_store.chunk_id(row)), text=self.chunk_store.get_text(row), row=row)
+            for row in rows
+        ]
+        if not candidates:
+            return None
+        logger.debug("Citation fast path: %s chunks for %s", len(candidates), details)
+        metrics.REQUEST_PATHS.labels(path="citation").inc()
+        if len(candidates) > 1:
+            scores = self._rerank_scores(query, candidates)
+            candidates = [candidate for _, candidate in sorted(zip(scores, candidates), key=lambda x: x[0], reverse=True)]
+        return [self._materialize(candidate) for candidate in candidates[:self.top_k_final]]
+
+    def _vector_search(self, query: str, where_filter: Optional[Dict[str, Any]]) -> List[Document]:
+        # Thời gian "vector_search" bao gồm cả bước "embed" câu truy vấn
+        with metrics.stage("vector_search"):
+            if where_filter:
+                return self.vector_store.similarity_search(query, k=self.top_n_vector, filter=where_filter)
+            return self.vector_store.similarity_search(query, k=self.top_n_vector)
+
+    def _keyword_search(self, query: str) -> List[int]:
+        # search() chỉ trả về các index có score > 0 để tránh kết quả không liên quan
+        with metrics.stage("bm25"):
+            top_n_indices, _ = self.bm25_searcher.search(bm25_tokenize(query), self.top_n_keyword)
+        return [int(i) for i in top_n_indices]
+
+    def _merge_candidates(self, vector_docs: List[Document], bm25_rows: List[int]) -> List[RetrievalCandidate]:
+        candidates: Dict[str, RetrievalCandidate] = {}
+        by_text: Dict[str, RetrievalCandidate] = {}
+        for rank, doc in enumerate(vector_docs):
+            chunk_id = get_chunk_id(doc)
+            if chunk_id not in candidates and doc.page_content not in by_text:
+                candidate = RetrievalCandidate(chunk_id=chunk_id, text=doc.page_content, document=doc, vector_rank=rank)
+                candidates[chunk_id] = by_text[doc.page_content] = candidate
+        for rank, row in enumerate(bm25_rows):
+            chunk_id = str(self.chunk_store.chunk_id(row))
+            existing = candidates.get(chunk_id)
+            if existing is None:
+                text = self.chunk_store.get_text(row)
+                existing = by_text.get(text)
+                if existing is None:
+                    candidates[chunk_id] = by_text[text] = RetrievalCandidate(
+                        chunk_id=chunk_id, text=text, row=row, keyword_rank=rank
+                    )
+                    continue
+            if existing.keyword_rank is None:
+                existing.keyword_rank = rank
+        return list(candidates.values())
+
+    def _fuse(self, candidates: List[RetrievalCandidate]) -> Tuple[List[RetrievalCandidate], List[float]]:
+        """Reciprocal-rank fusion: điểm = tổng 1 / (rrf_k + thứ hạng) trên hai danh sách; trả về đã sắp xếp giảm dần."""
+        fused = []
+        for candidate in candidates:
+            score = 0.0
+            for rank in (candidate.vector_rank, candidate.keyword_rank):
+                if rank is not None:
+                    score += 1.0 / (self.rrf_k + rank + 1)
+            fused.append((score, candidate))
+        fused.sort(key=lambda x: x[0], reverse=True)
+        return [candidate for _, candidate in fused], [score for score, _ in fused]
+
+    def _fusion_is_decisive(self, fused_scores: List[float]) -> bool:
+        if self.rerank_skip_margin is None or len(fused_scores) <= self.top_k_final:
+            return False
+        gap = fused_scores[self.top_k_final - 1] - fused_scores[self.top_k_final]
+        return gap / fused_scores[0] >= self.rerank_skip_margin
+
+    def _candidate_metadata(self, candidate: RetrievalCandidate) -> Dict[str, Any]:
+        if candidate.document is not None:
+            return candidate.document.metadata
+        return self.chunk_store.get_metadata(candidate.row)
+
+    def _apply_metadata_boost(
+        self, scores: List[float], candidates: List[RetrievalCandidate], where_filter: Optional[Dict[str, Any]]
+    ) -> List[float]:
         adjusted_scores = []
-        for score, doc in zip(scores, combined_docs):
+        for score, candidate in zip(scores, candidates):
             meta_boost = 0
-            # Ưu tiên nếu điều luật khớp
-            if where_filter and 'article_number' in where_filter and 'article_number' in doc.metadata:
-                if str(doc.metadata['article_number']) == str(where_filter['article_number']):
-                    meta_boost += 0.5
-            # Ưu tiên nếu văn bản luật khớp (dùng contains)
-            if where_filter and 'document_number' in where_filter and 'document_number' in doc.metadata:
-                filter_val = where_filter['document_number'].get('$contains', '')
-                if filter_val and filter_val in str(doc.metadata['document_number']):
-                    meta_boost += 0.3
+            if where_filter:
+                metadata = self._candidate_metadata(candidate)
+                # Ưu tiên nếu điều luật khớp
+                if 'article_number' in where_filter and 'article_number' in metadata:
+                    if str(metadata['article_number']) == str(where_filter['article_number']):
+                        meta_boost += 0.5
+                # Ưu tiên nếu văn bản luật khớp (dùng contains)
+                if 'document_number' in where_filter and 'document_number' in metadata:
+                    filter_val = where_filter['document_number'].get('$contains', '')
+                    if filter_val and filter_val in str(metadata['document_number']):
+                        meta_boost += 0.3
             # Ưu tiên nếu đoạn chứa các từ khóa mức phạt
-            if any(keyword in doc.page_content for keyword in ["mức phạt", "phạt tiền", "xử phạt"]):
+            if any(keyword in candidate.text for keyword in ["mức phạt", "phạt tiền", "xử phạt"]):
                 meta_boost += 0.2
             adjusted_scores.append(score + meta_boost)
+        return adjusted_scores
+
+    def _materialize(self, candidate: RetrievalCandidate) -> Document:
+        if candidate.document is not None:
+            return candidate.document
+        return self.chunk_store.get_document(candidate.row)
+
+    def _score_pairs(self, sentence_pairs: List[List[str]]) -> List[float]:
+        """Chấm điểm các cặp (query, đoạn văn) bằng CrossEncoder, qua micro-batcher nếu có."""
+        if self.rerank_batcher is not None:
+            return self.rerank_batcher.run(sentence_pairs)
+        return self.reranker.predict(sentence_pairs, show_progress_bar=False)
 
-        scored_docs = sorted(zip(adjusted_scores, combined_docs), key=lambda x: x[0], reverse=True)
-        reranked_docs = [doc for score, doc in scored_docs][:self.top_k_final]
+    def _rerank_scores(self, query: str, candidates: List[RetrievalCandidate]) -> List[float]:
+        with metrics.stage("rerank"):
+            return self._cached_rerank_scores(query, candidates)
 
-        return reranked_docs
+    def _cached_rerank_scores(self, query: str, candidates: List[RetrievalCandidate]) -> List[float]:
+        if self.score_cache is None:
+            metrics.observe_candidates("reranked", len(candidates))
+            return list(self._score_pairs([[query, candidate.text] for candidate in candidates]))
 
-QUERY_EXPANSION_MAP = {
-    "vượt đèn đỏ": "không chấp hành hiệu lệnh của đèn tín hiệu giao thông",
-    "vượt đèn vàng": "không chấp hành hiệu lệnh đèn tín hiệu",
-    "không đội mũ bảo hiểm": "không đội mũ bảo hiểm hoặc đội mũ không cài quai đúng quy cách",
-    "say xỉn": "có nồng độ cồn trong máu hoặc hơi thở",
-    "uống rượu bia lái xe": "điều khiển phương tiện có nồng độ cồn",
-    "đi sai làn": "Điều khiển xe không đi bên phải theo phải theo chiều đi của mình; đi không đúng phần đường hoặc làn đường quy định",
-    "lái xe quá tốc độ": "điều khiển xe chạy quá tốc độ cho phép",
-    "bị phạt nguội": "xử phạt qua hệ thống giám sát tự động",
-    "không bằng lái": "không có giấy phép lái xe",
-    "không có bằng lái": "không có giấy phép lái xe",
-}
+        chunk_ids = [candidate.chunk_id for candidate in candidates]
+        scores = self.score_cache.get_many(query, chunk_ids, self.corpus_version)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        metrics.observe_candidates("reranked", len(missing))
+        if missing:
+            new_scores = self._score_pairs([[query, candidates[i].text] for i in missing])
+            for i, score in zip(missing, new_scores):
+                scores[i] = float(score)
+            self.score_cache.put_many(
+                query, [chunk_ids[i] for i in missing], [scores[i] for i in missing], self.corpus_version
+            )
+        return scores
 
 def expand_query(query: str) -> str:
-    """Mở rộng câu hỏi bằng cách thay thế thuật ngữ phổ thông bằng thuật ngữ pháp lý."""
-    # Dùng lower() để bắt được nhiều trường hợp hơn
-    lower_query = query.lower()
-    for key, legal_term in QUERY_EXPANSION_MAP.items():
-        if key in lower_query:
-            # Trả về cả hai để tăng khả năng tìm kiếm
-            return f"{query} ({legal_term})" 
-    return query
+    """Mở rộng câu hỏi bằng cách thêm thuật ngữ pháp lý cho các cách nói phổ thông (xem QueryAnalyzer)."""
+    return get_query_analyzer().expand(query)
     
 def extract_query_details(query: str) -> dict:
-        """Dùng regex để tìm kiếm số hiệu văn bản và số điều trong câu hỏi."""
-        details = {}
-        # Ví dụ: "nghị định 100", "luật 35/2024", "thông tư 79"
-        doc_match = re.search(r'(luật|nghị định|thông tư)\s*(\d+/?\d*)', query, re.IGNORECASE)
-        if doc_match:
-            doc_type = doc_match.group(1).lower()
-            doc_num = doc_match.group(2)
-            if "luật" in doc_type:
-                details['document_type'] = "Luật"
-            elif "nghị định" in doc_type:
-                details['document_type'] = "Nghị định"
-            elif "thông tư" in doc_type:
-                details['document_type'] = "Thông tư"
-            # Tìm kiếm một phần của document_number
-            details['document_number_partial'] = doc_num
-
-        # Ví dụ: "điều 9", "theo điều 15"
-        article_match = re.search(r'điều\s+(\d+)', query, re.IGNORECASE)
-        if article_match:
-            details['article_number'] = article_match.group(1)
-            
-        return details
+    """Dùng regex (biên dịch sẵn) để tìm kiếm loại/số hiệu văn bản và số điều trong câu hỏi."""
+    return get_query_analyzer().extract_details(query)
     
 # Prompt Template được thiết kế kỹ lưỡng
 CONDENSE_QUESTION_PROMPT_TEMPLATE = """Dựa vào đoạn hội thoại dưới đây và một câu hỏi tiếp theo, hãy diễn giải câu hỏi tiếp theo thành một câu hỏi độc lập, đầy đủ bằng tiếng Việt.
@@ -196,89 +387,170 @@ RAG_PROMPT_TEMPLATE = """Bạn là LawBot, một chuyên gia AI về Luật Giao
 RAG_PROMPT = PromptTemplate(template=RAG_PROMPT_TEMPLATE, input_variables=["context", "question"])
 
 
+# Các câu hỏi về bản thân chatbot, trả lời ngay không cần RAG
+META_QUESTIONS = ["bạn là ai", "bạn tên gì"]
+META_ANSWER = "Tôi là LawBot, một trợ lý AI chuyên về Luật Giao thông..."
+
+
+def inference_workers() -> int:
+    """
+    Số luồng của inference executor. Khi bật micro-batching, mỗi luồng bị giữ trong `MicroBatcher.run()`
+    cho tới khi batch chạy xong, nên số request có thể gom chung một batch bị giới hạn bởi số luồng:
+    executor cần ít nhất INFERENCE_MAX_BATCH_SIZE luồng (phần lớn thời gian chỉ chờ Future).
+    """
+    if settings.INFERENCE_BATCHING_ENABLED:
+        return max(settings.RAG_INFERENCE_WORKERS, settings.INFERENCE_MAX_BATCH_SIZE)
+    return settings.RAG_INFERENCE_WORKERS
+
+
 # --- CLASS RAG SERVICE CHÍNH ---
 
 class RAGService:
     def __init__(self):
         # self.qa_chain = None
         self.conversation_chain = None
+        self.question_rewriter = None
+        self.answer_cache = None
+        self.rerank_batcher = None
+        self.embedding_batcher = None
+        self.rerank_score_cache = None
+        self.retriever = None
+        self.corpus_version = None
+        self.vector_store_directory = None
         self.is_ready = False
-        print("Initializing RAG Service...")
+        # Trạng thái tải từng thành phần (cho /health/ready)
+        self.load_status: Dict[str, Dict[str, Any]] = {}
+        self.load_error = None
+        self.load_seconds = None
+        # Dựng ngữ cảnh cho prompt trả lời trong giới hạn token
+        self.context_builder = ContextBuilder(
+            token_budget=settings.CONTEXT_TOKEN_BUDGET, chars_per_token=settings.CONTEXT_CHARS_PER_TOKEN
+        )
+        # Retrieval chạy trước trong lúc LLM viết lại câu hỏi
+        self.speculation_tracker = SpeculationTracker(min_overlap=settings.SPECULATIVE_MIN_OVERLAP)
+        # Reload index nóng (không restart server)
+        self._reload_lock = threading.Lock()
+        self._watcher_stop = threading.Event()
+        self._watcher_thread = None
+        # Executor giới hạn số luồng chạy các bước nặng CPU song song
+        self._executor = ThreadPoolExecutor(
+            max_workers=inference_workers(), thread_name_prefix="rag-inference"
+        )
+        logger.info("Initializing RAG Service...")
+
+    def _track(self, component: str, fn, *args):
+        """Chạy một bước tải, ghi lại trạng thái (loading/ready/failed) và thời gian cho endpoint /health/ready."""
+        status = {"status": "loading", "seconds": None}
+        self.load_status[component] = status
+        started_at = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            status.update(status="failed", error=str(e))
+            raise
+        finally:
+            status["seconds"] = round(time.perf_counter() - started_at, 3)
+        status["status"] = "ready"
+        return result
+
+    def _load_embedding_model(self, device: str):
+        embedding_model_path = os.path.join(settings.MODELS_DIRECTORY, EMBEDDING_MODEL_FOLDER)
+        return load_embedding_model(
+            embedding_model_path, device, backend=settings.INFERENCE_BACKEND, onnx_file_name=settings.ONNX_FILE_NAME
+        )
+
+    def _load_reranker(self, device: str):
+        reranker_model_path = os.path.join(settings.MODELS_DIRECTORY, RERANKER_MODEL_FOLDER)
+        self.reranker = load_reranker(
+            reranker_model_path, device, backend=settings.INFERENCE_BACKEND, onnx_file_name=settings.ONNX_FILE_NAME
+        )
+
+        if settings.RERANK_CACHE_SIZE > 0:
+            self.rerank_score_cache = RerankScoreCache(
+                model_path=reranker_model_path,
+                corpus_version=read_corpus_version(settings.CORPUS_VERSION_PATH),
+                max_size=settings.RERANK_CACHE_SIZE,
+                persist_path=settings.RERANK_CACHE_PATH,
+                model_variant=f"{settings.INFERENCE_BACKEND}:{settings.ONNX_FILE_NAME or ''}",
+            )
+        return self.reranker
+
+    def _load_llm(self):
+        self.llm = create_llm()
+        return self.llm
+
+    def _warmup(self) -> None:
+        """Chạy một truy vấn qua toàn bộ đường retrieval (embedding, Chroma, BM25, rerank) trước khi báo ready."""
+        docs = self._retrieve(settings.WARMUP_QUERY, None)
+        logger.info("Warmup query returned %s documents.", len(docs))
 
     def load(self):
         """
         Hàm cốt lõi: Tải tất cả model, index và xây dựng QA chain.
-        Hàm này được gọi một lần khi server khởi động.
+        Hàm này được gọi một lần khi server khởi động (trên luồng nền, xem `life_cycles.startup_event`).
+        Các thành phần độc lập (2 model, LLM, kho chunk + BM25) được tải song song.
         """
+        self.load_status = {}
+        self.load_error = None
+        started_at = time.perf_counter()
         try:
             # 1. Kiểm tra xem dữ liệu đã được xử lý chưa
-            if not os.path.exists(settings.ALL_CHUNKS_PATH):
-                raise FileNotFoundError(f"File dữ liệu '{settings.ALL_CHUNKS_PATH}' không tồn tại. "
+            if not ChunkStore.exists(settings.CHUNK_STORE_DIRECTORY) and not os.path.exists(settings.ALL_CHUNKS_PATH):
+                raise FileNotFoundError(f"Kho chunk '{settings.CHUNK_STORE_DIRECTORY}' không tồn tại. "
                                         "Vui lòng chạy 'python -m app.services.data_loader' trước.")
 
-            print("Loading RAG components...")
+            logger.info("Loading RAG components...")
+            # Biên dịch sẵn từ điển mở rộng câu hỏi để request đầu tiên không phải chờ
+            self._track("query_analyzer", get_query_analyzer)
             device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            print(f"Sử dụng thiết bị: {device}")
-
-             # 2. Tải model EMBEDDING từ thư mục local
-            embedding_model_folder = "bkai-foundation-models_vietnamese-bi-encoder"
-            embedding_model_path = os.path.join(settings.MODELS_DIRECTORY, embedding_model_folder)
-            
-            if not os.path.exists(embedding_model_path):
-                raise FileNotFoundError(f"Thư mục model embedding không tồn tại: {embedding_model_path}")
-            
-            print(f"Loading embedding model from: {embedding_model_path}")
-            embedding_model = SentenceTransformer(embedding_model_path, device=device)
+            if settings.TORCH_NUM_THREADS:
+                torch.set_num_threads(settings.TORCH_NUM_THREADS)
+            logger.info("Sử dụng thiết bị: %s", device)
 
-            # 3. Tải model RERANKER từ thư mục local
-            reranker_model_folder = "AITeamVN_Vietnamese_Reranker"
-            reranker_model_path = os.path.join(settings.MODELS_DIRECTORY, reranker_model_folder)
+            # 2. Tải song song: model EMBEDDING, model RERANKER (+ cache điểm rerank), LLM, kho chunk + BM25 Index
+            with ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-load") as loader:
+                embedding_future = loader.submit(self._track, "embedding_model", self._load_embedding_model, device)
+                reranker_future = loader.submit(self._track, "reranker", self._load_reranker, device)
+                llm_future = loader.submit(self._track, "llm", self._load_llm)
+                sparse_future = loader.submit(self._track, "chunk_store_bm25", self._load_sparse_indexes)
+                embedding_model = embedding_future.result()
+                reranker_future.result()
+                llm_future.result()
+                sparse_indexes = sparse_future.result()
 
-            if not os.path.exists(reranker_model_path):
-                raise FileNotFoundError(f"Thư mục model reranker không tồn tại: {reranker_model_path}")
+            # 3. Micro-batching: gom rerank/embedding của các request đồng thời thành một forward pass
+            if settings.INFERENCE_BATCHING_ENABLED:
+                max_batch_size = settings.INFERENCE_MAX_BATCH_SIZE
+                self.rerank_batcher = MicroBatcher(
+                    lambda pairs: self.reranker.predict(pairs, batch_size=max_batch_size, show_progress_bar=False),
+                    max_batch_size=max_batch_size,
+                    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+                    name="rerank",
+                )
+                self.embedding_batcher = MicroBatcher(
+                    lambda texts: embedding_model.encode(
+                        texts, batch_size=max_batch_size, convert_to_tensor=False, show_progress_bar=False
+                    ),
+                    max_batch_size=max_batch_size,
+                    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+                    name="embedding",
+                )
 
-            print(f"Loading reranker model from: {reranker_model_path}")
-            self.reranker = CrossEncoder(reranker_model_path, device=device, max_length=512)
-            
-            # 3. Khởi tạo LLM
-            self.llm = ChatGoogleGenerativeAI(
-                model="models/gemini-1.5-flash-latest",
-                temperature=0.1,
-                convert_system_message_to_human=True,
-                google_api_key=settings.GOOGLE_API_KEY
+            # 4. Hàm embedding dùng chung (Chroma, cache câu trả lời); được giữ lại qua các lần reload index
+            self.langchain_embedding = SentenceTransformerEmbeddings(
+                embedding_model,
+                cache_size=settings.EMBEDDING_CACHE_SIZE,
+                cache_dtype=settings.EMBEDDING_CACHE_DTYPE,
+                batcher=self.embedding_batcher,
             )
 
-            
-             # 4. Tải dữ liệu chunks (chỉ cần cho BM25)
-            with open(settings.ALL_CHUNKS_PATH, "rb") as f:
-                all_chunks = pickle.load(f)
-
-            # 5. Xây dựng các index
-            
-            # 5a. Tải ChromaDB từ đĩa
-            print(f"Loading Vector Store from disk: {settings.VECTOR_STORE_DIRECTORY}")
-            langchain_embedding = SentenceTransformerEmbeddings(embedding_model) # Vẫn cần hàm embedding để load
-            
-            # Thay vì Chroma.from_documents, chúng ta khởi tạo Chroma và trỏ đến thư mục đã lưu
-            self.vector_store = Chroma(
-                persist_directory=settings.VECTOR_STORE_DIRECTORY,
-                embedding_function=langchain_embedding
-            )
-            print(f"✅ Vector Store loaded successfully with {self.vector_store._collection.count()} documents.")
-
-            # 5b. Tạo BM25 Index (vẫn tạo trong RAM khi khởi động)
-            print("Creating BM25 Index in memory...")
-            corpus = [chunk.page_content for chunk in all_chunks]
-            tokenized_corpus = [doc.split(" ") for doc in corpus]
-            bm25_index = BM25Okapi(tokenized_corpus)
-            
-            # 6. Tạo retriever lai ghép
-            hybrid_retriever = HybridRerankingRetriever(
-                vector_store=self.vector_store,
-                bm25_searcher=bm25_index,
-                all_docs=all_chunks,
-                reranker=self.reranker
-            )
+            # 5-6. Tải Vector Store và tạo retriever lai ghép
+            self.corpus_version = read_corpus_version(settings.CORPUS_VERSION_PATH)
+            self.vector_store_directory = versioned_directory(settings.VECTOR_STORE_DIRECTORY, self.corpus_version)
+            if self.rerank_score_cache is not None:
+                self.rerank_score_cache.set_corpus_version(self.corpus_version)
+            self.retriever = self._track("vector_store", self._build_retriever, sparse_indexes, self.corpus_version)
+            self.vector_store = self.retriever.vector_store
 
              # Chain này sẽ là "bộ não" chính, nhưng chúng ta sẽ không dùng nó trực tiếp
             # mà sẽ dùng các thành phần của nó.
@@ -287,19 +559,318 @@ class RAGService:
             )
             self.conversation_chain = ConversationalRetrievalChain.from_llm(
                 llm=self.llm,
-                retriever=hybrid_retriever,
+                retriever=self.retriever,
                 memory=memory,
                 return_source_documents=True,
                 condense_question_prompt=CONDENSE_QUESTION_PROMPT,
                 combine_docs_chain_kwargs={"prompt": RAG_PROMPT}
             )
-            
+            self.question_rewriter = QuestionRewriter(
+                question_generator=self.conversation_chain.question_generator,
+                extract_details=extract_query_details,
+                get_chat_history=self.conversation_chain.get_chat_history,
+                cache_size=settings.QUESTION_REWRITE_CACHE_SIZE,
+            )
+            if settings.ANSWER_CACHE_ENABLED:
+                self.answer_cache = SemanticAnswerCache(
+                    embed_fn=self.langchain_embedding.embed_query,
+                    corpus_version=self.corpus_version,
+                    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+                    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+                    max_bytes=settings.ANSWER_CACHE_MAX_MB * 1024 * 1024,
+                    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                )
+
+            # 7. Làm nóng model và index bằng một truy vấn thật trước khi nhận traffic
+            if settings.WARMUP_QUERY:
+                self._track("warmup", self._warmup)
+
             self.is_ready = True
-            print("✅ RAG Service is fully loaded and ready.")
+            self.load_seconds = round(time.perf_counter() - started_at, 3)
+            logger.info("✅ RAG Service is fully loaded and ready (%ss).", self.load_seconds)
         except Exception as e:
-            print(f"❌ Failed to load RAG Service: {e}")
+            logger.error("❌ Failed to load RAG Service: %s", e)
+            self.load_error = str(e)
             self.is_ready = False
 
+    def health(self) -> Dict[str, Any]:
+        """Trạng thái tải của từng thành phần (dùng cho /health/ready)."""
+        if self.is_ready:
+            status = "ready"
+        elif self.load_error:
+            status = "failed"
+        elif self.load_status:
+            status = "loading"
+        else:
+            status = "not_started"
+        return {
+            "status": status,
+            "error": self.load_error,
+            "load_seconds": self.load_seconds,
+            "corpus_version": self.corpus_version,
+            "components": self.load_status,
+        }
+
+    def _load_sparse_indexes(self) -> Tuple[ChunkStore, SparseBM25Index, Optional[CitationIndex]]:
+        """Tải kho chunk, BM25 Index và index trích dẫn (không phụ thuộc model nên có thể tải song song với các model)."""
+        # Tải kho chunk dạng cột (memory-map), đọc nội dung theo chunk id khi cần
+        if ChunkStore.exists(settings.CHUNK_STORE_DIRECTORY):
+            chunk_store = ChunkStore.load(settings.CHUNK_STORE_DIRECTORY)
+        else:
+            # Tương thích dữ liệu cũ: file pickle các Document (chưa có chunk id ổn định)
+            logger.warning("Chunk store not found, falling back to legacy pickle '%s'.", settings.ALL_CHUNKS_PATH)
+            with open(settings.ALL_CHUNKS_PATH, "rb") as f:
+                chunk_store = ChunkStore.from_documents(pickle.load(f))
+        logger.info("✅ Chunk store loaded with %s chunks.", len(chunk_store))
+
+        # Tải BM25 Index đã build sẵn bởi data_loader (memory-map), nếu chưa có thì tạo trong RAM
+        bm25_index = None
+        if SparseBM25Index.exists(settings.BM25_INDEX_DIRECTORY):
+            logger.info("Loading BM25 Index from disk: %s", settings.BM25_INDEX_DIRECTORY)
+            bm25_index = SparseBM25Index.load(settings.BM25_INDEX_DIRECTORY, mmap=True)
+            if bm25_index.num_docs != len(chunk_store):
+                logger.warning("BM25 Index on disk does not match the chunk file, ignoring it.")
+                bm25_index = None
+        if bm25_index is None:
+            logger.warning("Prebuilt BM25 Index not available, creating it in memory...")
+            tokenized_corpus = [bm25_tokenize(text) for text in chunk_store.iter_texts()]
+            bm25_index = SparseBM25Index.from_tokenized_corpus(tokenized_corpus)
+
+        # Index trích dẫn (văn bản, Điều) -> chunk id, tạo sẵn bởi data_loader; nếu chưa có thì tạo từ kho chunk
+        citation_index = None
+        if settings.CITATION_FAST_PATH_ENABLED:
+            if CitationIndex.exists(settings.CITATION_INDEX_PATH):
+                citation_index = CitationIndex.load(settings.CITATION_INDEX_PATH)
+                if citation_index.num_chunks != len(chunk_store):
+                    logger.warning("Citation index on disk does not match the chunk store, ignoring it.")
+                    citation_index = None
+            if citation_index is None:
+                citation_index = CitationIndex.from_chunk_store(chunk_store)
+            logger.info("✅ Citation index loaded with %s articles.", len(citation_index))
+        return chunk_store, bm25_index, citation_index
+
+    def _build_retriever(self, sparse_indexes: Optional[Tuple[ChunkStore, SparseBM25Index, Optional[CitationIndex]]] = None,
+                         version: Optional[str] = None) -> "HybridRerankingRetriever":
+        """
+        Tải Vector Store của phiên bản corpus `version` (và kho chunk + BM25 Index nếu chưa được tải sẵn)
+        rồi tạo retriever lai ghép, dùng lại các model (embedding, reranker) và cache đã nạp sẵn.
+        """
+        chunk_store, bm25_index, citation_index = sparse_indexes or self._load_sparse_indexes()
+
+        # Tải ChromaDB từ đĩa (mỗi phiên bản corpus nằm trong thư mục riêng <vector_store>/<version>)
+        vector_store_directory = versioned_directory(settings.VECTOR_STORE_DIRECTORY, version)
+        logger.info("Loading Vector Store from disk: %s", vector_store_directory)
+        # Thay vì Chroma.from_documents, chúng ta khởi tạo Chroma và trỏ đến thư mục đã lưu
+        vector_store = Chroma(
+            persist_directory=vector_store_directory,
+            embedding_function=self.langchain_embedding
+        )
+        logger.info("✅ Vector Store loaded successfully with %s documents.", vector_store._collection.count())
+
+        return HybridRerankingRetriever(
+            vector_store=vector_store,
+            bm25_searcher=bm25_index,
+            chunk_store=chunk_store,
+            reranker=self.reranker,
+            rerank_batcher=self.rerank_batcher,
+            score_cache=self.rerank_score_cache,
+            corpus_version=version,
+            citation_index=citation_index,
+            top_n_vector=settings.RETRIEVAL_TOP_N_VECTOR,
+            top_n_keyword=settings.RETRIEVAL_TOP_N_KEYWORD,
+            top_k_final=settings.RETRIEVAL_TOP_K_FINAL,
+            rerank_enabled=settings.RERANK_ENABLED,
+            fusion=settings.RETRIEVAL_FUSION,
+            rrf_k=settings.RRF_K,
+            rerank_top_m=settings.RERANK_TOP_M,
+            rerank_skip_margin=settings.RERANK_SKIP_MARGIN,
+        )
+
+    def reload_indexes(self) -> Dict[str, Any]:
+        """
+        Nạp lại kho chunk, Vector Store và BM25 Index (sau khi data_loader build lại corpus)
+        mà không dừng phục vụ: index mới được tạo trong khi index cũ vẫn trả lời request,
+        sau đó retriever được thay bằng một phép gán duy nhất. Request đang chạy đã giữ
+        tham chiếu tới retriever cũ nên vẫn hoàn tất trên snapshot cũ.
+        Cache câu trả lời và cache điểm rerank được chuyển sang phiên bản mới ngay trước khi thay retriever;
+        kết quả của các request chạy trên snapshot cũ không được ghi vào cache của phiên bản mới.
+        Vector Store của phiên bản mới nằm trong thư mục riêng; thư mục của phiên bản cũ chỉ bị xóa
+        sau khi đã chuyển sang bản mới và hết thời gian chờ `INDEX_RETIRE_GRACE_SECONDS`.
+        """
+        if not self.is_ready:
+            raise RuntimeError("RAG Service chưa được tải, không thể reload index.")
+        # Chỉ một lần reload tại một thời điểm
+        with self._reload_lock:
+            started_at = time.perf_counter()
+            new_version = read_corpus_version(settings.CORPUS_VERSION_PATH)
+            logger.info("Reloading indexes (corpus %s -> %s)...", self.corpus_version, new_version)
+            new_retriever = self._build_retriever(version=new_version)
+
+            old_version = self.corpus_version
+            old_directory = self.vector_store_directory
+            for cache in (self.answer_cache, self.rerank_score_cache):
+                if cache is not None:
+                    cache.set_corpus_version(new_version)
+            self.retriever = new_retriever
+            self.conversation_chain.retriever = new_retriever
+            self.vector_store = new_retriever.vector_store
+            self.corpus_version = new_version
+            self.vector_store_directory = versioned_directory(settings.VECTOR_STORE_DIRECTORY, new_version)
+            self._retire_vector_store_directory(old_directory, self.vector_store_directory)
+
+            elapsed = time.perf_counter() - started_at
+            logger.info("✅ Indexes reloaded in %.2fs.", elapsed)
+            return {
+                "previous_corpus_version": old_version,
+                "corpus_version": new_version,
+                "num_chunks": len(new_retriever.chunk_store),
+                "seconds": round(elapsed, 3),
+            }
+
+    def _retire_vector_store_directory(self, old_directory: Optional[str], new_directory: Optional[str]) -> None:
+        """Xóa thư mục Vector Store của phiên bản cũ sau thời gian chờ (request đang chạy trên bản cũ hoàn tất)."""
+        if (not old_directory or os.path.normpath(old_directory) == os.path.normpath(new_directory or "")
+                or os.path.normpath(old_directory) == os.path.normpath(settings.VECTOR_STORE_DIRECTORY)):
+            # Dữ liệu cũ chưa phân phiên bản nằm ngay tại thư mục gốc: không bao giờ xóa thư mục gốc
+            return
+
+        def retire():
+            logger.info("Removing retired Vector Store directory: %s", old_directory)
+            shutil.rmtree(old_directory, ignore_errors=True)
+
+        timer = threading.Timer(settings.INDEX_RETIRE_GRACE_SECONDS, retire)
+        timer.daemon = True
+        timer.start()
+
+    async def areload_indexes(self) -> Dict[str, Any]:
+        """Reload index trên một luồng riêng (không chiếm worker của inference executor)."""
+        return await asyncio.to_thread(self.reload_indexes)
+
+    def start_index_watcher(self, poll_seconds: float) -> None:
+        """Luồng nền theo dõi file phiên bản corpus và tự reload index khi phiên bản thay đổi."""
+        if poll_seconds <= 0 or self._watcher_thread is not None:
+            return
+        tracker = CorpusVersionTracker(settings.CORPUS_VERSION_PATH)
+
+        def watch():
+            while not self._watcher_stop.wait(poll_seconds):
+                version = tracker.refresh()
+                if version is None or version == self.corpus_version or not self.is_ready:
+                    continue
+                try:
+                    self.reload_indexes()
+                except Exception as e:
+                    # Giữ nguyên index cũ, lần thăm dò sau sẽ thử lại
+                    logger.error("Index reload failed, keeping current indexes: %s", e)
+
+        self._watcher_thread = threading.Thread(target=watch, name="index-watcher", daemon=True)
+        self._watcher_thread.start()
+
+    def _build_where_filter(self, standalone_question: str) -> Optional[Dict[str, Any]]:
+        """Trích xuất metadata từ câu hỏi độc lập để tạo bộ lọc cho retriever."""
+        query_details = extract_query_details(standalone_question)
+        where_filter = {}
+        if query_details.get('document_number_partial'):
+            where_filter['document_number'] = {"$contains": query_details['document_number_partial']}
+        if query_details.get('article_number'):
+            where_filter['article_number'] = query_details['article_number']
+        return where_filter if where_filter else None
+
+    def _retrieve(self, standalone_question: str, where_filter: Optional[Dict[str, Any]]) -> List[Document]:
+        """Bước retrieval đồng bộ (embedding, Chroma, BM25, rerank) - nặng CPU."""
+        # Lấy tham chiếu một lần: nếu index được reload giữa chừng, request này vẫn dùng snapshot cũ
+        retriever = self.retriever
+        cited_docs = retriever.citation_search(standalone_question)
+        if cited_docs is not None:
+            return cited_docs
+        return retriever.invoke(standalone_question, config={"configurable": {"where_filter": where_filter}})
+
+    @staticmethod
+    def _build_response(answer: Dict[str, Any]) -> Dict[str, Any]:
+        sources = [
+            {**doc.metadata, "page_content": doc.page_content}
+            for doc in answer.get("input_documents", [])
+        ]
+        return {"answer": answer.get("output_text"), "sources": sources}
+
+    def _lookup_answer(self, standalone_question: str, where_filter: Optional[Dict[str, Any]]):
+        """Tra cứu cache câu trả lời; trả về (response hoặc None, metadata cache)."""
+        if not self.answer_cache:
+            return None, {"cache": "disabled"}
+        entry, cache_info = self.answer_cache.lookup(standalone_question, where_filter)
+        if entry is None:
+            return None, cache_info
+        logger.debug("Answer cache hit (%s)", cache_info['cache'])
+        return {"answer": entry.answer, "sources": entry.sources, "metadata": cache_info}, cache_info
+
+    def _store_answer(self, standalone_question: str, where_filter: Optional[Dict[str, Any]], response: Dict[str, Any],
+                      corpus_version: Optional[str]):
+        """Lưu câu trả lời vào cache (`corpus_version` = phiên bản đang phục vụ lúc request bắt đầu)."""
+        if self.answer_cache:
+            self.answer_cache.store(
+                standalone_question, where_filter, response["answer"], response["sources"], corpus_version
+            )
+
+    def _prepare_context(self, question: str, docs: List[Document], metadata: Dict[str, Any]) -> List[Document]:
+        """Gộp/cắt gọn các chunk thành ngữ cảnh vừa ngân sách token cho prompt trả lời (ghi số token vào metadata)."""
+        if not settings.CONTEXT_ASSEMBLY_ENABLED:
+            return docs
+        with metrics.stage("context"):
+            context_docs, context_stats = self.context_builder.build(question, docs)
+        metadata.update(context_stats)
+        return context_docs
+
+    async def _run_in_executor(self, func, *args):
+        """
+        Chạy một hàm đồng bộ trên inference executor để không chặn event loop
+        (mang theo contextvar của request để thời gian từng bước được ghi vào đúng request).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, metrics.bind_context(func, *args))
+
+    def _finish_request(self, mode: str, outcome: str, started_at: float, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Ghi thời gian toàn request vào histogram, gắn bảng thời gian từng bước vào metadata trả về và log."""
+        elapsed = time.perf_counter() - started_at
+        metrics.observe_request(mode, outcome, elapsed)
+        timings = metrics.request_timings() or {}
+        if metadata is not None:
+            metadata["timings_ms"] = dict(timings)
+        logger.info("RAG %s request %s in %.1f ms, stages (ms): %s", mode, outcome, elapsed * 1000, timings)
+
+    def _start_speculation(self, question: str, expanded_question: str, chat_history: list) -> Optional[SpeculativeRetrieval]:
+        """
+        Nếu sắp phải gọi LLM để viết lại câu hỏi, bắt đầu retrieval ngay trên câu hỏi đã mở rộng
+        (chạy trên inference executor) để hai độ trễ chồng lên nhau thay vì cộng dồn.
+        Khi câu viết lại đã có trong cache thì không có độ trễ LLM nào để che: không chạy trước, tránh
+        một lượt retrieval thừa chiếm worker của executor (tác vụ đã chạy thì không hủy được).
+        """
+        if not settings.SPECULATIVE_RETRIEVAL_ENABLED or not self.question_rewriter.will_call_llm(
+            question, expanded_question, chat_history
+        ):
+            return None
+        where_filter = self._build_where_filter(expanded_question)
+        future = self._executor.submit(metrics.bind_context(self._retrieve, expanded_question, where_filter))
+        return SpeculativeRetrieval(question=expanded_question, where_filter=where_filter, future=future)
+
+    def _use_speculation(self, speculation: Optional[SpeculativeRetrieval], standalone_question: str,
+                         where_filter: Optional[Dict[str, Any]], metadata: Dict[str, Any]) -> bool:
+        """Quyết định dùng lại kết quả retrieval chạy trước hay không (ghi kết quả vào metadata và thống kê)."""
+        if speculation is None:
+            return False
+        hit = self.speculation_tracker.matches(speculation, standalone_question, where_filter)
+        self.speculation_tracker.record(hit)
+        metadata["speculative_retrieval"] = "hit" if hit else "miss"
+        if not hit:
+            # Nếu chưa kịp chạy thì hủy để nhường worker cho retrieval trên câu hỏi độc lập
+            speculation.future.cancel()
+        return hit
+
+    async def _aretrieve(self, speculation: Optional[SpeculativeRetrieval], standalone_question: str,
+                         where_filter: Optional[Dict[str, Any]], metadata: Dict[str, Any]) -> List[Document]:
+        if self._use_speculation(speculation, standalone_question, where_filter, metadata):
+            return await asyncio.wrap_future(speculation.future)
+        return await self._run_in_executor(self._retrieve, standalone_question, where_filter)
+
     def ask(self, question: str, chat_history: list = []) -> Dict[str, Any]:
         """
         Hàm xử lý câu hỏi, sử dụng trực tiếp ConversationalRetrievalChain.
@@ -307,56 +878,239 @@ class RAGService:
         if not self.is_ready or not self.conversation_chain:
             return {"answer": "Hệ thống chưa sẵn sàng...", "sources": []}
         
+        started_at = time.perf_counter()
+        # Ghi nhận trước retrieval: retriever được thay trước corpus_version khi reload
+        corpus_version = self.corpus_version
+        metrics.start_request()
+        outcome, metadata = "error", None
         try:
             # Logic xử lý meta-question vẫn hữu ích
-            meta_questions = ["bạn là ai", "bạn tên gì"]
-            if any(q in question.lower() for q in meta_questions):
-                return {"answer": "Tôi là LawBot, một trợ lý AI chuyên về Luật Giao thông...", "sources": []}
+            if any(q in question.lower() for q in META_QUESTIONS):
+                outcome = "meta"
+                return {"answer": META_ANSWER, "sources": []}
 
             # --- BƯỚC 2: Mở rộng câu hỏi của người dùng ---
-            expanded_question = expand_query(question)
-            print(f"INFO: Expanded Query: '{expanded_question}'")
+            with metrics.stage("expand"):
+                expanded_question = expand_query(question)
+            logger.debug("Expanded Query: '%s'", expanded_question)
             
             # --- BƯỚC 3: Tái cấu trúc câu hỏi dựa trên lịch sử ---
-            # Chúng ta sẽ gọi riêng phần "tạo câu hỏi" của chain
-            _inputs = {"question": expanded_question, "chat_history": chat_history}
-            result_from_generator = self.conversation_chain.question_generator.invoke(_inputs)
-            # Lấy giá trị từ key 'text' thay vì gán cả dictionary
-            standalone_question = result_from_generator.get('text', expanded_question) 
+            # Chỉ gọi phần "tạo câu hỏi" của chain khi thật sự cần (có lịch sử và câu hỏi chưa tự đủ nghĩa);
+            # trong lúc chờ LLM, retrieval trên câu hỏi gốc chạy trước ở nền
+            speculation = self._start_speculation(question, expanded_question, chat_history)
+            with metrics.stage("rewrite"):
+                standalone_question = self.question_rewriter.rewrite(question, expanded_question, chat_history)
             
-            print(f"INFO: Standalone question: '{standalone_question}'")
+            logger.debug("Standalone question: '%s'", standalone_question)
             # --- BƯỚC 4: Trích xuất metadata và Lọc ---
-            query_details = extract_query_details(standalone_question)
-            where_filter = {}
-            if query_details.get('document_number_partial'):
-                where_filter['document_number'] = {"$contains": query_details['document_number_partial']}
-            if query_details.get('article_number'):
-                where_filter['article_number'] = query_details['article_number']
-            
-            final_filter = where_filter if where_filter else None
+            final_filter = self._build_where_filter(standalone_question)
+
+            # Cache câu trả lời: trúng thì trả về ngay, bỏ qua retrieval và LLM
+            with metrics.stage("cache_lookup"):
+                cached_response, cache_info = self._lookup_answer(standalone_question, final_filter)
+            if cached_response:
+                if speculation is not None:
+                    speculation.future.cancel()
+                outcome, metadata = "cache_hit", cached_response["metadata"]
+                return cached_response
             
-            # Gọi retriever với câu hỏi độc lập và bộ lọc
-            retriever = self.conversation_chain.retriever
-            docs = retriever.invoke(standalone_question, config={"configurable": {"where_filter": final_filter}})
+            # Gọi retriever với câu hỏi độc lập và bộ lọc (hoặc dùng lại kết quả chạy trước nếu tương đương)
+            with metrics.stage("retrieve"):
+                if self._use_speculation(speculation, standalone_question, final_filter, cache_info):
+                    docs = speculation.future.result()
+                else:
+                    docs = self._retrieve(standalone_question, final_filter)
 
             # --- BƯỚC 5: Gọi chain sinh câu trả lời ---
             # Chúng ta gọi riêng phần "kết hợp tài liệu" của chain
-            new_inputs = {"question": standalone_question, "input_documents": docs}
-            answer = self.conversation_chain.combine_docs_chain.invoke(new_inputs)
+            context_docs = self._prepare_context(standalone_question, docs, cache_info)
+            new_inputs = {"question": standalone_question, "input_documents": context_docs}
+            with metrics.stage("generate"):
+                answer = self.conversation_chain.combine_docs_chain.invoke(new_inputs)
             
-            # sources = [doc.metadata for doc in answer.get("input_documents", [])]
-            sources = [
-            {**doc.metadata, "page_content": doc.page_content} 
-            for doc in answer.get("input_documents", [])
-            ]
+            # Nguồn trả về cho người dùng vẫn là các chunk gốc, không phải ngữ cảnh đã cắt gọn
+            response = self._build_response({**answer, "input_documents": docs})
+            self._store_answer(standalone_question, final_filter, response, corpus_version)
+            outcome, metadata = "ok", cache_info
+            return {**response, "metadata": cache_info}
 
-            return {"answer": answer.get("output_text"), "sources": sources}
+        except Exception as e:
+            logger.exception("Error in ask function: %s", e)
+            return {"answer": "Đã có lỗi nghiêm trọng xảy ra...", "sources": []}
+        finally:
+            self._finish_request("sync", outcome, started_at, metadata)
+
+    async def _acondense(self, question: str, chat_history: list):
+        """
+        Mở rộng và tái cấu trúc câu hỏi (ainvoke khi cần), trả về (câu hỏi độc lập, bộ lọc, retrieval chạy trước).
+        """
+        with metrics.stage("expand"):
+            expanded_question = expand_query(question)
+        logger.debug("Expanded Query: '%s'", expanded_question)
+
+        speculation = self._start_speculation(question, expanded_question, chat_history)
+        try:
+            with metrics.stage("rewrite"):
+                standalone_question = await self.question_rewriter.arewrite(question, expanded_question, chat_history)
+        except BaseException:
+            if speculation is not None:
+                speculation.future.cancel()
+            raise
+        logger.debug("Standalone question: '%s'", standalone_question)
+
+        return standalone_question, self._build_where_filter(standalone_question), speculation
+
+    async def ask_async(self, question: str, chat_history: Optional[list] = None) -> Dict[str, Any]:
+        """
+        Phiên bản bất đồng bộ của `ask`: các bước nặng CPU chạy trên inference executor,
+        các lời gọi LLM dùng `ainvoke`, nên event loop luôn rảnh cho các request khác.
+        """
+        if not self.is_ready or not self.conversation_chain:
+            return {"answer": "Hệ thống chưa sẵn sàng...", "sources": []}
+
+        chat_history = chat_history or []
+        started_at = time.perf_counter()
+        # Ghi nhận trước retrieval: retriever được thay trước corpus_version khi reload
+        corpus_version = self.corpus_version
+        metrics.start_request()
+        outcome, metadata = "error", None
+        try:
+            if any(q in question.lower() for q in META_QUESTIONS):
+                outcome = "meta"
+                return {"answer": META_ANSWER, "sources": []}
+
+            standalone_question, final_filter, speculation = await self._acondense(question, chat_history)
+
+            with metrics.stage("cache_lookup"):
+                # Tra cứu gần đúng cần embedding câu hỏi: chạy trên inference executor, không chặn event loop
+                cached_response, cache_info = await self._run_in_executor(
+                    self._lookup_answer, standalone_question, final_filter
+                )
+            if cached_response:
+                if speculation is not None:
+                    speculation.future.cancel()
+                outcome, metadata = "cache_hit", cached_response["metadata"]
+                return cached_response
+
+            with metrics.stage("retrieve"):
+                docs = await self._aretrieve(speculation, standalone_question, final_filter, cache_info)
+
+            context_docs = self._prepare_context(standalone_question, docs, cache_info)
+            new_inputs = {"question": standalone_question, "input_documents": context_docs}
+            with metrics.stage("generate"):
+                answer = await self.conversation_chain.combine_docs_chain.ainvoke(new_inputs)
+
+            response = self._build_response({**answer, "input_documents": docs})
+            await self._run_in_executor(self._store_answer, standalone_question, final_filter, response, corpus_version)
+            outcome, metadata = "ok", cache_info
+            return {**response, "metadata": cache_info}
 
         except Exception as e:
-            print(f"ERROR in ask function: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in ask_async function: %s", e)
             return {"answer": "Đã có lỗi nghiêm trọng xảy ra...", "sources": []}
+        finally:
+            self._finish_request("async", outcome, started_at, metadata)
+
+    async def ask_stream(self, question: str, chat_history: Optional[list] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Phiên bản streaming: yield ("sources", ...) ngay khi rerank xong,
+        sau đó yield ("token", ...) cho từng đoạn câu trả lời mà LLM sinh ra.
+        """
+        if not self.is_ready or not self.conversation_chain:
+            yield "sources", {"sources": []}
+            yield "token", {"text": "Hệ thống chưa sẵn sàng..."}
+            return
+
+        chat_history = chat_history or []
+        started_at = time.perf_counter()
+        # Ghi nhận trước retrieval: retriever được thay trước corpus_version khi reload
+        corpus_version = self.corpus_version
+        metrics.start_request()
+        outcome = "error"
+        try:
+            if any(q in question.lower() for q in META_QUESTIONS):
+                outcome = "meta"
+                yield "sources", {"sources": []}
+                yield "token", {"text": META_ANSWER}
+                return
+
+            standalone_question, final_filter, speculation = await self._acondense(question, chat_history)
+
+            with metrics.stage("cache_lookup"):
+                # Tra cứu gần đúng cần embedding câu hỏi: chạy trên inference executor, không chặn event loop
+                cached_response, cache_info = await self._run_in_executor(
+                    self._lookup_answer, standalone_question, final_filter
+                )
+            if cached_response:
+                if speculation is not None:
+                    speculation.future.cancel()
+                outcome = "cache_hit"
+                yield "sources", {"sources": cached_response["sources"], "metadata": cache_info}
+                yield "token", {"text": cached_response["answer"]}
+                return
+
+            with metrics.stage("retrieve"):
+                docs = await self._aretrieve(speculation, standalone_question, final_filter, cache_info)
+            sources = self._build_response({"input_documents": docs})["sources"]
+            context_docs = self._prepare_context(standalone_question, docs, cache_info)
+            yield "sources", {"sources": sources, "metadata": cache_info}
+
+            # Tự format prompt giống StuffDocumentsChain để có thể stream trực tiếp từ LLM
+            combine_chain = self.conversation_chain.combine_docs_chain
+            context = combine_chain.document_separator.join(
+                format_document(doc, combine_chain.document_prompt) for doc in context_docs
+            )
+            prompt_value = combine_chain.llm_chain.prompt.format_prompt(
+                context=context, question=standalone_question
+            )
+            # Client có thể ngắt kết nối giữa chừng (generator bị đóng)
+            outcome = "cancelled"
+            answer_parts = []
+            generate_started_at = time.perf_counter()
+            async for chunk in self.llm.astream(prompt_value):
+                if chunk.content:
+                    if not answer_parts:
+                        # Độ trễ người dùng cảm nhận: từ lúc nhận câu hỏi tới token đầu tiên
+                        metrics.record_stage("time_to_first_token", time.perf_counter() - started_at)
+                    answer_parts.append(chunk.content)
+                    yield "token", {"text": chunk.content}
+            metrics.record_stage("generate", time.perf_counter() - generate_started_at)
+
+            await self._run_in_executor(
+                self._store_answer, standalone_question, final_filter,
+                {"answer": "".join(answer_parts), "sources": sources}, corpus_version,
+            )
+            outcome = "ok"
+
+        except Exception as e:
+            outcome = "error"
+            logger.exception("Error in ask_stream function: %s", e)
+            yield "error", {"detail": "Đã có lỗi nghiêm trọng xảy ra..."}
+        finally:
+            self._finish_request("stream", outcome, started_at)
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê các cache, micro-batcher và retrieval chạy trước (dùng để tinh chỉnh cấu hình)."""
+        return {
+            "speculative_retrieval": self.speculation_tracker.stats(),
+            "question_rewriter": self.question_rewriter.stats() if self.question_rewriter else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None,
+            "rerank_cache": self.rerank_score_cache.stats() if self.rerank_score_cache else None,
+            "embedding_cache": self.langchain_embedding.cache_stats() if self.is_ready else None,
+            "rerank_batcher": self.rerank_batcher.stats() if self.rerank_batcher else None,
+            "embedding_batcher": self.embedding_batcher.stats() if self.embedding_batcher else None,
+            "inference_executor": {"queue_depth": self._executor._work_queue.qsize()},
+        }
+
+    def shutdown(self):
+        """Giải phóng inference executor và các micro-batcher khi ứng dụng tắt."""
+        self._watcher_stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for batcher in (self.rerank_batcher, self.embedding_batcher):
+            if batcher is not None:
+                batcher.shutdown()
+        if self.rerank_score_cache is not None:
+            self.rerank_score_cache.save()
 
 # Tạo một instance duy nhất (singleton) để import và sử dụng trong toàn bộ ứng dụng
 rag_service = RAGService()
\ No newline at end of file
@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.schema import Document
+
+from app.services.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def get_chunk_id(doc: Document) -> str:
+    """Id ổn định của một chunk: lấy từ metadata nếu có, nếu không thì hash nội dung."""
+    chunk_id = doc.metadata.get("chunk_id")
+    if chunk_id is not None:
+        return str(chunk_id)
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+
+def query_hash(query: str) -> str:
+    normalized = " ".join(unicodedata.normalize("NFC", query).split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """
+    Cache điểm CrossEncoder theo (hash câu truy vấn đã chuẩn hóa, id chunk).
+    Bị xóa khi model reranker (hoặc backend inference) hoặc phiên bản corpus đang phục vụ thay đổi
+    (`set_corpus_version`, gọi khi RAG service thay retriever); có thể lưu ra đĩa để dùng lại sau khi restart.
+    """
+    def __init__(
+        self,
+        model_path: str,
+        corpus_version: Optional[str] = None,
+        max_size: int = 100_000,
+        persist_path: Optional[str] = None,
+        model_variant: str = "",
+    ):
+        self.model_path = model_path
+        # Backend inference (torch/int8/onnx + file) - điểm giữa các backend lệch nhau đôi chút
+        self.model_variant = model_variant
+        self.persist_path = persist_path
+        self.scores = LRUCache(max_size)
+        self._corpus_version = corpus_version
+        self._lock = threading.Lock()
+        if persist_path:
+            self._load()
+
+    @property
+    def fingerprint(self) -> tuple:
+        return (os.path.abspath(self.model_path), self.model_variant, self._corpus_version)
+
+    def set_corpus_version(self, version: Optional[str]) -> None:
+        with self._lock:
+            if version != self._corpus_version:
+                self._corpus_version = version
+                self.scores.clear()
+
+    def get_many(self, query: str, chunk_ids: Sequence[str], corpus_version: Optional[str] = None) -> List[Optional[float]]:
+        # Chunk id chỉ có nghĩa trong một phiên bản corpus: retriever của bản khác không dùng chung điểm
+        if corpus_version is not None and corpus_version != self._corpus_version:
+            return [None] * len(chunk_ids)
+        qh = query_hash(query)
+        return [self.scores.get((qh, chunk_id)) for chunk_id in chunk_ids]
+
+    def put_many(self, query: str, chunk_ids: Sequence[str], scores: Sequence[float],
+                 corpus_version: Optional[str] = None) -> None:
+        if corpus_version is not None and corpus_version != self._corpus_version:
+            return
+        qh = query_hash(query)
+        for chunk_id, score in zip(chunk_ids, scores):
+            self.scores.put((qh, chunk_id), float(score))
+
+    def _load(self) -> None:
+        try:
+            with open(self.persist_path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("Could not read rerank score cache '%s': %s", self.persist_path, e)
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            logger.info("Rerank score cache on disk is stale (model or corpus changed), ignoring it.")
+            return
+        for key, score in data.get("entries", []):
+            self.scores.put(key, score)
+        logger.info("Loaded %s rerank scores from '%s'.", len(self.scores), self.persist_path)
+
+    def save(self) -> None:
+        """Ghi cache ra đĩa (ghi nguyên tử qua file tạm)."""
+        if not self.persist_path:
+            return
+        Path(self.persist_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"fingerprint": self.fingerprint, "entries": self.scores.items()}, f)
+        os.replace(tmp_path, self.persist_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.scores.stats()
@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain.schema import Document
+
+from app.services.answer_cache import normalize_question
+
+
+@dataclass
+class SpeculativeRetrieval:
+    """Một lần retrieval chạy trước trên câu hỏi gốc (đã mở rộng) trong khi LLM đang viết lại câu hỏi."""
+    question: str
+    where_filter: Optional[Dict[str, Any]]
+    future: "Future[List[Document]]"
+
+
+def _token_overlap(a: str, b: str) -> float:
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class SpeculationTracker:
+    """
+    Quyết định có dùng lại kết quả retrieval chạy trước hay không và đếm tỉ lệ trúng.
+    Kết quả được dùng lại khi câu hỏi độc lập trùng với câu hỏi đã dùng để retrieval (sau chuẩn hóa),
+    hoặc khi hai câu có cùng bộ lọc metadata và đủ nhiều từ chung (Jaccard >= `min_overlap`).
+    """
+    def __init__(self, min_overlap: float = 0.8):
+        self.min_overlap = min_overlap
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def matches(self, speculation: SpeculativeRetrieval, standalone_question: str,
+                where_filter: Optional[Dict[str, Any]]) -> bool:
+        speculative_question = normalize_question(speculation.question)
+        standalone_question = normalize_question(standalone_question)
+        if speculative_question == standalone_question:
+            return True
+        return (speculation.where_filter == where_filter
+                and _token_overlap(speculative_question, standalone_question) >= self.min_overlap)
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
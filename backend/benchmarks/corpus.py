@@ -0,0 +1,140 @@
+"""
+Corpus dùng cho benchmark: sinh ngẫu nhiên (tất định theo seed) các Điều luật giao thông giả lập
+có nhãn liên quan cho từng câu hỏi, hoặc lấy mẫu từ kho chunk thật.
+"""
+import os
+import random
+import shutil
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.services.chunk_store import ChunkStore
+from app.services.corpus_version import compute_corpus_version
+
+VEHICLES = [
+    ("xe mô tô, xe gắn máy", "xe máy"),
+    ("xe ô tô", "ô tô"),
+    ("xe máy chuyên dùng", "xe máy chuyên dùng"),
+    ("xe đạp, xe đạp máy", "xe đạp"),
+    ("xe thô sơ", "xe thô sơ"),
+]
+VIOLATIONS = [
+    ("không chấp hành hiệu lệnh của đèn tín hiệu giao thông", "vượt đèn đỏ"),
+    ("điều khiển xe chạy quá tốc độ cho phép từ 05 km/h đến dưới 10 km/h", "chạy quá tốc độ"),
+    ("điều khiển xe trên đường mà trong máu hoặc hơi thở có nồng độ cồn", "uống rượu bia lái xe"),
+    ("không đội mũ bảo hiểm hoặc đội mũ không cài quai đúng quy cách", "không đội mũ bảo hiểm"),
+    ("dùng tay sử dụng điện thoại di động khi đang điều khiển xe", "dùng điện thoại khi lái xe"),
+    ("đi không đúng phần đường hoặc làn đường quy định", "đi sai làn"),
+    ("dừng xe, đỗ xe trên phần đường dành cho người đi bộ", "đỗ xe trên vỉa hè"),
+    ("chuyển hướng không có tín hiệu báo hướng rẽ", "không bật xi nhan"),
+    ("không có giấy phép lái xe", "không có bằng lái"),
+    ("không mang theo giấy đăng ký xe", "quên giấy tờ xe"),
+    ("điều khiển xe lạng lách, đánh võng", "lạng lách"),
+    ("chở theo từ 02 người trở lên trên xe", "chở ba"),
+    ("quay đầu xe tại nơi không được quay đầu xe", "quay đầu sai"),
+    ("sử dụng còi liên tục", "bấm còi liên tục"),
+    ("đi ngược chiều của đường một chiều", "đi ngược chiều"),
+]
+FILLER = [
+    "Người điều khiển phương tiện phải tuân thủ quy tắc giao thông đường bộ.",
+    "Cơ quan có thẩm quyền xử phạt thực hiện theo quy định của pháp luật về xử lý vi phạm hành chính.",
+    "Trường hợp tái phạm, mức phạt được áp dụng theo khung cao hơn.",
+    "Ngoài việc bị phạt tiền, người vi phạm còn có thể bị áp dụng hình thức xử phạt bổ sung.",
+]
+CHAPTERS = ["I", "II", "III", "IV", "V"]
+
+
+@dataclass
+class BenchmarkQuery:
+    question: str
+    relevant_ids: List[int] = field(default_factory=list)
+
+
+def synthetic_corpus(num_chunks: int, seed: int = 42, num_queries: int = 50) -> Tuple[List[Document], List[BenchmarkQuery]]:
+    """
+    Sinh `num_chunks` Điều (mỗi Điều một chunk) theo cấu trúc văn bản xử phạt thật:
+    header "Trích từ: ...", tên Điều, các khoản mức phạt và các điểm hành vi vi phạm.
+    Mỗi câu hỏi (cách nói phổ thông về hành vi + phương tiện) được gán nhãn các chunk chứa đúng cặp đó.
+    """
+    rng = random.Random(seed)
+    docs: List[Document] = []
+    pairs_to_ids = {}
+    for chunk_id in range(num_chunks):
+        decree_number = f"{100 + chunk_id // 50}/2024/NĐ-CP"
+        article_number = str(chunk_id % 50 + 1)
+        vehicle_index = rng.randrange(len(VEHICLES))
+        vehicle = VEHICLES[vehicle_index][0]
+        chapter = f"Chương {rng.choice(CHAPTERS)} - Vi phạm quy tắc giao thông đường bộ"
+        title = f"Điều {article_number}. Xử phạt người điều khiển {vehicle} vi phạm quy tắc giao thông đường bộ"
+        lines = [title]
+        violation_indices = rng.sample(range(len(VIOLATIONS)), k=4)
+        for clause, start in enumerate(range(0, len(violation_indices), 2), start=1):
+            low = rng.choice([200, 400, 800, 1000, 2000, 4000, 6000])
+            lines.append(f"{clause}. Phạt tiền từ {low}.000 đồng đến {low * 2}.000 đồng đối với người điều khiển xe "
+                         f"thực hiện một trong các hành vi vi phạm sau đây:")
+            for point, violation_index in zip("abcdđ", violation_indices[start:start + 2]):
+                lines.append(f"{point}) {VIOLATIONS[violation_index][0]};")
+                pairs_to_ids.setdefault((violation_index, vehicle_index), []).append(chunk_id)
+        lines.append(f"{len(violation_indices) // 2 + 1}. {rng.choice(FILLER)}")
+        header = f"Trích từ: Nghị định {decree_number}, {chapter}\n\n"
+        docs.append(Document(page_content=header + "\n".join(lines), metadata={
+            "source_file": f"nghi-dinh-{decree_number.split('/')[0]}-2024-nd-cp.pdf",
+            "document_type": "Nghị định",
+            "document_number": decree_number,
+            "chuong": chapter,
+            "dieu": title,
+            "article_number": article_number,
+            "chunk_id": chunk_id,
+        }))
+
+    queries = []
+    pairs = sorted(pairs_to_ids)
+    for violation_index, vehicle_index in rng.sample(pairs, k=min(num_queries, len(pairs))):
+        colloquial = VIOLATIONS[violation_index][1]
+        vehicle_short = VEHICLES[vehicle_index][1]
+        queries.append(BenchmarkQuery(
+            question=f"Mức phạt khi {colloquial} đối với {vehicle_short} là bao nhiêu?",
+            relevant_ids=pairs_to_ids[(violation_index, vehicle_index)],
+        ))
+    return docs, queries
+
+
+def sampled_corpus(num_chunks: int) -> List[Document]:
+    """Lấy `num_chunks` chunk đầu tiên từ kho chunk thật (không có nhãn liên quan)."""
+    store = ChunkStore.load(settings.CHUNK_STORE_DIRECTORY)
+    return [store.get_document(row) for row in range(min(num_chunks, len(store)))]
+
+
+def point_settings_at(workdir: str) -> None:
+    """Trỏ các đường dẫn index trong settings vào thư mục của benchmark (không đụng tới dữ liệu thật)."""
+    settings.CHUNK_STORE_DIRECTORY = os.path.join(workdir, "chunks")
+    settings.BM25_INDEX_DIRECTORY = os.path.join(workdir, "bm25")
+    settings.VECTOR_STORE_DIRECTORY = os.path.join(workdir, "Chroma")
+    settings.CORPUS_VERSION_PATH = os.path.join(workdir, "corpus_version.json")
+    settings.CITATION_INDEX_PATH = os.path.join(workdir, "citation_index.json")
+    settings.ALL_CHUNKS_PATH = os.path.join(workdir, "all_chunks.pkl")
+
+
+def build_indexes(docs: List[Document], workdir: str, embed_batch_size: int = 256) -> None:
+    """Build kho chunk, BM25, index trích dẫn và Chroma cho corpus benchmark bằng đúng các bước của data_loader."""
+    from langchain_chroma import Chroma
+    from app.services import data_loader
+
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    point_settings_at(workdir)
+    data_loader.save_chunk_store_and_bm25(docs, settings.CHUNK_STORE_DIRECTORY, settings.BM25_INDEX_DIRECTORY)
+    data_loader.save_citation_index(docs, settings.CITATION_INDEX_PATH)
+    # Cùng bố cục thư mục theo phiên bản corpus như data_loader: <vector_store>/<version>
+    version_store_path = os.path.join(settings.VECTOR_STORE_DIRECTORY, compute_corpus_version(docs))
+    vector_store = Chroma(
+        persist_directory=version_store_path,
+        embedding_function=data_loader.load_embedding_function(),
+    )
+    data_loader.embed_into_vector_store(
+        vector_store, docs, os.path.join(workdir, "embed.checkpoint.json"), batch_size=embed_batch_size
+    )
+    data_loader.stamp_new_corpus_version(docs, settings.CORPUS_VERSION_PATH)
@@ -0,0 +1,234 @@
+"""
+Benchmark từng bước của pipeline RAG (và end-to-end với LLM offline) trên corpus sinh ngẫu nhiên
+hoặc lấy mẫu từ kho chunk thật, báo cáo p50/p95/p99 và throughput, so sánh với baseline đã lưu.
+
+    cd backend
+    python -m benchmarks.rag_pipeline_bench --num-chunks 2000 --save-baseline
+    python -m benchmarks.rag_pipeline_bench --num-chunks 2000 --check      # exit 1 nếu có bước chậm hơn baseline
+
+--check exit 2 nếu không có baseline cùng cấu hình. Baseline phụ thuộc máy chạy nên không được commit sẵn:
+lưu một lần (--save-baseline) trên đúng máy/CI sẽ chạy --check.
+
+Cần các model trong MODELS_DIRECTORY (đo đúng model sẽ chạy trên server); LLM luôn là provider "offline".
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.core.config import settings
+from benchmarks.corpus import BenchmarkQuery, build_indexes, point_settings_at, sampled_corpus, synthetic_corpus
+
+DEFAULT_BASELINE_PATH = Path(__file__).parent / "baseline.json"
+DEFAULT_WORKDIR = "data/benchmarks/rag_pipeline"
+
+FOLLOW_UP_QUESTIONS = ["Còn ô tô thì sao?", "Vậy tái phạm thì thế nào?", "Thế còn xe đạp?"]
+CHAT_HISTORY = [
+    HumanMessage(content="Mức phạt khi vượt đèn đỏ đối với xe máy là bao nhiêu?"),
+    AIMessage(content="Theo Nghị định 168/2024/NĐ-CP, người điều khiển xe máy vượt đèn đỏ bị phạt tiền."),
+]
+
+
+def summarize(latencies: Sequence[float], total_seconds: float) -> Dict[str, float]:
+    values = np.asarray(latencies) * 1000.0
+    return {
+        "count": len(values),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "throughput_per_sec": len(values) / total_seconds if total_seconds else 0.0,
+    }
+
+
+def measure(inputs: Sequence[Any], fn: Callable[[Any], Any], repeat: int) -> Dict[str, float]:
+    """Chạy `fn` trên từng input `repeat` lần, đo độ trễ từng lần gọi."""
+    latencies = []
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            call_started_at = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - call_started_at)
+    return summarize(latencies, time.perf_counter() - started_at)
+
+
+def configure_settings(args) -> None:
+    """Cấu hình đo từng bước "thô": tắt các cache và micro-batching, dùng LLM offline."""
+    settings.LLM_PROVIDER = "offline"
+    settings.OFFLINE_LLM_LATENCY_MS = args.llm_latency_ms
+    settings.OFFLINE_LLM_JITTER_MS = args.llm_latency_ms / 4
+    settings.OFFLINE_LLM_TOKEN_DELAY_MS = 0.0
+    settings.ANSWER_CACHE_ENABLED = False
+    settings.RERANK_CACHE_SIZE = 0
+    settings.EMBEDDING_CACHE_SIZE = 0
+    settings.QUESTION_REWRITE_CACHE_SIZE = 0
+    settings.INFERENCE_BATCHING_ENABLED = args.batching
+    settings.SPECULATIVE_RETRIEVAL_ENABLED = False
+    settings.WARMUP_QUERY = ""
+
+
+def prepare_corpus(args) -> List[BenchmarkQuery]:
+    if args.corpus == "synthetic":
+        docs, queries = synthetic_corpus(args.num_chunks, seed=args.seed, num_queries=args.num_queries)
+    else:
+        docs = sampled_corpus(args.num_chunks)
+        queries = [BenchmarkQuery(question=q) for q in [
+            "Mức phạt khi vượt đèn đỏ đối với xe máy là bao nhiêu?",
+            "Không đội mũ bảo hiểm bị phạt bao nhiêu tiền?",
+            "Điều khiển ô tô có nồng độ cồn bị xử phạt thế nào?",
+            "Không có giấy phép lái xe khi điều khiển xe máy bị phạt thế nào?",
+        ]]
+    workdir = os.path.join(args.workdir, f"{args.corpus}-{args.num_chunks}-{args.seed}")
+    if args.reuse_index and os.path.exists(os.path.join(workdir, "corpus_version.json")):
+        point_settings_at(workdir)
+    else:
+        print(f"⚙️ Building benchmark indexes for {len(docs)} chunks in '{workdir}'...")
+        build_indexes(docs, workdir)
+    return queries
+
+
+def run_stages(rag, queries: List[BenchmarkQuery], repeat: int) -> Dict[str, Dict[str, float]]:
+    from app.services.rag_service import expand_query
+
+    retriever = rag.retriever
+    questions = [query.question for query in queries]
+    expanded = [expand_query(question) for question in questions]
+    filters = [rag._build_where_filter(question) for question in expanded]
+    candidates = [
+        retriever._merge_candidates(retriever._vector_search(q, f), retriever._keyword_search(q))
+        for q, f in zip(expanded, filters)
+    ]
+    scores = [retriever._rerank_scores(q, c) for q, c in zip(expanded, candidates)]
+    docs = [rag._retrieve(q, f) for q, f in zip(expanded, filters)]
+    follow_ups = [(question, expand_query(question)) for question in FOLLOW_UP_QUESTIONS]
+    items = list(range(len(questions)))
+
+    results = {}
+    results["expand_query"] = measure(questions, expand_query, repeat)
+    results["condense"] = measure(
+        follow_ups, lambda item: rag.question_rewriter.rewrite(item[0], item[1], CHAT_HISTORY), repeat
+    )
+    results["vector_search"] = measure(items, lambda i: retriever._vector_search(expanded[i], filters[i]), repeat)
+    results["bm25"] = measure(expanded, retriever._keyword_search, repeat)
+    bm25_rows = [retriever._keyword_search(q) for q in expanded]
+    vector_docs = [retriever._vector_search(q, f) for q, f in zip(expanded, filters)]
+    results["merge"] = measure(items, lambda i: retriever._merge_candidates(vector_docs[i], bm25_rows[i]), repeat)
+    results["rerank"] = measure(items, lambda i: retriever._rerank_scores(expanded[i], candidates[i]), repeat)
+    results["metadata_boost"] = measure(
+        items, lambda i: retriever._apply_metadata_boost(scores[i], candidates[i], filters[i]), repeat
+    )
+    results["retrieve_total"] = measure(items, lambda i: rag._retrieve(expanded[i], filters[i]), repeat)
+    results["context_assembly"] = measure(items, lambda i: rag.context_builder.build(expanded[i], docs[i]), repeat)
+    combine_chain = rag.conversation_chain.combine_docs_chain
+    results["generation"] = measure(
+        items, lambda i: combine_chain.invoke({"question": expanded[i], "input_documents": docs[i]}), repeat
+    )
+    results["end_to_end"] = measure(questions, lambda question: rag.ask(question, []), repeat)
+    results["end_to_end_follow_up"] = measure(
+        FOLLOW_UP_QUESTIONS, lambda question: rag.ask(question, CHAT_HISTORY), repeat
+    )
+    return results
+
+
+def print_report(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>12}")
+    for stage, stats in results.items():
+        print(f"{stage:<22}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+              f"{stats['throughput_per_sec']:>12.1f}")
+
+
+def check_regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], tolerance: float,
+                      min_delta_ms: float) -> List[str]:
+    """So sánh p95 từng bước với baseline; bỏ qua chênh lệch tuyệt đối quá nhỏ (nhiễu đo)."""
+    regressions = []
+    for stage, stats in results.items():
+        reference = baseline["stages"].get(stage)
+        if reference is None:
+            continue
+        limit = reference["p95_ms"] * (1 + tolerance)
+        if stats["p95_ms"] > limit and stats["p95_ms"] - reference["p95_ms"] > min_delta_ms:
+            regressions.append(f"{stage}: p95 {stats['p95_ms']:.2f} ms > baseline {reference['p95_ms']:.2f} ms "
+                               f"(+{tolerance:.0%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark từng bước pipeline RAG.")
+    parser.add_argument("--corpus", choices=["synthetic", "sampled"], default="synthetic")
+    parser.add_argument("--num-chunks", type=int, default=2000)
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần lặp lại mỗi input cho mỗi bước.")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Độ trễ trung bình của LLM offline.")
+    parser.add_argument("--batching", action="store_true", help="Bật micro-batching (mặc định tắt khi đo từng bước).")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    parser.add_argument("--reuse-index", action="store_true", help="Dùng lại index đã build ở lần chạy trước.")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="Exit 1 nếu có bước chậm hơn baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Mức chậm hơn p95 baseline cho phép (0.2 = 20%%).")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+    if args.check and args.save_baseline:
+        parser.error("--check và --save-baseline không dùng cùng lúc (kết quả sẽ được so với chính nó).")
+    # Kiểm tra trước khi chạy benchmark: thiếu baseline thì --check phải thất bại, không lặng lẽ bỏ qua
+    if args.check and not os.path.exists(args.baseline):
+        print(f"❌ Baseline '{args.baseline}' not found, run with --save-baseline first.")
+        return 2
+
+    configure_settings(args)
+    queries = prepare_corpus(args)
+
+    from app.services.rag_service import RAGService
+    rag = RAGService()
+    rag.load()
+    if not rag.is_ready:
+        print(f"❌ RAG Service failed to load: {rag.load_error}")
+        return 2
+
+    try:
+        results = run_stages(rag, queries, args.repeat)
+    finally:
+        rag.shutdown()
+    print_report(results)
+
+    config = {key: getattr(args, key) for key in ("corpus", "num_chunks", "num_queries", "seed", "repeat",
+                                                   "llm_latency_ms", "batching")}
+    config["inference_backend"] = settings.INFERENCE_BACKEND
+    report = {"config": config, "stages": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\n✅ Baseline saved to '{args.baseline}'.")
+
+    if args.check:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        # So sánh giữa hai cấu hình khác nhau (hoặc thiếu bước) không nói lên điều gì: coi như không có baseline
+        if baseline.get("config") != config:
+            print(f"❌ Baseline config differs from this run: {baseline.get('config')} != {config}")
+            return 2
+        missing_stages = sorted(set(results) - set(baseline.get("stages", {})))
+        if missing_stages:
+            print(f"❌ Baseline has no data for stages {missing_stages}, run with --save-baseline again.")
+            return 2
+        regressions = check_regressions(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\n❌ Regressions detected:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            return 1
+        print("\n✅ No stage regressed beyond the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
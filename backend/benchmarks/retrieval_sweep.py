@@ -0,0 +1,255 @@
+"""
+Quét lưới tham số của HybridRerankingRetriever (top_n_vector, top_n_keyword, top_k_final, reranker bật/tắt, ...)
+trên một tập câu hỏi có nhãn (văn bản, Điều), báo cáo recall@k / MRR cùng độ trễ đo được cho từng cấu hình
+và biên Pareto chất lượng - độ trễ, để chọn cấu hình rẻ nhất đạt ngưỡng chất lượng.
+
+    cd backend
+    # Trên corpus sinh ngẫu nhiên (nhãn tự động)
+    python -m benchmarks.retrieval_sweep --num-chunks 2000 --min-recall 0.9
+    # Trên index thật (settings hiện tại) với file nhãn JSONL, mỗi dòng:
+    #   {"question": "...", "document_number": "168/2024/NĐ-CP", "article_number": "7"}
+    #   hoặc {"question": "...", "relevant": [{"document_number": "...", "article_number": "..."}, ...]}
+    python -m benchmarks.retrieval_sweep --labels data/eval/retrieval_labels.jsonl --output sweep.csv
+    # Lưới tùy chỉnh (các khóa là field của HybridRerankingRetriever, cộng "rerank")
+    python -m benchmarks.retrieval_sweep --grid '{"top_n_vector": [10, 20], "fusion": ["union", "rrf"]}'
+
+Kết quả tốt nhất áp dụng qua RETRIEVAL_TOP_N_VECTOR, RETRIEVAL_TOP_N_KEYWORD, RETRIEVAL_TOP_K_FINAL, RERANK_ENABLED...
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from sklearn.model_selection import ParameterGrid
+
+from app.core.config import settings
+from benchmarks.corpus import build_indexes, point_settings_at, synthetic_corpus
+
+DEFAULT_WORKDIR = "data/benchmarks/retrieval_sweep"
+DEFAULT_GRID = {
+    "top_n_vector": [5, 10, 15, 25],
+    "top_n_keyword": [5, 10, 15, 25],
+    "top_k_final": [3, 5, 8],
+    "rerank": [True, False],
+}
+# Tên cột trong bảng kết quả <- field của retriever
+FIELD_ALIASES = {"rerank": "rerank_enabled"}
+
+
+@dataclass
+class LabeledQuestion:
+    question: str
+    # Các cặp (số hiệu văn bản - có thể viết tắt như "168", số Điều) được coi là đúng
+    relevant: Set[Tuple[str, str]]
+
+
+def load_labels(path: str) -> List[LabeledQuestion]:
+    labeled = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            relevant = item.get("relevant") or [item]
+            pairs = {(str(r["document_number"]), str(r["article_number"])) for r in relevant}
+            if not item.get("question") or not pairs:
+                raise ValueError(f"{path}:{line_number}: cần 'question' và ít nhất một cặp (document_number, article_number)")
+            labeled.append(LabeledQuestion(question=item["question"], relevant=pairs))
+    return labeled
+
+
+def synthetic_labels(docs: List[Document], queries) -> List[LabeledQuestion]:
+    """Đổi nhãn chunk id của corpus sinh ngẫu nhiên sang cặp (văn bản, Điều)."""
+    metadata_by_id = {doc.metadata["chunk_id"]: doc.metadata for doc in docs}
+    return [
+        LabeledQuestion(
+            question=query.question,
+            relevant={
+                (metadata_by_id[chunk_id]["document_number"], str(metadata_by_id[chunk_id]["article_number"]))
+                for chunk_id in query.relevant_ids
+            },
+        )
+        for query in queries
+    ]
+
+
+def matched_pair(doc: Document, relevant: Set[Tuple[str, str]]) -> Optional[Tuple[str, str]]:
+    """Cặp nhãn mà chunk thuộc về (khớp số Điều và số hiệu văn bản chứa chuỗi nhãn), None nếu không liên quan."""
+    document_number = str(doc.metadata.get("document_number", ""))
+    article_number = str(doc.metadata.get("article_number", ""))
+    for pair in relevant:
+        if pair[1] == article_number and pair[0] in document_number:
+            return pair
+    return None
+
+
+def score_ranking(docs: Sequence[Document], relevant: Set[Tuple[str, str]]) -> Tuple[float, float]:
+    """(recall theo Điều, reciprocal rank của chunk liên quan đầu tiên) cho một danh sách kết quả."""
+    found = set()
+    reciprocal_rank = 0.0
+    for rank, doc in enumerate(docs, start=1):
+        pair = matched_pair(doc, relevant)
+        if pair is None:
+            continue
+        found.add(pair)
+        if not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+    return len(found) / len(relevant), reciprocal_rank
+
+
+def evaluate(rag, questions: List[str], labeled: List[LabeledQuestion], repeat: int) -> Dict[str, float]:
+    """
+    Chạy từng câu hỏi qua đúng bước retrieval của RAGService (bộ lọc metadata trích từ câu hỏi,
+    đường tắt tra cứu trích dẫn, rồi retriever lai ghép) với retriever hiện gán cho `rag`.
+    """
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for question, label in zip(questions, labeled):
+        where_filter = rag._build_where_filter(question)
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            docs = rag._retrieve(question, where_filter)
+            latencies.append(time.perf_counter() - started_at)
+        recall, reciprocal_rank = score_ranking(docs, label.relevant)
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {
+        "recall_at_k": float(np.mean(recalls)),
+        "hit_at_k": float(np.mean([recall > 0 for recall in recalls])),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "mean_ms": float(latencies_ms.mean()),
+    }
+
+
+def pareto_frontier(rows: List[Dict[str, Any]], quality_key: str, latency_key: str) -> List[Dict[str, Any]]:
+    """Các cấu hình không bị cấu hình khác vượt trội (chất lượng >= và độ trễ <=, hơn hẳn ở ít nhất một tiêu chí)."""
+    frontier = []
+    for row in sorted(rows, key=lambda r: (r[latency_key], -r[quality_key])):
+        if not frontier or row[quality_key] > frontier[-1][quality_key]:
+            frontier.append(row)
+    return frontier
+
+
+def configure_settings() -> None:
+    """Tắt cache và micro-batching để độ trễ đo được là chi phí thật của từng cấu hình; không cần LLM."""
+    settings.LLM_PROVIDER = "offline"
+    settings.ANSWER_CACHE_ENABLED = False
+    settings.RERANK_CACHE_SIZE = 0
+    settings.EMBEDDING_CACHE_SIZE = 0
+    settings.QUESTION_REWRITE_CACHE_SIZE = 0
+    settings.INFERENCE_BATCHING_ENABLED = False
+    settings.SPECULATIVE_RETRIEVAL_ENABLED = False
+    settings.WARMUP_QUERY = ""
+
+
+def print_table(rows: List[Dict[str, Any]], param_keys: List[str], frontier_ids: Set[int]) -> None:
+    headers = param_keys + ["recall@k", "hit@k", "MRR", "p50 ms", "p95 ms", "pareto"]
+    print("\n" + " | ".join(f"{h:>13}" for h in headers))
+    for row in rows:
+        cells = [str(row[key]) for key in param_keys] + [
+            f"{row['recall_at_k']:.3f}", f"{row['hit_at_k']:.3f}", f"{row['mrr']:.3f}",
+            f"{row['p50_ms']:.1f}", f"{row['p95_ms']:.1f}", "*" if id(row) in frontier_ids else "",
+        ]
+        print(" | ".join(f"{cell:>13}" for cell in cells))
+
+
+def write_output(path: str, rows: List[Dict[str, Any]]) -> None:
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Quét lưới tham số retrieval: chất lượng (recall@k, MRR) và độ trễ.")
+    parser.add_argument("--labels", help="File JSONL câu hỏi có nhãn (văn bản, Điều); bỏ trống = corpus sinh ngẫu nhiên.")
+    parser.add_argument("--num-chunks", type=int, default=2000, help="Kích thước corpus sinh ngẫu nhiên.")
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    parser.add_argument("--reuse-index", action="store_true", help="Dùng lại index sinh ngẫu nhiên đã build.")
+    parser.add_argument("--grid", help="Lưới tham số dạng JSON (mặc định: top_n_vector x top_n_keyword x top_k_final x rerank).")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần đo độ trễ mỗi câu hỏi cho mỗi cấu hình.")
+    parser.add_argument("--no-expand", action="store_true", help="Không mở rộng câu hỏi trước khi retrieval.")
+    parser.add_argument("--min-recall", type=float, help="Ngưỡng recall@k: in cấu hình có p95 thấp nhất đạt ngưỡng.")
+    parser.add_argument("--min-mrr", type=float, default=0.0)
+    parser.add_argument("--output", help="Ghi bảng kết quả ra file .csv hoặc .json.")
+    args = parser.parse_args()
+
+    grid = json.loads(args.grid) if args.grid else DEFAULT_GRID
+    configure_settings()
+    if args.labels:
+        labeled = load_labels(args.labels)
+    else:
+        docs, queries = synthetic_corpus(args.num_chunks, seed=args.seed, num_queries=args.num_queries)
+        labeled = synthetic_labels(docs, queries)
+        workdir = os.path.join(args.workdir, f"synthetic-{args.num_chunks}-{args.seed}")
+        if args.reuse_index and os.path.exists(os.path.join(workdir, "corpus_version.json")):
+            point_settings_at(workdir)
+        else:
+            print(f"⚙️ Building synthetic indexes for {len(docs)} chunks in '{workdir}'...")
+            build_indexes(docs, workdir)
+
+    from app.services.rag_service import RAGService, expand_query
+    rag = RAGService()
+    rag.load()
+    if not rag.is_ready:
+        print(f"❌ RAG Service failed to load: {rag.load_error}")
+        return 2
+
+    questions = [label.question if args.no_expand else expand_query(label.question) for label in labeled]
+    param_grid = list(ParameterGrid(grid))
+    print(f"🚀 Sweeping {len(param_grid)} configurations over {len(labeled)} labeled questions...")
+    rows = []
+    base_retriever = rag.retriever
+    try:
+        for i, params in enumerate(param_grid, start=1):
+            update = {FIELD_ALIASES.get(key, key): value for key, value in params.items()}
+            rag.retriever = base_retriever.model_copy(update=update)
+            # Một truy vấn làm nóng cho mỗi cấu hình (không tính vào kết quả)
+            rag._retrieve(questions[0], rag._build_where_filter(questions[0]))
+            result = evaluate(rag, questions, labeled, args.repeat)
+            rows.append({**params, **result})
+            print(f"  [{i}/{len(param_grid)}] {params}: recall@k={result['recall_at_k']:.3f} "
+                  f"MRR={result['mrr']:.3f} p95={result['p95_ms']:.1f} ms")
+    finally:
+        rag.retriever = base_retriever
+        rag.shutdown()
+
+    param_keys = sorted(grid)
+    frontier = pareto_frontier(rows, "recall_at_k", "p95_ms")
+    print_table(sorted(rows, key=lambda r: r["p95_ms"]), param_keys, {id(row) for row in frontier})
+    print("\nPareto frontier (recall@k vs p95):")
+    for row in frontier:
+        print(f"   {{{', '.join(f'{key}={row[key]}' for key in param_keys)}}} "
+              f"recall@k={row['recall_at_k']:.3f} MRR={row['mrr']:.3f} p95={row['p95_ms']:.1f} ms")
+
+    if args.min_recall is not None:
+        eligible = [row for row in rows if row["recall_at_k"] >= args.min_recall and row["mrr"] >= args.min_mrr]
+        if eligible:
+            best = min(eligible, key=lambda r: r["p95_ms"])
+            print(f"\n✅ Cheapest configuration meeting recall@k >= {args.min_recall}: "
+                  f"{ {key: best[key] for key in param_keys} } (p95 {best['p95_ms']:.1f} ms)")
+        else:
+            print(f"\n⚠️ No configuration reaches recall@k >= {args.min_recall}.")
+
+    if args.output:
+        write_output(args.output, rows)
+        print(f"Results written to '{args.output}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
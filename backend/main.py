@@ -1,9 +1,17 @@
+import logging
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.core.life_cycles import startup_event, shutdown_event
 from app.api.v1.api import api_router
+from app.api.v1.endpoints import health, metrics
+
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+)
 
 # Khởi tạo ứng dụng FastAPI
 app = FastAPI (
@@ -27,6 +35,12 @@ app.add_middleware(
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+# Health check cho orchestrator, đặt ở gốc (không qua API_V1_STR)
+app.include_router(health.router, prefix="/health", tags=["Health"])
+# Metrics Prometheus (scrape tại /metrics)
+if settings.METRICS_ENABLED:
+    metrics.register_collectors()
+    app.include_router(metrics.router, tags=["Metrics"])
 # Tạo một API route đơn giản để kiểm tra
 @app.get("/")
 def read_root():
@@ -0,0 +1,34 @@
+from app.services.answer_cache import SemanticAnswerCache
+
+
+def _cache():
+    # Mọi câu hỏi có cùng embedding: chỉ bộ lọc thực thể quyết định có trúng gần đúng hay không
+    return SemanticAnswerCache(lambda question: [1.0, 0.0], corpus_version="0123456789abcdef")
+
+
+def test_semantic_hit_requires_same_vehicle_type():
+    cache = _cache()
+    cache.store("Xe máy vượt đèn đỏ bị phạt bao nhiêu?", None, "Phạt xe máy", [])
+
+    entry, info = cache.lookup("xe máy vượt đèn đỏ thì bị phạt bao nhiêu", None)
+    assert info["cache"] == "semantic" and entry.answer == "Phạt xe máy"
+    assert cache.lookup("Ô tô vượt đèn đỏ bị phạt bao nhiêu?", None) == (None, {"cache": "miss"})
+
+
+def test_semantic_hit_requires_same_numbers():
+    cache = _cache()
+    cache.store("Ô tô chạy quá tốc độ 10 km/h bị phạt bao nhiêu?", None, "Phạt 10 km/h", [])
+
+    assert cache.lookup("Ô tô chạy quá tốc độ 20 km/h bị phạt bao nhiêu?", None)[0] is None
+    assert cache.lookup("ô tô chạy quá tốc độ 10 km/h bị phạt bao nhiêu", None)[1] == {"cache": "exact"}
+
+
+def test_reload_clears_cache_and_drops_answers_from_old_version():
+    cache = _cache()
+    cache.store("Ô tô vượt đèn đỏ bị phạt bao nhiêu?", None, "Bản cũ", [], corpus_version="0123456789abcdef")
+    cache.set_corpus_version("fedcba9876543210")
+    assert cache.lookup("Ô tô vượt đèn đỏ bị phạt bao nhiêu?", None)[0] is None
+
+    # Request bắt đầu trước khi reload: câu trả lời của index cũ không được lưu vào phiên bản mới
+    cache.store("Ô tô vượt đèn đỏ bị phạt bao nhiêu?", None, "Bản cũ", [], corpus_version="0123456789abcdef")
+    assert cache.lookup("Ô tô vượt đèn đỏ bị phạt bao nhiêu?", None)[0] is None
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from app.services.bm25_index import SparseBM25Index, bm25_tokenize
+
+CORPUS = [
+    "người điều khiển xe ô tô không chấp hành hiệu lệnh của đèn tín hiệu giao thông",
+    "người điều khiển xe mô tô xe gắn máy không đội mũ bảo hiểm",
+    "xe ô tô chạy quá tốc độ quy định từ 10 km/h đến 20 km/h",
+    "người điều khiển xe mô tô chạy quá tốc độ quy định",
+    "nồng độ cồn vượt quá 50 miligam trên 100 mililít máu",
+    "người điều khiển xe ô tô trên đường mà trong máu hoặc hơi thở có nồng độ cồn",
+    "dừng xe đỗ xe trên đường cao tốc không đúng nơi quy định",
+    "không mang theo giấy phép lái xe khi điều khiển xe mô tô",
+]
+QUERIES = [
+    "xe ô tô vượt đèn tín hiệu",
+    "xe mô tô chạy quá tốc độ",
+    "nồng độ cồn người điều khiển xe ô tô",
+    "giấy phép lái xe mô tô",
+]
+
+
+@pytest.fixture(scope="module")
+def indexes():
+    tokenized = [bm25_tokenize(text) for text in CORPUS]
+    return SparseBM25Index.from_tokenized_corpus(tokenized), BM25Okapi(tokenized)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_scores_match_bm25okapi(indexes, query):
+    sparse, okapi = indexes
+    tokens = bm25_tokenize(query)
+    np.testing.assert_allclose(sparse.get_scores(tokens), okapi.get_scores(tokens), rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_top_n_matches_bm25okapi(indexes, query):
+    sparse, okapi = indexes
+    tokens = bm25_tokenize(query)
+    n = 3
+    expected = okapi.get_top_n(tokens, CORPUS, n=n)
+    docs, scores = sparse.search(tokens, n)
+    assert [CORPUS[doc] for doc in docs] == expected
+    np.testing.assert_allclose(scores, np.sort(okapi.get_scores(tokens))[::-1][:n], rtol=1e-5)
+
+
+def test_save_load_keeps_ranking(indexes, tmp_path):
+    sparse, _ = indexes
+    sparse.save(str(tmp_path))
+    loaded = SparseBM25Index.load(str(tmp_path))
+    tokens = bm25_tokenize(QUERIES[0])
+    docs, scores = sparse.search(tokens, 5)
+    loaded_docs, loaded_scores = loaded.search(tokens, 5)
+    assert loaded_docs.tolist() == docs.tolist()
+    np.testing.assert_allclose(loaded_scores, scores)
@@ -0,0 +1,56 @@
+import numpy as np
+from langchain.schema import Document
+
+from app.services.chunk_store import ChunkStore
+
+
+def _documents():
+    # Chunk id không liên tục (như sau khi build tăng dần xóa bớt chunks), nội dung có dấu tiếng Việt
+    return [
+        Document(page_content="Điều 5. Xử phạt người điều khiển xe ô tô", metadata={
+            "chunk_id": 3, "document_number": "168/2024/NĐ-CP", "article_number": "5", "page": 1}),
+        Document(page_content="Điều 6. Xử phạt người điều khiển xe mô tô, xe gắn máy", metadata={
+            "chunk_id": 7, "document_number": "168/2024/NĐ-CP", "article_number": "6"}),
+        Document(page_content="", metadata={"chunk_id": 10, "document_number": "36/2024/QH15", "page": 4}),
+    ]
+
+
+def test_save_load_round_trip(tmp_path):
+    documents = _documents()
+    ChunkStore.from_documents(documents).save(str(tmp_path))
+    assert ChunkStore.exists(str(tmp_path))
+
+    store = ChunkStore.load(str(tmp_path))
+    assert len(store) == len(documents)
+    for row, doc in enumerate(documents):
+        assert store.get_text(row) == doc.page_content
+        loaded = store.get_document(row)
+        assert loaded.page_content == doc.page_content
+        # Trường không có trong metadata gốc không được thêm vào
+        assert loaded.metadata == doc.metadata
+    assert list(store.iter_texts()) == [doc.page_content for doc in documents]
+
+
+def test_row_of(tmp_path):
+    ChunkStore.from_documents(_documents()).save(str(tmp_path))
+    store = ChunkStore.load(str(tmp_path))
+
+    assert store.row_of(3) == 0
+    assert store.row_of(7) == 1
+    assert store.row_of(10) == 2
+    # Id không tồn tại: nằm giữa, trước và sau các id đã có
+    assert store.row_of(5) is None
+    assert store.row_of(0) is None
+    assert store.row_of(11) is None
+    assert [doc.metadata["chunk_id"] for doc in store.get_documents_by_ids([10, 5, 3])] == [10, 3]
+
+
+def test_ids_sorted_and_unique(tmp_path):
+    ChunkStore.from_documents(_documents()).save(str(tmp_path))
+    store = ChunkStore.load(str(tmp_path))
+
+    ids = np.asarray(store.ids)
+    assert ids.tolist() == [3, 7, 10]
+    # row_of dùng searchsorted nên ids phải tăng ngặt
+    assert np.all(np.diff(ids) > 0)
+    assert [store.chunk_id(row) for row in range(len(store))] == ids.tolist()